@@ -8,7 +8,9 @@ import dash_auth
 import diskcache
 from dash import DiskcacheManager
 from dash_extensions.enrich import DashProxy, ServersideOutputTransform
+from flask import Response
 
+from app.data.metrics import render_metrics
 from app.layout.layout_factory import get_layout
 
 locale.setlocale(locale.LC_ALL, "fr_FR")
@@ -30,7 +32,20 @@ dash_app = DashProxy(
 
 auth = dash_auth.BasicAuth(dash_app, auth_data)
 
-dash_app.layout = get_layout()
+# The layout is built for each page load (see the `session-id` store)
+dash_app.layout = get_layout
+
+
+def metrics() -> Response:
+    """Data layer metrics in the Prometheus text format, aggregated over all the workers."""
+    data, content_type = render_metrics()
+    return Response(data, content_type=content_type)
+
+
+# BasicAuth only protects the routes existing when it is created, the metrics require the same credentials
+dash_app.server.add_url_rule(
+    "/metrics", endpoint="metrics", view_func=auth.auth_wrapper(metrics)
+)
 
 
 # Add the @lang attribute to the root <html>
@@ -0,0 +1,295 @@
+"""
+Analysis data of an establishment, shared by the components working on all the 'bordereau' types at once.
+
+The 'bordereaux' DataFrames of all types are concatenated once per SIRET, in the data stage (`get_data_for_siret`),
+with the columns the components used to derive each on their own copy :
+- `bs_type` : 'bordereau' type of the line (categorical) ;
+- `is_incoming` / `is_outgoing` : whether the establishment is the recipient / the emitter of the 'bordereau' ;
+- `processing_operation_code` : normalized (without spaces) to match the operation codes of the ICPE mapping ;
+- `code_dep` : département of the emitter, from its postal code.
+The components only read this DataFrame : they filter it and work on the resulting copies.
+
+The annual statistics of each 'bordereau' type (`compute_bs_stats`) and the monthly aggregates feeding the time
+series figures (`create_bs_monthly_data`) are computed from this DataFrame, the components only display them.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.data.compact_dtypes import concat_bs_data, siret_equals
+from app.data.utils import BS_TYPES_MISSING_COLUMNS
+
+BS_TYPES = list(BS_TYPES_MISSING_COLUMNS)
+
+ARCHIVED_BS_STATUSES = ["PROCESSED", "REFUSED", "NO_TRACEABILITY"]
+
+# Monthly aggregates of the 'bordereaux', one line by type, direction, date column, period, status and month. Keys :
+# - direction : 'emitter' for the 'bordereaux' emitted by the establishment, 'recipient' for the received ones ;
+# - date_column : date the 'bordereaux' are grouped by month ;
+# - mask_column : analysis column selecting the 'bordereaux' of the direction ;
+# - until_now (optional) : only the 'bordereaux' dated up to now are aggregated, in lines with `until_now` True
+#   (the lines of the other specs have `until_now` False).
+BS_MONTHLY_DATA_SPECS = [
+    {"direction": "emitter", "date_column": "createdAt", "mask_column": "is_outgoing"},
+    {"direction": "emitter", "date_column": "sentAt", "mask_column": "is_outgoing"},
+    {
+        "direction": "recipient",
+        "date_column": "receivedAt",
+        "mask_column": "is_incoming",
+    },
+    {
+        "direction": "recipient",
+        "date_column": "receivedAt",
+        "mask_column": "is_incoming",
+        "until_now": True,
+    },
+]
+BS_MONTHLY_DATA_COLUMNS = [
+    "bs_type",
+    "direction",
+    "date_column",
+    "until_now",
+    "status",
+    "month",
+    "count",
+    "quantity",
+]
+
+
+def get_code_departement(postal_code: str) -> str:
+    """Take a postal code and returns the département code."""
+    if pd.isna(postal_code):
+        return np.nan
+    if 20000 <= int(postal_code) < 21000:
+        if int(postal_code) <= 20190:
+            return "2A"
+        else:
+            return "2B"
+    if int(postal_code) > 97000:
+        return postal_code[:3]
+
+    return postal_code[:2]
+
+
+def _map_distinct_values(serie: pd.Series, function: Callable) -> pd.Series:
+    """Applies the function to the distinct non-missing values of the serie only, categoricals stay categorical."""
+
+    codes, uniques = pd.factorize(serie)
+    # The last value is the one of the missing values (factorized as -1)
+    mapped_uniques = np.array([*(function(e) for e in uniques), np.nan], dtype=object)
+    mapped = pd.Series(mapped_uniques[codes], index=serie.index, name=serie.name)
+
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        mapped = mapped.astype("category")
+    return mapped
+
+
+def create_bs_analysis_data(
+    siret: str, bs_data_dfs: Dict[str, Optional[pd.DataFrame]]
+) -> Optional[pd.DataFrame]:
+    """Builds the analysis data of the establishment from its preprocessed 'bordereaux' data.
+
+    Parameters
+    ----------
+    siret : str
+        SIRET of the establishment.
+    bs_data_dfs : dict
+        Dict with keys being the 'bordereau' types (BSDD, BSDA, BSFF, BSDASRI and BSVHU)
+        and values their preprocessed DataFrame (None if there is no data for this type).
+
+    Returns
+    -------
+    DataFrame
+        'bordereaux' data of all types with the analysis columns, None if there is no 'bordereaux' data.
+    """
+
+    dfs = {
+        bs_type: df
+        for bs_type, df in bs_data_dfs.items()
+        if df is not None and len(df) > 0
+    }
+    if len(dfs) == 0:
+        return None
+
+    df = concat_bs_data(dfs.values())
+    df.index = pd.RangeIndex(len(df))
+
+    df["bs_type"] = pd.Categorical.from_codes(
+        np.repeat(
+            [BS_TYPES.index(bs_type) for bs_type in dfs],
+            [len(e) for e in dfs.values()],
+        ),
+        categories=BS_TYPES,
+    )
+    if "emitterCompanySiret" in df.columns:
+        df["is_outgoing"] = siret_equals(df["emitterCompanySiret"], siret).to_numpy()
+    if "recipientCompanySiret" in df.columns:
+        df["is_incoming"] = siret_equals(df["recipientCompanySiret"], siret).to_numpy()
+    if "processing_operation_code" in df.columns:
+        df["processing_operation_code"] = _map_distinct_values(
+            df["processing_operation_code"], lambda e: e.replace(" ", "")
+        )
+    if "emitterCompanyPostalCode" in df.columns:
+        df["code_dep"] = _map_distinct_values(
+            df["emitterCompanyPostalCode"], get_code_departement
+        )
+
+    return df
+
+
+def compute_bs_stats(
+    bs_analysis_data: Optional[pd.DataFrame],
+    bs_revised_data: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    """Computes the annual statistics of all the 'bordereau' types in a single grouped pass.
+
+    Parameters
+    ----------
+    bs_analysis_data : DataFrame
+        Analysis data of the establishment (see `create_bs_analysis_data`), None if there is no 'bordereaux' data.
+    bs_revised_data : DataFrame
+        Accepted revision requests of all 'bordereau' types, with a `bs_type` column (`get_bs_revised_data` query).
+
+    Returns
+    -------
+    DataFrame
+        One line per 'bordereau' type with data, with the columns :
+        - emitted_bs_count, archived_bs_count, revised_bs_count : 'bordereaux' counts ;
+        - more_than_one_month_bs_count : count of received 'bordereaux' processed more than one month after reception ;
+        - total_incoming_weight, total_outgoing_weight : tonnage received / sent over the last year ;
+        - theorical_stock : estimation of the onsite stock (0 without outgoing tonnage) ;
+        - fraction_outgoing : outgoing tonnage as a percentage of the incoming tonnage (NaN without incoming tonnage).
+    """
+
+    if bs_analysis_data is None:
+        return pd.DataFrame()
+
+    one_year_ago = (
+        datetime.utcnow().replace(tzinfo=timezone.utc) - timedelta(days=365)
+    ).strftime("%Y-%m-01")
+
+    df = bs_analysis_data
+    is_outgoing = df["is_outgoing"].to_numpy()
+    is_incoming = df["is_incoming"].to_numpy()
+    # Missing quantities count as 0 in the sums
+    quantity = np.nan_to_num(
+        df["quantityReceived"].to_numpy(dtype=float, na_value=np.nan)
+    )
+
+    indicators = {
+        "emitted_bs_count": is_outgoing,
+        "archived_bs_count": is_outgoing
+        & df["status"].isin(ARCHIVED_BS_STATUSES).to_numpy(),
+        "more_than_one_month_bs_count": is_incoming
+        & ((df["processedAt"] - df["receivedAt"]) > np.timedelta64(1, "M")).to_numpy(),
+        "total_incoming_weight": np.where(
+            is_incoming & (df["receivedAt"] >= one_year_ago).to_numpy(), quantity, 0
+        ),
+        "total_outgoing_weight": np.where(
+            is_outgoing & (df["sentAt"] >= one_year_ago).to_numpy(), quantity, 0
+        ),
+    }
+
+    # All the indicators are summed by 'bordereau' type on the codes of the categorical `bs_type`
+    bs_types_codes = df["bs_type"].cat.codes.to_numpy()
+    n_bs_types = len(df["bs_type"].cat.categories)
+    stats = pd.DataFrame(
+        {
+            name: np.bincount(bs_types_codes, weights=values, minlength=n_bs_types)
+            for name, values in indicators.items()
+        },
+        index=pd.Index(df["bs_type"].cat.categories, name="bs_type"),
+    )
+    stats = stats[np.bincount(bs_types_codes, minlength=n_bs_types) > 0]
+
+    counts_columns = [
+        "emitted_bs_count",
+        "archived_bs_count",
+        "more_than_one_month_bs_count",
+    ]
+    stats[counts_columns] = stats[counts_columns].astype(int)
+
+    revised_bs_count = pd.Series(dtype=int)
+    if bs_revised_data is not None and len(bs_revised_data) > 0:
+        revised_bs_count = bs_revised_data.groupby("bs_type")["bsId"].nunique()
+    stats["revised_bs_count"] = revised_bs_count.reindex(
+        stats.index, fill_value=0
+    ).astype(int)
+
+    incoming, outgoing = stats["total_incoming_weight"], stats["total_outgoing_weight"]
+    stats["theorical_stock"] = (incoming - outgoing).where(outgoing != 0, 0)
+    stats["fraction_outgoing"] = [
+        int(round(outgoing_weight / incoming_weight, 2) * 100)
+        if incoming_weight != 0
+        else np.nan
+        for incoming_weight, outgoing_weight in zip(incoming, outgoing)
+    ]
+
+    return stats
+
+
+def create_bs_monthly_data(bs_analysis_data: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Aggregates the 'bordereaux' by type, direction, status and month.
+
+    The result is small (at most one line by type, direction, status and month) and is sliced by
+    `app.layout.components.utils.get_monthly_serie` to build the monthly series of the figures.
+
+    Parameters
+    ----------
+    bs_analysis_data : DataFrame
+        Analysis data of the establishment (see `create_bs_analysis_data`), None if there is no 'bordereaux' data.
+
+    Returns
+    -------
+    DataFrame
+        Monthly aggregates with the columns of `BS_MONTHLY_DATA_COLUMNS` : `count` is the number of 'bordereaux'
+        and `quantity` the sum of their received quantities, `until_now` is True for the lines of the specs
+        leaving out the 'bordereaux' dated after now. Months are the first day of the month, in UTC.
+    """
+
+    if bs_analysis_data is None:
+        return pd.DataFrame(columns=BS_MONTHLY_DATA_COLUMNS)
+
+    df = bs_analysis_data
+    quantity = df["quantityReceived"].to_numpy(dtype=float, na_value=np.nan)
+    now = np.datetime64(datetime.utcnow())
+
+    aggregates = []
+    for spec in BS_MONTHLY_DATA_SPECS:
+        # Naive UTC dates
+        dates = df[spec["date_column"]].dt.tz_convert(None).to_numpy()
+        mask = df[spec["mask_column"]].to_numpy() & ~np.isnat(dates)
+        if spec.get("until_now"):
+            mask &= dates <= now
+        dates = dates[mask]
+
+        aggregate = (
+            pd.DataFrame(
+                {
+                    "bs_type": df["bs_type"].values[mask],
+                    "status": df["status"].values[mask],
+                    # Months since epoch, converted to dates once aggregated
+                    "month": dates.astype("datetime64[M]").astype(np.int64),
+                    "quantity": quantity[mask],
+                }
+            )
+            .groupby(["bs_type", "status", "month"], observed=True, dropna=False)
+            .agg(count=("quantity", "size"), quantity=("quantity", "sum"))
+            .reset_index()
+        )
+        aggregate["direction"] = spec["direction"]
+        aggregate["date_column"] = spec["date_column"]
+        aggregate["until_now"] = spec.get("until_now", False)
+        aggregates.append(aggregate)
+
+    monthly_data = pd.concat(aggregates, ignore_index=True)
+    monthly_data["bs_type"] = monthly_data["bs_type"].astype(object)
+    monthly_data["status"] = monthly_data["status"].astype(object)
+    monthly_data["month"] = pd.to_datetime(
+        monthly_data["month"].to_numpy(dtype=np.int64).astype("datetime64[M]"),
+        utc=True,
+    )
+
+    return monthly_data[BS_MONTHLY_DATA_COLUMNS]
@@ -0,0 +1,253 @@
+"""
+Arrow-native fetch backend for `make_query`.
+
+With PostgreSQL, the query result is exported with `COPY (...) TO STDOUT` in CSV format and parsed
+by the multithreaded Arrow CSV reader, instead of being materialized as Python tuples by psycopg2.
+The Arrow table is then converted to pandas with as few copies as possible.
+Other databases (SQLite stand-in) go through the DBAPI cursor and are converted column by column.
+
+The resulting DataFrame is interchangeable with the one returned by `pd.read_sql_query`:
+the same `dtypes` and `date_columns` conversions are applied.
+The CSV columns are not typed by inference (which would read postal codes or SIRETs as numbers) but from
+the PostgreSQL types of the result : text columns stay strings, whatever their values.
+Time-zone aware values forced to `str` keep the PostgreSQL text format (e.g. `2022-01-01 10:00:00+00`),
+which is parsed to the same dates.
+Timestamps are read with a microsecond unit, like psycopg2 does : the columns with dates out of the range
+handled by pandas are converted to `datetime` objects instead of overflowing.
+
+pyarrow is an optional dependency, only imported when this backend is used.
+"""
+import io
+from typing import Any, Dict, List
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# Text representation of booleans in PostgreSQL CSV exports
+POSTGRES_TRUE_VALUES = ["t", "true", "True"]
+POSTGRES_FALSE_VALUES = ["f", "false", "False"]
+
+# Arrow types of the PostgreSQL types (pg_type OIDs) that are not read as strings
+# (bool, int8, int2, int4, float4, float8, numeric, date, timestamp, timestamptz)
+POSTGRES_OID_TYPES = {
+    16: "bool",
+    20: "int64",
+    21: "int64",
+    23: "int64",
+    700: "float64",
+    701: "float64",
+    1700: "float64",
+    1082: "date32",
+    1114: "timestamp",
+    1184: "timestamptz",
+}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.csv
+    except ImportError as e:
+        raise ImportError(
+            "pyarrow is required by the 'arrow' fetch backend (QUERY_FETCH_BACKEND=arrow)"
+        ) from e
+
+    return pyarrow
+
+
+def _get_arrow_types(dtypes: Dict[str, Any]) -> Dict[str, Any]:
+    """Arrow types of the columns with a pandas dtype (only for types Arrow can parse directly)."""
+    pa = _import_pyarrow()
+
+    pandas_to_arrow = {
+        str: pa.string(),
+        "str": pa.string(),
+        object: pa.string(),
+        float: pa.float64(),
+        "float64": pa.float64(),
+        int: pa.int64(),
+        "int64": pa.int64(),
+        bool: pa.bool_(),
+    }
+
+    return {
+        column: pandas_to_arrow[dtype]
+        for column, dtype in (dtypes or {}).items()
+        if dtype in pandas_to_arrow
+    }
+
+
+def _get_postgres_arrow_types(description) -> Dict[str, Any]:
+    """Arrow types of the columns of a PostgreSQL result, from the type OIDs of the cursor description.
+
+    Text, enums, arrays and all the other types are read as strings, like psycopg2 returns them.
+    """
+    pa = _import_pyarrow()
+
+    arrow_types = {
+        "bool": pa.bool_(),
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "date32": pa.date32(),
+        "timestamp": pa.timestamp("us"),
+        "timestamptz": pa.timestamp("us", tz="UTC"),
+    }
+
+    return {
+        column.name: arrow_types.get(
+            POSTGRES_OID_TYPES.get(column.type_code), pa.string()
+        )
+        for column in description
+    }
+
+
+def _fetch_postgres_copy(
+    connection: Connection,
+    sql_query_str: str,
+    query_params: Dict[str, Any],
+    dtypes: Dict[str, Any],
+):
+    """Run the query through `COPY ... TO STDOUT` and parse the CSV export with Arrow."""
+    pa = _import_pyarrow()
+
+    # COPY does not accept bind parameters : the driver renders them client-side
+    compiled = text(sql_query_str).compile(dialect=connection.dialect)
+    dbapi_connection = connection.connection
+    with dbapi_connection.cursor() as cursor:
+        sql_query = cursor.mogrify(
+            str(compiled), compiled.construct_params(query_params)
+        ).decode()
+        sql_query = sql_query.strip().rstrip(";")
+
+        # Types of the result columns, the query is only planned
+        cursor.execute(f"select * from ({sql_query}) as typed limit 0")
+        column_types = {
+            **_get_postgres_arrow_types(cursor.description),
+            **_get_arrow_types(dtypes),
+        }
+
+        buffer = io.BytesIO()
+        cursor.copy_expert(
+            f"COPY ({sql_query}) TO STDOUT WITH (FORMAT csv, HEADER true)", buffer
+        )
+
+    convert_options = pa.csv.ConvertOptions(
+        column_types=column_types,
+        true_values=POSTGRES_TRUE_VALUES,
+        false_values=POSTGRES_FALSE_VALUES,
+        # NULL is exported as an unquoted empty field, empty strings are quoted
+        null_values=[""],
+        strings_can_be_null=True,
+        quoted_strings_can_be_null=False,
+    )
+
+    buffer.seek(0)
+    return pa.csv.read_csv(buffer, convert_options=convert_options)
+
+
+def _fetch_dbapi(
+    connection: Connection,
+    sql_query_str: str,
+    query_params: Dict[str, Any],
+    dtypes: Dict[str, Any],
+):
+    """Run the query with the DBAPI cursor and build the Arrow table column by column."""
+    pa = _import_pyarrow()
+
+    result = connection.execute(text(sql_query_str), query_params)
+    columns = list(result.keys())
+    rows = result.fetchall()
+    arrow_types = _get_arrow_types(dtypes)
+
+    values_by_column = list(zip(*rows)) if rows else [[] for _ in columns]
+
+    arrays = []
+    for column, values in zip(columns, values_by_column):
+        arrow_type = arrow_types.get(column)
+        try:
+            array = pa.array(values, type=arrow_type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Values of another type than the requested one (e.g. dates forced to `str`)
+            values = [None if value is None else str(value) for value in values]
+            array = pa.array(values, type=arrow_type)
+        arrays.append(array)
+
+    return pa.Table.from_arrays(arrays, names=columns)
+
+
+def _is_out_of_pandas_range(column) -> bool:
+    """Whether a timestamp column has dates out of the range of pandas (nanosecond) timestamps."""
+    pa = _import_pyarrow()
+
+    if column.type.unit == "ns":
+        return False
+
+    ns_per_unit = {"s": 10**9, "ms": 10**6, "us": 10**3}[column.type.unit]
+    min_max = pa.compute.min_max(column.cast(pa.int64()))
+    if not min_max["min"].is_valid:
+        return False
+
+    return (
+        min_max["min"].as_py() < -(-pd.Timestamp.min.value // ns_per_unit)
+        or min_max["max"].as_py() > pd.Timestamp.max.value // ns_per_unit
+    )
+
+
+def read_sql_query_arrow(
+    connection: Connection,
+    sql_query_str: str,
+    query_params: Dict[str, Any],
+    date_columns: List[str] = None,
+    dtypes: Dict[str, Any] = None,
+) -> pd.DataFrame:
+    """Equivalent of `pd.read_sql_query` going through Arrow record batches.
+
+    Parameters
+    ----------
+    connection : Connection
+        SQLAlchemy connection.
+    sql_query_str : str
+        SQL query with named bind parameters (`:param_name`).
+    query_params: dict
+        Values of the bind parameters.
+    date_columns : list of str
+        Names of columns to parse as dates (time-zone aware dates are casted to UTC).
+    dtypes: dict
+        Dict mapping column name to corresponding dtype.
+
+    Returns
+    -------
+    DataFrame
+        DataFrame with the result of the query.
+    """
+
+    if connection.dialect.name == "postgresql":
+        table = _fetch_postgres_copy(connection, sql_query_str, query_params, dtypes)
+    else:
+        table = _fetch_dbapi(connection, sql_query_str, query_params, dtypes)
+
+    pa = _import_pyarrow()
+    out_of_range_columns = {
+        name: table.column(name).to_pandas(timestamp_as_object=True)
+        for name, field in zip(table.column_names, table.schema)
+        if pa.types.is_timestamp(field.type)
+        and _is_out_of_pandas_range(table.column(name))
+    }
+    columns = table.column_names
+    table = table.drop(list(out_of_range_columns))
+
+    # Each column gets its own block, and Arrow buffers are released as soon as they are converted
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    del table
+    if out_of_range_columns:
+        df = df.assign(**out_of_range_columns)[columns]
+
+    if dtypes:
+        df = df.astype(dtypes)
+
+    for column in date_columns or []:
+        df[column] = pd.to_datetime(df[column], errors="coerce", utc=True)
+
+    return df
@@ -0,0 +1,235 @@
+"""
+Optional cache of `make_query` results, keyed by SQL template name, engine and query parameters.
+
+Each template has its own time to live (company and ICPE data change much less often than 'bordereaux').
+Two backends are available :
+- an in-memory LRU cache, local to each worker process ;
+- a disk cache (diskcache) in a sub-directory of the application cache directory, shared by all workers.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+import diskcache
+import pandas as pd
+
+from app.data.metrics import QUERY_CACHE_HITS, QUERY_CACHE_MISSES
+
+# "memory", "disk" or empty to disable the cache
+QUERY_CACHE_BACKEND = os.getenv("QUERY_CACHE_BACKEND", "")
+# Maximum number of query results kept by the memory backend
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "256"))
+# Maximum size (in bytes) of the disk backend
+QUERY_CACHE_SIZE_LIMIT = int(os.getenv("QUERY_CACHE_SIZE_LIMIT", str(2**30)))
+QUERY_CACHE_DIRECTORY = Path(os.getenv("QUERY_CACHE_DIRECTORY", "./cache/queries"))
+QUERY_CACHE_DEFAULT_TTL = int(os.getenv("QUERY_CACHE_DEFAULT_TTL", "300"))
+
+# Time to live (in seconds) of the results of each SQL template,
+# can be overridden with a JSON object in the QUERY_CACHE_TTLS environment variable
+QUERY_CACHE_TTLS = {
+    "get_company_data": 3600,
+    "get_receipts_agreements_data": 3600,
+    "get_bs_revised_data": 3600,
+    "get_icpe_data": 24 * 3600,
+    **json.loads(os.getenv("QUERY_CACHE_TTLS", "{}")),
+}
+
+# Metrics counting the hits and misses (see `app.data.metrics`)
+QUERY_CACHE_METRICS = {"hits": QUERY_CACHE_HITS, "misses": QUERY_CACHE_MISSES}
+
+_MISSING = object()
+
+
+class MemoryCacheBackend:
+    """Thread-safe in-memory cache with a time to live per entry and LRU eviction.
+
+    Parameters
+    ----------
+    max_entries: int
+        Maximum number of entries, the least recently used entry is evicted when this number is exceeded.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns a copy of the value of the key, `default` if it is missing or expired."""
+
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+
+        # Copy so that callers can't alter the cached DataFrame
+        return value.copy()
+
+    def set(self, key: Hashable, value: pd.DataFrame, ttl: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value.copy())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class DiskCacheBackend:
+    """Cache stored on disk with diskcache, shared between processes, with LRU eviction.
+
+    Parameters
+    ----------
+    directory: Path
+        Directory of the cache.
+    size_limit: int
+        Maximum size of the cache in bytes, least recently used entries are evicted beyond this limit.
+    """
+
+    def __init__(self, directory: Path, size_limit: int) -> None:
+        self.cache = diskcache.Cache(
+            str(directory),
+            size_limit=size_limit,
+            eviction_policy="least-recently-used",
+        )
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the value of the key, `default` if it is missing or expired."""
+        return self.cache.get(key, default=default, retry=True)
+
+    def set(self, key: Hashable, value: pd.DataFrame, ttl: int) -> None:
+        self.cache.set(key, value, expire=ttl, retry=True)
+
+    def clear(self) -> None:
+        self.cache.clear(retry=True)
+
+
+class QueryCache:
+    """Cache of query results with a time to live per SQL template and hits/misses statistics.
+
+    Parameters
+    ----------
+    backend: MemoryCacheBackend or DiskCacheBackend
+        Storage of the cached results.
+    ttls: dict
+        Time to live (in seconds) by SQL template name.
+    default_ttl: int
+        Time to live (in seconds) of the templates absent from `ttls`.
+    """
+
+    def __init__(self, backend, ttls: Dict[str, int], default_ttl: int) -> None:
+        self.backend = backend
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(sql_query_name: str, engine: str, **query_args) -> Tuple[str, ...]:
+        """Build the cache key from the template name, the engine and all the other arguments
+        of the query (bind parameters, dtypes, date columns...)."""
+        return (
+            sql_query_name,
+            engine,
+            json.dumps(query_args, sort_keys=True, default=repr),
+        )
+
+    def _record(self, sql_query_name: str, stat: str) -> None:
+        with self._lock:
+            template_stats = self._stats.setdefault(
+                sql_query_name, {"hits": 0, "misses": 0}
+            )
+            template_stats[stat] += 1
+        QUERY_CACHE_METRICS[stat].labels(template=sql_query_name).inc()
+
+    def get_or_compute(
+        self,
+        sql_query_name: str,
+        engine: str,
+        compute: Callable[[], pd.DataFrame],
+        **query_args,
+    ) -> pd.DataFrame:
+        """Returns the cached result of the query if there is a valid one, else computes, caches and returns it.
+
+        Parameters
+        ----------
+        sql_query_name : str
+            Name of the SQL template.
+        engine : str
+            Name of the engine the query runs on.
+        compute: callable
+            Function without arguments that runs the query and returns its result.
+        query_args: kwargs
+            All the other arguments that change the result of the query.
+
+        Returns
+        -------
+        DataFrame
+            The result of the query.
+        """
+
+        key = self.make_key(sql_query_name, engine, **query_args)
+        ttl = self.ttls.get(sql_query_name, self.default_ttl)
+
+        if ttl > 0:
+            df = self.backend.get(key)
+            if df is not None:
+                self._record(sql_query_name, "hits")
+                return df
+
+        self._record(sql_query_name, "misses")
+        df = compute()
+        if ttl > 0:
+            self.backend.set(key, df, ttl)
+
+        return df
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """Returns the number of hits and misses by SQL template."""
+        with self._lock:
+            return {k: dict(v) for k, v in self._stats.items()}
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+
+def create_query_cache(backend_name: str) -> QueryCache:
+    """Create the query cache with the given backend, using the module configuration.
+
+    Parameters
+    ----------
+    backend_name : str
+        "memory", "disk", or an empty string to disable the cache.
+
+    Returns
+    -------
+    QueryCache
+        The query cache, or None if the cache is disabled.
+    """
+
+    if not backend_name:
+        return None
+
+    if backend_name == "memory":
+        backend = MemoryCacheBackend(QUERY_CACHE_MAX_ENTRIES)
+    elif backend_name == "disk":
+        backend = DiskCacheBackend(QUERY_CACHE_DIRECTORY, QUERY_CACHE_SIZE_LIMIT)
+    else:
+        raise ValueError("QUERY_CACHE_BACKEND must be either 'memory', 'disk' or empty")
+
+    return QueryCache(backend, QUERY_CACHE_TTLS, QUERY_CACHE_DEFAULT_TTL)
@@ -0,0 +1,210 @@
+"""
+Cancellation of the SQL queries of superseded fiche requests.
+
+The queries made for a fiche request run within a scope identified by the browser session (tab) and the request.
+When a new request starts for the same session (new click on "Générer", other SIRET), the previous one is superseded :
+- its running PostgreSQL queries are cancelled server-side with `pg_cancel_backend` ;
+- its next queries are not run, `make_query` raises `QueryCancelledError` instead.
+
+Requests of the same session may be handled by different worker processes, so the current request of each session
+and the backend PIDs of the running queries of each request are kept in a disk cache shared by all the workers.
+Without PostgreSQL (no backend PID), running queries are not cancelled, only the next ones.
+"""
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import diskcache
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+QUERY_CANCELLATION_DIRECTORY = Path(
+    os.getenv("QUERY_CANCELLATION_DIRECTORY", "./cache/cancellation")
+)
+# Time (in seconds) the current request of a session is remembered
+QUERY_CANCELLATION_TTL = 3600
+# Time (in seconds) after which the lock held while cancelling the queries of a request is released,
+# if its worker died meanwhile (beyond the connection pool timeout)
+QUERY_CANCELLATION_LOCK_TTL = 60
+
+logger = logging.getLogger()
+
+# (session id, request token) of the request the current queries belong to
+_current_scope: ContextVar[Optional[Tuple[str, str]]] = ContextVar(
+    "query_cancellation_scope", default=None
+)
+
+
+class QueryCancelledError(Exception):
+    """Raised when a query belongs to a request that has been superseded by a newer request of the same session."""
+
+
+def _get_backend_pid(connection: Connection) -> Optional[int]:
+    if connection.dialect.name != "postgresql":
+        return None
+    return connection.connection.get_backend_pid()
+
+
+class QueryCancellation:
+    """Registry of the current request of each session and of its running queries.
+
+    Parameters
+    ----------
+    directory: Path
+        Directory of the disk cache shared by the workers.
+    engines: dict
+        Engines the queries run on, by name, used to cancel the queries.
+    """
+
+    def __init__(self, directory: Path, engines: Dict[str, Engine]) -> None:
+        self.directory = directory
+        self.engines = engines
+        self._cache: Optional[diskcache.Cache] = None
+        self._cache_lock = threading.Lock()
+
+    @property
+    def cache(self) -> diskcache.Cache:
+        """Disk cache shared by the workers, opened at the first request scope or tracked query,
+        so that importing `data_extract` (CLIs, benchmarks) creates no file."""
+
+        if self._cache is None:
+            with self._cache_lock:
+                if self._cache is None:
+                    self._cache = diskcache.Cache(str(self.directory))
+        return self._cache
+
+    def _cancel_queries(self, queries: List[Tuple[str, int]]) -> None:
+        """Cancels the queries given as (engine name, backend PID)."""
+
+        pids_by_engine = {}
+        for engine_name, pid in queries:
+            pids_by_engine.setdefault(engine_name, []).append(pid)
+
+        for engine_name, pids in pids_by_engine.items():
+            try:
+                with self.engines[engine_name].connect() as connection:
+                    connection.execute(
+                        text("select pg_cancel_backend(pid) from unnest(:pids) as pid"),
+                        {"pids": pids},
+                    )
+                logger.info(
+                    "Cancelled superseded queries on %s : %s", engine_name, pids
+                )
+            except Exception:
+                logger.exception("Failed to cancel queries on %s", engine_name)
+
+    def _cancel_request_queries(self, token: str) -> None:
+        """Cancels the running queries of a superseded request.
+
+        The registered queries are read, and cancelled, while holding the lock of the request : a query
+        can't be unregistered meanwhile, so its PID is never cancelled after its connection has been
+        given back to the pool (where it could run the statement of another request).
+        """
+
+        with diskcache.Lock(
+            self.cache, ("cancel", token), expire=QUERY_CANCELLATION_LOCK_TTL
+        ):
+            queries = self.cache.pop(("request", token), retry=True)
+            if queries:
+                self._cancel_queries(queries)
+
+    @contextmanager
+    def request_scope(self, session_id: str) -> Iterator[None]:
+        """Makes the enclosed code the current request of the session, superseding the previous one.
+
+        Parameters
+        ----------
+        session_id : str
+            Identifier of the browser session.
+        """
+
+        token = uuid.uuid4().hex
+
+        # The transaction (a write lock shared by all the workers) only swaps the current request,
+        # the queries of the previous one are cancelled after it is committed
+        with self.cache.transact(retry=True):
+            previous_token = self.cache.get(("session", session_id), retry=True)
+            self.cache.set(
+                ("session", session_id),
+                token,
+                expire=QUERY_CANCELLATION_TTL,
+                retry=True,
+            )
+            self.cache.set(
+                ("request", token), [], expire=QUERY_CANCELLATION_TTL, retry=True
+            )
+
+        if previous_token is not None:
+            self._cancel_request_queries(previous_token)
+
+        scope_token = _current_scope.set((session_id, token))
+        try:
+            yield
+        finally:
+            _current_scope.reset(scope_token)
+
+    def is_cancelled(self) -> bool:
+        """Returns True if the current request has been superseded (False outside of a request scope)."""
+
+        scope = _current_scope.get()
+        if scope is None:
+            return False
+
+        session_id, token = scope
+        return self.cache.get(("session", session_id), retry=True) != token
+
+    @contextmanager
+    def track(self, connection: Connection, engine_name: str) -> Iterator[None]:
+        """Registers the query run on the connection in the current request, so that it can be cancelled.
+
+        Raises
+        ------
+        QueryCancelledError
+            If the current request has been superseded, before or during the query.
+        """
+
+        scope = _current_scope.get()
+        if scope is None:
+            yield
+            return
+
+        session_id, token = scope
+        key = ("request", token)
+        query = (engine_name, _get_backend_pid(connection))
+
+        # The query is registered in the same transaction as the check that the request is still current :
+        # if it is superseded afterwards, the query is cancelled
+        with self.cache.transact(retry=True):
+            if self.cache.get(("session", session_id), retry=True) != token:
+                raise QueryCancelledError(f"Request of session {session_id} superseded")
+            if query[1] is not None:
+                queries = self.cache.get(key, default=[], retry=True)
+                self.cache.set(
+                    key, [*queries, query], expire=QUERY_CANCELLATION_TTL, retry=True
+                )
+
+        try:
+            yield
+        except Exception as e:
+            if self.is_cancelled():
+                raise QueryCancelledError(
+                    f"Request of session {session_id} superseded"
+                ) from e
+            raise
+        finally:
+            if query[1] is not None:
+                # Waits for a cancellation of the request in progress, before the connection is released
+                with diskcache.Lock(
+                    self.cache, ("cancel", token), expire=QUERY_CANCELLATION_LOCK_TTL
+                ), self.cache.transact(retry=True):
+                    queries = self.cache.get(key, retry=True)
+                    if queries is not None and query in queries:
+                        queries.remove(query)
+                        self.cache.set(
+                            key, queries, expire=QUERY_CANCELLATION_TTL, retry=True
+                        )
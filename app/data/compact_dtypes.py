@@ -0,0 +1,170 @@
+"""
+Compact dtypes of the preprocessed 'bordereaux' DataFrames.
+
+The 'bordereaux' data is kept in memory (serverside store, incremental store) and filtered on the SIRET
+of the establishment many times by the components. With BS_COMPACT_DTYPES, the 'bordereaux' DataFrames
+are converted right after the query and the outliers separation (see `BSDataPreprocessor`) :
+- low-cardinality columns (status, waste code, transport mode, operation code, postal code, address) become categoricals ;
+- free text (ids) uses Arrow-backed strings, or pandas strings if pyarrow is not installed ;
+- SIRETs are encoded as int64, missing and malformed SIRETs as `INVALID_SIRET_CODE`,
+  so that comparing them to the SIRET of the establishment is an integer comparison.
+
+The components work on both the raw and the compact forms : they compare SIRETs with `siret_equals`,
+concatenate 'bordereaux' DataFrames with `concat_bs_data`, which keeps the categoricals,
+and group by categorical columns with `observed=True`.
+"""
+import re
+from functools import reduce
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_integer_dtype
+
+# Columns with few distinct values, stored as categoricals
+BS_CATEGORICAL_COLUMNS = [
+    "status",
+    "wasteCode",
+    "transporterTransportMode",
+    "processing_operation_code",
+    "emitterCompanyPostalCode",
+    # The addresses are the ones of the few partners of the establishment
+    "emitterCompanyAddress",
+]
+# Free text columns, stored as Arrow-backed strings
+BS_TEXT_COLUMNS = ["id"]
+# SIRET columns, stored as int64
+BS_SIRET_COLUMNS = ["emitterCompanySiret", "recipientCompanySiret"]
+
+# Code of the missing and malformed SIRETs, which never equal a valid SIRET
+INVALID_SIRET_CODE = -1
+SIRET_PATTERN = re.compile(r"\d{14}")
+
+
+def _get_text_dtype() -> pd.StringDtype:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return pd.StringDtype("python")
+
+    return pd.StringDtype("pyarrow")
+
+
+TEXT_DTYPE = _get_text_dtype()
+
+
+def encode_siret(siret: str) -> int:
+    """Returns the int64 code of a SIRET, `INVALID_SIRET_CODE` if it is not a 14 digits string."""
+
+    if not isinstance(siret, str) or not SIRET_PATTERN.fullmatch(siret):
+        return INVALID_SIRET_CODE
+    return int(siret)
+
+
+def encode_sirets(sirets: pd.Series) -> pd.Series:
+    """Encodes a column of SIRETs as int64 (see `encode_siret`), already encoded columns are returned as is.
+
+    The SIRETs of a 'bordereaux' column are mostly the same few ones, so only the distinct values are parsed.
+    """
+
+    if is_integer_dtype(sirets.dtype):
+        return sirets
+
+    codes, uniques = pd.factorize(sirets)
+    # The last code is the one of the missing values (factorized as -1)
+    encoded_uniques = np.array(
+        [*(encode_siret(e) for e in uniques), INVALID_SIRET_CODE], dtype="int64"
+    )
+
+    return pd.Series(encoded_uniques[codes], index=sirets.index, name=sirets.name)
+
+
+def siret_equals(sirets: pd.Series, siret: str) -> pd.Series:
+    """Returns the mask of the lines of a SIRET column equal to the given SIRET,
+    whether the column is encoded (compact form) or not.
+
+    Parameters
+    ----------
+    sirets : Series
+        SIRET column of 'bordereaux' data.
+    siret : str
+        SIRET of the establishment.
+
+    Returns
+    -------
+    Series
+        Boolean Series with the same index as `sirets`.
+    """
+
+    if not is_integer_dtype(sirets.dtype):
+        return sirets == siret
+
+    code = encode_siret(siret)
+    if code == INVALID_SIRET_CODE:
+        return pd.Series(False, index=sirets.index)
+    return sirets == code
+
+
+def compact_bs_data(df: pd.DataFrame) -> pd.DataFrame:
+    """Converts the columns of 'bordereaux' data to their compact dtypes, the other columns are kept as is.
+
+    Parameters
+    ----------
+    df : DataFrame
+        'bordereaux' data, with raw or compact dtypes.
+
+    Returns
+    -------
+    DataFrame
+        New DataFrame with compact dtypes.
+    """
+
+    dtypes = {}
+    for column in df.columns:
+        if column in BS_CATEGORICAL_COLUMNS:
+            dtypes[column] = "category"
+        elif column in BS_TEXT_COLUMNS:
+            dtypes[column] = TEXT_DTYPE
+    df = df.astype(dtypes)
+
+    for column in BS_SIRET_COLUMNS:
+        if column in df.columns:
+            df[column] = encode_sirets(df[column])
+
+    return df
+
+
+def concat_bs_data(dfs: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenates 'bordereaux' DataFrames like `pd.concat`, keeping the categorical columns categorical.
+
+    `pd.concat` falls back to object for categorical columns with different categories,
+    so the categories of each categorical column are unioned before the concatenation.
+    """
+
+    dfs = list(dfs)
+    if len(dfs) < 2:
+        return pd.concat(dfs)
+
+    union_dtypes = {}
+    for column, dtype in dfs[0].dtypes.items():
+        if not isinstance(dtype, pd.CategoricalDtype):
+            continue
+        column_dtypes = [df.dtypes.get(column) for df in dfs]
+        if all(isinstance(e, pd.CategoricalDtype) for e in column_dtypes):
+            categories = reduce(
+                lambda left, right: left.union(right),
+                (e.categories for e in column_dtypes),
+            )
+            union_dtypes[column] = pd.CategoricalDtype(categories)
+
+    recoded_dfs = []
+    for df in dfs:
+        recoded_columns = {
+            column: df[column].cat.set_categories(dtype.categories)
+            for column, dtype in union_dtypes.items()
+            if df.dtypes[column] != dtype
+        }
+        # `assign` only copies the recoded columns, unlike `astype`
+        recoded_dfs.append(df.assign(**recoded_columns) if recoded_columns else df)
+
+    return pd.concat(recoded_dfs)
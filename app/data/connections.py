@@ -0,0 +1,250 @@
+"""
+Creation of the SQLAlchemy engines used by the data layer, with managed connection pools:
+- pool size, overflow, recycle and timeout configurable per engine through environment variables ;
+- connections are checked with a "pre-ping" before being used ;
+- after a fork (gunicorn preload, background callbacks), the child process gets a new pool ;
+- counters about checkout wait time and pool exhaustion are kept for each engine, and recorded in the metrics
+(see `app.data.metrics`) with the current usage of the pool.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import Pool, QueuePool
+
+from app.data.metrics import (
+    POOL_CHECKED_OUT,
+    POOL_CHECKOUT_WAIT,
+    POOL_CHECKOUTS,
+    POOL_EXHAUSTED_CHECKOUTS,
+    POOL_OVERFLOW,
+    POOL_SATURATED_CHECKOUTS,
+    POOL_SIZE,
+)
+
+logger = logging.getLogger()
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_RECYCLE = 1800
+DEFAULT_POOL_TIMEOUT = 30
+
+# Engines created with `create_managed_engine`, by name
+ENGINES: Dict[str, Engine] = {}
+# Pools inherited from the parent process are kept referenced in child processes
+# so that their connections (whose sockets are shared with the parent) are never closed by the child
+_PARENT_PROCESS_POOLS = []
+
+
+class PoolStats:
+    """Counters about the checkouts of a connection pool.
+
+    Attributes
+    ----------
+    checkouts: int
+        Number of connections successfully checked out.
+    total_wait_time: float
+        Cumulated time (in seconds) spent waiting for a connection, including new connections creation.
+    max_wait_time: float
+        Longest time (in seconds) spent waiting for a connection.
+    saturated_checkouts: int
+        Number of checkouts requested while all the connections (including overflow) were in use.
+    exhausted_checkouts: int
+        Number of checkouts that failed because no connection was available before the pool timeout.
+    fork_resets: int
+        Number of times the pool was replaced after a fork.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+        self.checkouts = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.saturated_checkouts = 0
+        self.exhausted_checkouts = 0
+        self.fork_resets = 0
+
+    def record_checkout(self, wait_time: float, saturated: bool) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+            self.saturated_checkouts += int(saturated)
+
+    def record_exhaustion(self, saturated: bool) -> None:
+        with self._lock:
+            self.exhausted_checkouts += 1
+            self.saturated_checkouts += int(saturated)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "total_wait_time": self.total_wait_time,
+                "max_wait_time": self.max_wait_time,
+                "mean_wait_time": (
+                    self.total_wait_time / self.checkouts if self.checkouts else 0.0
+                ),
+                "saturated_checkouts": self.saturated_checkouts,
+                "exhausted_checkouts": self.exhausted_checkouts,
+                "fork_resets": self.fork_resets,
+            }
+
+
+class MonitoredQueuePool(QueuePool):
+    """QueuePool that records the time spent waiting for a connection and pool exhaustions in a `PoolStats`,
+    and its usage in the metrics (labelled with the logging name of the pool, i.e. the engine name)."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+        POOL_SIZE.labels(engine=self._orig_logging_name).set(self.size())
+        self._record_usage()
+
+    def recreate(self) -> "MonitoredQueuePool":
+        # Counters are kept when the pool is recreated (engine disposal, fork)
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _is_saturated(self) -> bool:
+        return self._max_overflow > -1 and (
+            self.checkedout() >= self.size() + self._max_overflow
+        )
+
+    def _record_usage(self) -> None:
+        engine = self._orig_logging_name
+        POOL_CHECKED_OUT.labels(engine=engine).set(self.checkedout())
+        POOL_OVERFLOW.labels(engine=engine).set(max(self.overflow(), 0))
+
+    def _do_get(self):
+        engine = self._orig_logging_name
+        saturated = self._is_saturated()
+        if saturated:
+            POOL_SATURATED_CHECKOUTS.labels(engine=engine).inc()
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_exhaustion(saturated)
+            POOL_EXHAUSTED_CHECKOUTS.labels(engine=engine).inc()
+            logger.warning(
+                "Connection pool %s exhausted : %s", self.logging_name, self.status()
+            )
+            raise
+        wait_time = time.perf_counter() - start
+        self.stats.record_checkout(wait_time, saturated)
+        POOL_CHECKOUTS.labels(engine=engine).inc()
+        POOL_CHECKOUT_WAIT.labels(engine=engine).inc(wait_time)
+        self._record_usage()
+        return connection
+
+    def _do_return_conn(self, conn) -> None:
+        super()._do_return_conn(conn)
+        self._record_usage()
+
+
+def _get_env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def create_managed_engine(name: str, url: str, env_prefix: str) -> Engine:
+    """Create a SQLAlchemy engine with a monitored, pre-pinged, fork-safe connection pool.
+
+    The pool is configured with the following environment variables (`PREFIX` being `env_prefix`):
+    - `PREFIX_POOL_SIZE`: number of connections kept in the pool ;
+    - `PREFIX_MAX_OVERFLOW`: number of connections that can be opened beyond the pool size ;
+    - `PREFIX_POOL_RECYCLE`: maximum age of a connection (in seconds) before it is replaced ;
+    - `PREFIX_POOL_TIMEOUT`: maximum time (in seconds) to wait for an available connection.
+
+    Parameters
+    ----------
+    name : str
+        Name of the engine, used for logging and telemetry.
+    url : str
+        Database URL.
+    env_prefix : str
+        Prefix of the environment variables holding the pool configuration.
+
+    Returns
+    -------
+    Engine
+        The SQLAlchemy engine.
+    """
+
+    if make_url(url).get_backend_name() == "sqlite":
+        # SQLite connections cannot be shared between threads, default pooling is kept
+        engine = create_engine(url)
+    else:
+        engine = create_engine(
+            url,
+            poolclass=MonitoredQueuePool,
+            pool_size=_get_env_int(f"{env_prefix}_POOL_SIZE", DEFAULT_POOL_SIZE),
+            max_overflow=_get_env_int(
+                f"{env_prefix}_MAX_OVERFLOW", DEFAULT_MAX_OVERFLOW
+            ),
+            pool_recycle=_get_env_int(
+                f"{env_prefix}_POOL_RECYCLE", DEFAULT_POOL_RECYCLE
+            ),
+            pool_timeout=_get_env_int(
+                f"{env_prefix}_POOL_TIMEOUT", DEFAULT_POOL_TIMEOUT
+            ),
+            pool_pre_ping=True,
+            pool_logging_name=name,
+        )
+
+    ENGINES[name] = engine
+
+    return engine
+
+
+def _reset_pools_after_fork() -> None:
+    """Give each engine a new pool in the child process after a fork.
+
+    The pools inherited from the parent process are not disposed (closing their connections
+    would also close them for the parent) but only dereferenced from the engines.
+    """
+    for engine in ENGINES.values():
+        parent_pool: Pool = engine.pool
+        _PARENT_PROCESS_POOLS.append(parent_pool)
+        engine.pool = parent_pool.recreate()
+        if isinstance(engine.pool, MonitoredQueuePool):
+            engine.pool.stats = PoolStats()
+            engine.pool.stats.fork_resets = parent_pool.stats.fork_resets + 1
+
+
+os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+
+def get_pools_stats() -> Dict[str, Dict[str, Any]]:
+    """Returns the current state and the counters of each engine connection pool.
+
+    Returns
+    -------
+    dict
+        Dict with keys being the engines names and values dicts with the pool configuration,
+        its current usage and the checkout counters.
+    """
+
+    pools_stats = {}
+    for name, engine in ENGINES.items():
+        pool = engine.pool
+        if not isinstance(pool, MonitoredQueuePool):
+            continue
+
+        pools_stats[name] = {
+            "pool_size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            **pool.stats.as_dict(),
+        }
+
+    return pools_stats
@@ -1,45 +1,157 @@
+import contextvars
+import json
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
 from pathlib import Path
-from typing import Any, List
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Union
 
 import geopandas as gpd
 import pandas as pd
-from sqlalchemy import create_engine
-
-DATABASE_URL = os.environ["DATABASE_URL"]
-DWH_URL = os.environ["DWH_URL"]
-DB_ENGINE = create_engine(DATABASE_URL)
-DWH_ENGINE = create_engine(DWH_URL)
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.data.arrow_fetch import read_sql_query_arrow
+from app.data.cache import QUERY_CACHE_BACKEND, create_query_cache
+from app.data.cancellation import QUERY_CANCELLATION_DIRECTORY, QueryCancellation
+from app.data.connections import create_managed_engine
+from app.data.local_engine import create_local_engine
+from app.data.metrics import (
+    get_dataframe_memory_usage,
+    record_query_result,
+    track_query,
+)
+from app.data.quantity_rules import (
+    QUANTITY_OUTLIER_REASON_COLUMN,
+    evaluate_quantity_rules,
+)
+from app.data.query_registry import (
+    BIND_PARAMS_PATTERN,
+    QUERY_TEMPLATES_SPECS,
+    QueryRegistry,
+)
+from app.data.utils import (
+    BS_PREPROCESSING_COLUMNS,
+    BSDataPreprocessor,
+    split_bs_data_by_type,
+)
+
+# Directory of the local stand-in databases (see `app.data.local_engine`), used instead of DATABASE_URL and DWH_URL
+LOCAL_DATABASE_DIRECTORY = os.getenv("LOCAL_DATABASE_DIRECTORY", "")
+if LOCAL_DATABASE_DIRECTORY:
+    DB_ENGINE = create_local_engine(
+        "db-prod", Path(LOCAL_DATABASE_DIRECTORY), env_prefix="DB"
+    )
+    DWH_ENGINE = create_local_engine(
+        "dwh", Path(LOCAL_DATABASE_DIRECTORY), env_prefix="DWH"
+    )
+else:
+    DATABASE_URL = os.environ["DATABASE_URL"]
+    DWH_URL = os.environ["DWH_URL"]
+    DB_ENGINE = create_managed_engine("db-prod", DATABASE_URL, env_prefix="DB")
+    DWH_ENGINE = create_managed_engine("dwh", DWH_URL, env_prefix="DWH")
 SQL_QUERIES_PATH = Path("app/data/sql")
 STATIC_FILES_PATH = Path("app/data/static")
+# Number of queries that can run simultaneously when using `make_queries`, 1 means sequential execution
+QUERIES_MAX_WORKERS = int(os.getenv("QUERIES_MAX_WORKERS", "5"))
+# If True, queries are executed as server-side prepared statements (PostgreSQL only), reused per connection
+USE_PREPARED_STATEMENTS = (
+    os.getenv("USE_PREPARED_STATEMENTS", "false").lower() == "true"
+)
+# "pandas" to build DataFrames from the driver rows, "arrow" to fetch results as Arrow tables (requires pyarrow)
+QUERY_FETCH_BACKEND = os.getenv("QUERY_FETCH_BACKEND", "pandas")
+# Statement timeout (in seconds) of the queries by template timeout class (PostgreSQL only, 0 to disable),
+# can be overridden with a JSON object in the QUERY_STATEMENT_TIMEOUTS environment variable
+QUERY_STATEMENT_TIMEOUTS = {
+    "default": 60,
+    "bordereaux": 300,
+    "export": 0,
+    **json.loads(os.getenv("QUERY_STATEMENT_TIMEOUTS", "{}")),
+}
+
+# If True, all 'bordereau' types are fetched with a single query (get_bs_data) instead of one query per type
+BS_COMBINED_EXTRACTION = os.getenv("BS_COMBINED_EXTRACTION", "false").lower() == "true"
+
+# If > 0, 'bordereaux' queries are streamed with a server-side cursor and preprocessed by chunks of this number of rows
+BS_STREAMING_CHUNKSIZE = int(os.getenv("BS_STREAMING_CHUNKSIZE", "0"))
+
+# If True, preprocessed 'bordereaux' data is stored with compact dtypes (see `app.data.compact_dtypes`)
+BS_COMPACT_DTYPES = os.getenv("BS_COMPACT_DTYPES", "false").lower() == "true"
+
+# Cache of the queries results, None if disabled (see QUERY_CACHE_BACKEND)
+QUERY_CACHE = create_query_cache(QUERY_CACHE_BACKEND)
+
+# Running queries of the superseded fiche requests are cancelled
+QUERY_CANCELLATION = QueryCancellation(
+    QUERY_CANCELLATION_DIRECTORY, {"db-prod": DB_ENGINE, "dwh": DWH_ENGINE}
+)
+
+# SQL templates, loaded and validated once
+QUERY_REGISTRY = QueryRegistry(QUERY_TEMPLATES_SPECS)
+QUERY_REGISTRY.load(SQL_QUERIES_PATH)
+
+logger = logging.getLogger()
 
 
 def make_query(
     sql_query_name: str,
-    engine: str = "db-prod",
+    engine: str = None,
     date_columns: List[str] = None,
     dtypes: dict[str, Any] = None,
-    **format_arguments,
-) -> pd.DataFrame:
-    """Make a SQL query using the sql file corresponding to the given sql query name.
+    use_cache: bool = True,
+    chunksize: int = None,
+    fetch_backend: str = None,
+    columns: List[str] = None,
+    updated_since: datetime = None,
+    **query_params,
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """Make a SQL query using the template of `QUERY_REGISTRY` corresponding to the given sql query name.
 
     Parameters
     ----------
     sql_query_name : str
         Name of the sql file (without the .sql extension).
+    engine : str
+        "db-prod" or "dwh", defaults to the engine of the template.
     date_columns : list of str
-        Names of columns to parse as dates in pandas (time-zone aware dates are casted to UTC).
+        Names of columns to parse as dates in pandas (time-zone aware dates are casted to UTC),
+        defaults to the date columns of the template.
     dtypes: dict
-        Dict mapping column name to corresponding dtype.
-    format_arguments: kwargs
-        Additional format arguments to pass to the SQL query.
+        Dict mapping column name to corresponding dtype, defaults to the dtypes of the template.
+    use_cache: bool
+        If False, the query cache (when enabled) is bypassed.
+    chunksize: int
+        If given, the result is streamed from a server-side cursor and returned as an iterator of DataFrames
+        of at most `chunksize` rows (the cache and prepared statements are not used in this case).
+    fetch_backend: str
+        "pandas" or "arrow" (see `app.data.arrow_fetch`), defaults to `QUERY_FETCH_BACKEND`.
+        Both backends return the same DataFrame. Ignored if `chunksize` is given.
+    columns: list of str
+        Result columns to fetch, among the columns of the template (all the columns by default).
+    updated_since: datetime
+        If given, only the lines updated after this date (naive UTC datetime) are fetched,
+        the template must return the `updatedAt` column. The cache is not used in this case.
+    query_params: kwargs
+        Values of the named bind parameters (`:param_name`) of the SQL query, they must match the template ones.
 
     Returns
     -------
-    DataFrame
-        DataFrame with the result of the query.
+    DataFrame or iterator of DataFrames
+        DataFrame with the result of the query, or iterator over chunks of the result if `chunksize` is given.
     """
 
+    template = QUERY_REGISTRY.get(sql_query_name)
+    template.check_params(query_params)
+
+    if engine is None:
+        engine = template.engine
+    if date_columns is None:
+        date_columns = template.date_columns
+    if dtypes is None:
+        dtypes = template.dtypes
+
     if engine == "db-prod":
         con = DB_ENGINE
     elif engine == "dwh":
@@ -47,21 +159,305 @@ def make_query(
     else:
         raise ValueError("engine must be either 'db-prod' or 'dwh'")
 
-    sql_query_str = (
-        (SQL_QUERIES_PATH / f"{sql_query_name}.sql")
-        .read_text()
-        .format(**format_arguments)
-    )
-    print(sql_query_str)
+    if fetch_backend is None:
+        fetch_backend = QUERY_FETCH_BACKEND
+    if fetch_backend not in ("pandas", "arrow"):
+        raise ValueError("fetch_backend must be either 'pandas' or 'arrow'")
+
+    sql_query_str, statement = template.sql, template.statement
+    if updated_since is not None:
+        sql_query_str, statement = template.get_projection(columns, incremental=True)
+        query_params = {**query_params, "updated_since": updated_since}
+        use_cache = False
+    elif columns is not None:
+        sql_query_str, statement = template.get_projection(columns)
+    if columns is not None:
+        if date_columns is not None:
+            date_columns = [column for column in date_columns if column in columns]
+        if dtypes is not None:
+            dtypes = {k: v for k, v in dtypes.items() if k in columns}
+    logger.debug("Query %s with parameters %s", sql_query_name, query_params)
 
     date_params = None
     if date_columns is not None:
         date_params = {e: {"utc": True} for e in date_columns}
-    df = pd.read_sql_query(
-        sql_query_str, con=con, dtype=dtypes, parse_dates=date_params
+
+    statement_timeout = QUERY_STATEMENT_TIMEOUTS[template.timeout_class]
+
+    def read_sql_query() -> pd.DataFrame:
+        with track_query(
+            sql_query_name, engine
+        ), con.connect() as connection, QUERY_CANCELLATION.track(connection, engine):
+            set_statement_timeout(connection, statement_timeout)
+            if fetch_backend == "arrow":
+                df = read_sql_query_arrow(
+                    connection,
+                    sql_query_str,
+                    query_params,
+                    date_columns=date_columns,
+                    dtypes=dtypes,
+                )
+            else:
+                executed_statement = statement
+                if USE_PREPARED_STATEMENTS and connection.dialect.name == "postgresql":
+                    executed_statement = get_prepared_statement(
+                        connection, sql_query_str
+                    )
+
+                df = pd.read_sql_query(
+                    executed_statement,
+                    con=connection,
+                    params=query_params,
+                    dtype=dtypes,
+                    parse_dates=date_params,
+                )
+
+        record_query_result(
+            sql_query_name, engine, len(df), get_dataframe_memory_usage(df)
+        )
+        return df
+
+    def read_sql_query_chunks() -> Iterator[pd.DataFrame]:
+        n_rows = 0
+        n_bytes = 0
+        # The connection stays open until all the chunks have been consumed
+        with track_query(
+            sql_query_name, engine
+        ), con.connect() as connection, QUERY_CANCELLATION.track(connection, engine):
+            set_statement_timeout(connection, statement_timeout)
+            for chunk in pd.read_sql_query(
+                statement,
+                con=connection.execution_options(stream_results=True),
+                params=query_params,
+                dtype=dtypes,
+                parse_dates=date_params,
+                chunksize=chunksize,
+            ):
+                n_rows += len(chunk)
+                n_bytes += get_dataframe_memory_usage(chunk)
+                yield chunk
+
+        record_query_result(sql_query_name, engine, n_rows, n_bytes)
+
+    if chunksize is not None:
+        return read_sql_query_chunks()
+
+    if QUERY_CACHE is None or not use_cache:
+        return read_sql_query()
+
+    return QUERY_CACHE.get_or_compute(
+        sql_query_name,
+        engine,
+        read_sql_query,
+        date_columns=date_columns,
+        dtypes=dtypes,
+        columns=columns,
+        **query_params,
     )
 
-    return df
+
+def set_statement_timeout(connection: Connection, timeout: int) -> None:
+    """Sets the statement timeout of the queries of the current transaction (PostgreSQL only).
+    The setting is local to the transaction, which is rolled back when the connection is given back to the pool.
+
+    Parameters
+    ----------
+    connection : Connection
+        SQLAlchemy connection.
+    timeout : int
+        Timeout in seconds, 0 to disable it.
+    """
+
+    if connection.dialect.name != "postgresql":
+        return
+
+    connection.execute(
+        text("select set_config('statement_timeout', :timeout, true)"),
+        {"timeout": f"{int(timeout * 1000)}"},
+    )
+
+
+def get_prepared_statement(connection: Connection, sql_query_str: str) -> text:
+    """Prepare the SQL query server-side (PostgreSQL `PREPARE`) if it has not already been prepared
+    on this connection, and returns the statement that executes it.
+
+    Prepared statements live as long as the database session, so the names of the statements already prepared
+    are kept in the `info` dict of the DBAPI connection (which is cleared if the connection is invalidated).
+
+    Parameters
+    ----------
+    connection : Connection
+        SQLAlchemy connection to a PostgreSQL database.
+    sql_query_str : str
+        SQL query with named bind parameters (`:param_name`).
+
+    Returns
+    -------
+    TextClause
+        `EXECUTE` statement with the same named bind parameters as the SQL query.
+    """
+
+    prepared_statements = connection.info.setdefault("prepared_statements", {})
+
+    # Parameters are numbered in order of first appearance
+    params_names = list(dict.fromkeys(BIND_PARAMS_PATTERN.findall(sql_query_str)))
+
+    statement_name = prepared_statements.get(sql_query_str)
+    if statement_name is None:
+        statement_name = f"fiche_inspection_{len(prepared_statements)}"
+        positional_sql_query_str = BIND_PARAMS_PATTERN.sub(
+            lambda match: f"${params_names.index(match.group(1)) + 1}",
+            sql_query_str,
+        )
+        connection.exec_driver_sql(
+            f"PREPARE {statement_name} AS {positional_sql_query_str}"
+        )
+        prepared_statements[sql_query_str] = statement_name
+
+    execute_args = ""
+    if params_names:
+        execute_args = "(" + ", ".join(f":{name}" for name in params_names) + ")"
+
+    return text(f"EXECUTE {statement_name}{execute_args}")
+
+
+def run_concurrently(
+    tasks: Dict[str, Callable[[], Any]], max_workers: int = None
+) -> Dict[str, Any]:
+    """Run several data extraction tasks concurrently on a bounded thread pool.
+    Each task is isolated : if one of them fails, the others still run and the exception
+    is returned in place of the task result.
+
+    Parameters
+    ----------
+    tasks : dict
+        Dict with keys being an arbitrary task name and values functions without arguments.
+    max_workers : int
+        Maximum number of tasks running at the same time (defaults to `QUERIES_MAX_WORKERS`).
+        With a value of 1, tasks are run sequentially in the calling thread.
+
+    Returns
+    -------
+    dict
+        Dict with the same keys as `tasks` and values being either the result of the task
+        or the exception raised by the task.
+    """
+
+    if max_workers is None:
+        max_workers = QUERIES_MAX_WORKERS
+
+    def run_task(name: str, task: Callable[[], Any]) -> Any:
+        try:
+            return task()
+        except Exception as e:
+            logger.exception("Task %s failed", name)
+            return e
+
+    if max_workers <= 1 or len(tasks) <= 1:
+        return {name: run_task(name, task) for name, task in tasks.items()}
+
+    # Tasks run in the context of the caller (e.g. its query cancellation scope)
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(tasks)), thread_name_prefix="make_query"
+    ) as executor:
+        futures = {
+            name: executor.submit(contextvars.copy_context().run, run_task, name, task)
+            for name, task in tasks.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+def make_queries(
+    queries: Dict[str, Dict[str, Any]], max_workers: int = None
+) -> Dict[str, Union[pd.DataFrame, Exception]]:
+    """Run several queries with `make_query`, concurrently on a bounded thread pool (see `run_concurrently`).
+
+    Parameters
+    ----------
+    queries : dict
+        Dict with keys being an arbitrary query name and values the keyword arguments to pass to `make_query`.
+    max_workers : int
+        Maximum number of queries running at the same time (defaults to `QUERIES_MAX_WORKERS`).
+
+    Returns
+    -------
+    dict
+        Dict with the same keys as `queries` and values being either the resulting DataFrame
+        or the exception raised by the query.
+    """
+
+    return run_concurrently(
+        {name: partial(make_query, **kwargs) for name, kwargs in queries.items()},
+        max_workers=max_workers,
+    )
+
+
+def get_preprocessed_bs_data(
+    sql_query_name: str,
+    bs_type: str = None,
+    chunksize: int = None,
+    columns: List[str] = None,
+    **query_kwargs,
+) -> Dict[str, Tuple[pd.DataFrame, Dict[str, pd.DataFrame], pd.DataFrame]]:
+    """Fetch 'bordereaux' data and separate date and quantity outliers from it.
+    If `chunksize` is given, the query result is streamed and preprocessed chunk by chunk,
+    so that the whole raw result never sits in memory.
+
+    Parameters
+    ----------
+    sql_query_name : str
+        Name of the sql file (without the .sql extension), either a query for one 'bordereau' type
+        or the combined query for all types (get_bs_data).
+    bs_type : str
+        'bordereau' type returned by the query (BSDD, BSDA, BSFF, BSVHU or BSDASRI),
+        None for the combined query.
+    chunksize: int
+        Number of rows fetched and preprocessed at once, None to fetch everything at once.
+    columns: list of str
+        Columns needed by the components, None to fetch all the columns of the query.
+        The columns needed by the preprocessing are always fetched, columns not returned
+        by the query (e.g. missing for the 'bordereau' type) are ignored.
+    query_kwargs: kwargs
+        Additional arguments to pass to `make_query`.
+
+    Returns
+    -------
+    dict
+        Dict with keys being the 'bordereau' types and values tuples consisting of :
+        1. DataFrame without date outliers ;
+        2. Dict of date outliers (see `get_outliers_datetimes_df`) ;
+        3. DataFrame with the quantity outliers (see `app.data.quantity_rules`).
+    """
+
+    if columns is not None:
+        template = QUERY_REGISTRY.get(sql_query_name)
+        needed_columns = {"bs_type", *BS_PREPROCESSING_COLUMNS, *columns}
+        columns = [column for column in template.columns if column in needed_columns]
+
+    result = make_query(
+        sql_query_name, chunksize=chunksize, columns=columns, **query_kwargs
+    )
+    chunks = [result] if chunksize is None else result
+
+    preprocessors = {}
+    for chunk in chunks:
+        if bs_type is None:
+            # Quantity rules are evaluated in a single pass over all the types
+            chunk[QUANTITY_OUTLIER_REASON_COLUMN] = evaluate_quantity_rules(chunk)
+            dfs = split_bs_data_by_type(chunk)
+        else:
+            dfs = {bs_type: chunk}
+        for chunk_bs_type, df in dfs.items():
+            if chunk_bs_type not in preprocessors:
+                preprocessors[chunk_bs_type] = BSDataPreprocessor(
+                    chunk_bs_type, compact_dtypes=BS_COMPACT_DTYPES
+                )
+            preprocessors[chunk_bs_type].add_chunk(df)
+
+    return {
+        preprocessor_bs_type: preprocessor.get_results()
+        for preprocessor_bs_type, preprocessor in preprocessors.items()
+    }
 
 
 def load_departements_regions_data() -> pd.DataFrame:
@@ -0,0 +1,316 @@
+"""
+Local snapshot of the in-force ICPE items of the data warehouse.
+
+The ICPE items of a SIRET are read from a SQLite file indexed on `siret_clean`, instead of querying the DWH
+for each fiche. The snapshot is built by a refresh command, meant to be run periodically (cron) :
+
+    python -m app.data.icpe_snapshot refresh
+
+The snapshot is written next to the current one and atomically moved in place, so the workers keep
+reading a consistent file during a refresh and switch to the new one on their next lookup.
+The live DWH query (`get_icpe_data`) is only used as a fallback, when the snapshot is missing,
+unreadable or older than ICPE_SNAPSHOT_MAX_AGE.
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from prometheus_client import Counter
+from prometheus_client.core import GaugeMetricFamily
+
+from app.data.data_extract import make_query
+from app.data.metrics import EXPOSITION_REGISTRY
+from app.data.query_registry import ICPE_COLUMNS, ICPE_DATE_COLUMNS
+
+# Path of the snapshot file, empty to always query the DWH
+ICPE_SNAPSHOT_PATH = os.getenv("ICPE_SNAPSHOT_PATH", "./cache/icpe_snapshot.sqlite")
+# Age (in seconds) after which the snapshot is no longer used, 0 to use it whatever its age
+ICPE_SNAPSHOT_MAX_AGE = int(os.getenv("ICPE_SNAPSHOT_MAX_AGE", str(3 * 24 * 3600)))
+# Number of rows fetched from the DWH and written to the snapshot at once during a refresh
+ICPE_SNAPSHOT_CHUNKSIZE = int(os.getenv("ICPE_SNAPSHOT_CHUNKSIZE", "50000"))
+
+ICPE_SNAPSHOT_TABLE = "icpe"
+
+# Dates are stored as their UTC timestamp in nanoseconds (NaT as the smallest int64),
+# so that the lookups build the date columns without parsing
+UTC_DTYPE = pd.DatetimeTZDtype(tz="UTC")
+
+logger = logging.getLogger()
+
+ICPE_LOOKUPS = Counter(
+    "fiche_inspection_icpe_lookups",
+    "Number of lookups of the ICPE items of a SIRET, by source (snapshot or dwh).",
+    labelnames=("source",),
+)
+
+
+class ICPESnapshotUnavailable(Exception):
+    """Raised when the snapshot is missing, unreadable or too old to be used."""
+
+
+class ICPESnapshot:
+    """Read access to the snapshot file, with one read-only connection per thread.
+
+    Parameters
+    ----------
+    path : Path
+        Path of the snapshot file.
+    max_age : int
+        Age (in seconds) after which the snapshot is no longer used, 0 to use it whatever its age.
+    """
+
+    def __init__(self, path: Path, max_age: int) -> None:
+        self.path = Path(path)
+        self.max_age = max_age
+        self._local = threading.local()
+
+        selected_columns = ", ".join(ICPE_COLUMNS)
+        self._date_columns_indexes = [
+            ICPE_COLUMNS.index(column) for column in ICPE_DATE_COLUMNS
+        ]
+        self._lookup_sql = (
+            f"select {selected_columns} from {ICPE_SNAPSHOT_TABLE}"
+            " where siret_clean = ?"
+        )
+
+    def _get_connection(self) -> Tuple[sqlite3.Connection, float]:
+        """Returns the connection of the current thread to the current snapshot file and its refresh date,
+        reopening it if the file has been replaced since it was opened."""
+
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            raise ICPESnapshotUnavailable(f"No ICPE snapshot at {self.path}") from None
+
+        file_id = (stat.st_ino, stat.st_mtime_ns)
+        opened = getattr(self._local, "opened", None)
+        if opened is not None and opened[0] == file_id:
+            return opened[1], opened[2]
+
+        if opened is not None:
+            opened[1].close()
+            self._local.opened = None
+
+        try:
+            connection = sqlite3.connect(
+                f"file:{self.path}?mode=ro", uri=True, check_same_thread=False
+            )
+            refreshed_at = float(
+                connection.execute(
+                    "select value from metadata where key = 'refreshed_at'"
+                ).fetchone()[0]
+            )
+        except (sqlite3.Error, TypeError) as e:
+            raise ICPESnapshotUnavailable(
+                f"Unreadable ICPE snapshot at {self.path}"
+            ) from e
+
+        self._local.opened = (file_id, connection, refreshed_at)
+        return connection, refreshed_at
+
+    def get_age(self) -> Optional[float]:
+        """Returns the age (in seconds) of the snapshot, None if there is no readable snapshot."""
+
+        try:
+            _, refreshed_at = self._get_connection()
+        except ICPESnapshotUnavailable:
+            return None
+        return time.time() - refreshed_at
+
+    def get_icpe_data(self, siret: str) -> pd.DataFrame:
+        """Returns the in-force ICPE items of the SIRET, with the same columns and types as `get_icpe_data`.
+
+        Raises
+        ------
+        ICPESnapshotUnavailable
+            If the snapshot is missing, unreadable or too old.
+        """
+
+        connection, refreshed_at = self._get_connection()
+        age = time.time() - refreshed_at
+        if self.max_age and age > self.max_age:
+            raise ICPESnapshotUnavailable(
+                f"ICPE snapshot at {self.path} is too old ({age:.0f}s)"
+            )
+
+        try:
+            rows = connection.execute(self._lookup_sql, (siret,)).fetchall()
+        except sqlite3.Error as e:
+            raise ICPESnapshotUnavailable(
+                f"Unreadable ICPE snapshot at {self.path}"
+            ) from e
+
+        df = pd.DataFrame.from_records(rows, columns=ICPE_COLUMNS)
+        for column, index in zip(ICPE_DATE_COLUMNS, self._date_columns_indexes):
+            timestamps = np.fromiter(
+                (row[index] for row in rows), dtype="int64", count=len(rows)
+            )
+            df[column] = pd.arrays.DatetimeArray(
+                timestamps.view("M8[ns]"), dtype=UTC_DTYPE
+            )
+
+        return df
+
+
+def refresh_snapshot(path: Path, chunksize: int = ICPE_SNAPSHOT_CHUNKSIZE) -> int:
+    """Exports the in-force ICPE items of the DWH to a new snapshot file, which replaces the current one.
+
+    Parameters
+    ----------
+    path : Path
+        Path of the snapshot file.
+    chunksize : int
+        Number of rows fetched and written at once.
+
+    Returns
+    -------
+    int
+        Number of ICPE items of the snapshot.
+    """
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.unlink(missing_ok=True)
+
+    n_rows = 0
+    try:
+        connection = sqlite3.connect(tmp_path)
+        try:
+            # The file is only used once complete, no need for a rollback journal
+            connection.execute("pragma journal_mode = off")
+            connection.execute("pragma synchronous = off")
+
+            chunks = make_query("get_icpe_snapshot_data", chunksize=chunksize)
+            for chunk in chunks:
+                for column in ICPE_DATE_COLUMNS:
+                    dates = pd.to_datetime(chunk[column], utc=True)
+                    chunk[column] = dates.values.view("int64")
+                chunk.to_sql(
+                    ICPE_SNAPSHOT_TABLE, connection, if_exists="append", index=False
+                )
+                n_rows += len(chunk)
+
+            if n_rows == 0:
+                raise ValueError("No ICPE items in the DWH, the snapshot is kept")
+
+            connection.execute(
+                f"create index {ICPE_SNAPSHOT_TABLE}_siret_clean"
+                f" on {ICPE_SNAPSHOT_TABLE} (siret_clean)"
+            )
+            connection.execute("create table metadata (key text primary key, value)")
+            connection.executemany(
+                "insert into metadata values (?, ?)",
+                [("refreshed_at", time.time()), ("rows", n_rows)],
+            )
+            connection.commit()
+        finally:
+            connection.close()
+
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    return n_rows
+
+
+def create_icpe_snapshot(path: str) -> ICPESnapshot:
+    """Create the snapshot reader with the given path, using the module configuration.
+
+    Returns
+    -------
+    ICPESnapshot
+        The snapshot reader, or None if the snapshot is disabled (empty path).
+    """
+
+    if not path:
+        return None
+
+    return ICPESnapshot(Path(path), ICPE_SNAPSHOT_MAX_AGE)
+
+
+ICPE_SNAPSHOT = create_icpe_snapshot(ICPE_SNAPSHOT_PATH)
+
+
+def get_icpe_data(siret: str) -> pd.DataFrame:
+    """Returns the in-force ICPE items of the SIRET, from the snapshot if it is usable,
+    or else from the DWH (`get_icpe_data` query).
+
+    Parameters
+    ----------
+    siret : str
+        SIRET number of the establishment.
+
+    Returns
+    -------
+    DataFrame
+        ICPE items of the establishment.
+    """
+
+    if ICPE_SNAPSHOT is not None:
+        try:
+            df = ICPE_SNAPSHOT.get_icpe_data(siret)
+            ICPE_LOOKUPS.labels(source="snapshot").inc()
+            return df
+        except ICPESnapshotUnavailable as e:
+            logger.warning("%s, falling back to the DWH", e)
+
+    ICPE_LOOKUPS.labels(source="dwh").inc()
+    return make_query("get_icpe_data", siret=siret)
+
+
+class ICPESnapshotAgeCollector:
+    """Collector of the age of the snapshot, read when the metrics are rendered
+    (no sample if there is no readable snapshot)."""
+
+    name = "fiche_inspection_icpe_snapshot_age_seconds"
+    documentation = "Age of the local ICPE snapshot."
+
+    def describe(self) -> List[GaugeMetricFamily]:
+        return [GaugeMetricFamily(self.name, self.documentation)]
+
+    def collect(self) -> List[GaugeMetricFamily]:
+        gauge = GaugeMetricFamily(self.name, self.documentation)
+        age = ICPE_SNAPSHOT.get_age() if ICPE_SNAPSHOT is not None else None
+        if age is not None:
+            gauge.add_metric([], age)
+        return [gauge]
+
+
+# The snapshot is shared by the workers, its age is read by the worker rendering the metrics
+EXPOSITION_REGISTRY.register(ICPESnapshotAgeCollector())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local snapshot of the ICPE items.")
+    parser.add_argument("command", choices=["refresh", "age"])
+    parser.add_argument(
+        "--path", default=ICPE_SNAPSHOT_PATH, help="Path of the snapshot file."
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "refresh":
+        start = time.perf_counter()
+        n_rows = refresh_snapshot(Path(args.path))
+        logger.info(
+            "ICPE snapshot %s refreshed with %s items in %.1fs",
+            args.path,
+            n_rows,
+            time.perf_counter() - start,
+        )
+    else:
+        age = ICPESnapshot(Path(args.path), 0).get_age()
+        print("no snapshot" if age is None else f"{age:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
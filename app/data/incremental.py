@@ -0,0 +1,317 @@
+"""
+Incremental refresh of the preprocessed 'bordereaux' data of a SIRET.
+
+The preprocessed data (see `get_preprocessed_bs_data`) of each SIRET and 'bordereaux' query is kept
+with a high-water mark : the most recent `updatedAt` seen. When the fiche is generated again :
+- only the lines updated since the high-water mark are fetched and preprocessed (date and quantity outliers) ;
+- the ids of all the lines updated since then, whether they still match the query or not
+  (deleted, back to draft...), are fetched with `get_bs_updated_ids` and their previous version is dropped ;
+- the lines that aged out of the one-year window of the queries are dropped.
+
+A line whose SIRETs were changed to other establishments is no longer returned by any query :
+it is only dropped when the kept data expires (BS_INCREMENTAL_MAX_AGE) and is fully fetched again.
+"""
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from app.data.cache import DiskCacheBackend, MemoryCacheBackend
+from app.data.compact_dtypes import concat_bs_data
+from app.data.data_extract import (
+    BS_COMPACT_DTYPES,
+    get_preprocessed_bs_data,
+    make_query,
+)
+from app.data.query_registry import WATERMARK_COLUMN
+
+# "memory", "disk" or empty to disable the incremental refresh
+BS_INCREMENTAL_BACKEND = os.getenv("BS_INCREMENTAL_BACKEND", "")
+# Time (in seconds) after which the data of a SIRET is fully fetched again
+BS_INCREMENTAL_MAX_AGE = int(os.getenv("BS_INCREMENTAL_MAX_AGE", str(24 * 3600)))
+# Margin (in seconds) subtracted from the high-water mark, for transactions committed after a refresh
+# with an update date before it (lines fetched twice are simply replaced)
+BS_INCREMENTAL_WATERMARK_OVERLAP = int(
+    os.getenv("BS_INCREMENTAL_WATERMARK_OVERLAP", "300")
+)
+BS_INCREMENTAL_MAX_ENTRIES = int(os.getenv("BS_INCREMENTAL_MAX_ENTRIES", "256"))
+BS_INCREMENTAL_SIZE_LIMIT = int(os.getenv("BS_INCREMENTAL_SIZE_LIMIT", str(2**30)))
+BS_INCREMENTAL_DIRECTORY = Path(
+    os.getenv("BS_INCREMENTAL_DIRECTORY", "./cache/bs_incremental")
+)
+
+BSResults = Dict[str, Tuple[pd.DataFrame, Dict[str, pd.DataFrame], pd.DataFrame]]
+
+
+def _get_watermark(bs_results: BSResults) -> pd.Timestamp:
+    """Most recent update date of the lines of preprocessed 'bordereaux' data (outliers included)."""
+
+    watermarks = []
+    for df, date_outliers, quantity_outliers in bs_results.values():
+        for data in [df, quantity_outliers, *date_outliers.values()]:
+            if len(data) > 0 and WATERMARK_COLUMN in data.columns:
+                updated_at = pd.to_datetime(
+                    data[WATERMARK_COLUMN], errors="coerce", utc=True
+                )
+                watermarks.append(updated_at.max())
+
+    watermarks = [e for e in watermarks if not pd.isna(e)]
+
+    return max(watermarks) if len(watermarks) else None
+
+
+def _get_database_now() -> pd.Timestamp:
+    """Current date of the database, whose clock sets the update dates of the lines."""
+
+    now = make_query("get_database_now", use_cache=False)["now"]
+    return pd.to_datetime(now, utc=True).iloc[0]
+
+
+def _drop_lines(df: pd.DataFrame, ids: pd.Series, min_created_at: pd.Timestamp):
+    """Drops the lines with one of the given ids or created before `min_created_at`."""
+
+    if len(df) == 0:
+        return df
+
+    created_at = pd.to_datetime(df["createdAt"], errors="coerce", utc=True)
+    return df[~df["id"].isin(ids) & ~(created_at < min_created_at)]
+
+
+def _concat(dfs: List[pd.DataFrame]) -> pd.DataFrame:
+    non_empty_dfs = [df for df in dfs if len(df) > 0]
+    if len(non_empty_dfs) == 0:
+        return dfs[-1]
+    if len(non_empty_dfs) == 1:
+        return non_empty_dfs[0]
+    return concat_bs_data(non_empty_dfs)
+
+
+def merge_bs_results(
+    bs_results: BSResults,
+    updated_bs_results: BSResults,
+    updated_ids: pd.DataFrame,
+    min_created_at: pd.Timestamp,
+) -> BSResults:
+    """Upserts the preprocessed updated lines into previously preprocessed 'bordereaux' data.
+
+    Parameters
+    ----------
+    bs_results : dict
+        Previous preprocessed data (see `get_preprocessed_bs_data`).
+    updated_bs_results : dict
+        Preprocessed data of the lines updated since the previous data.
+    updated_ids : DataFrame
+        `bs_type` and `id` of all the lines updated since the previous data.
+    min_created_at : Timestamp
+        Lines created before this date are dropped.
+
+    Returns
+    -------
+    dict
+        Up to date preprocessed data, with the same structure as `bs_results`.
+    """
+
+    merged_results = {}
+    for bs_type in dict.fromkeys([*bs_results, *updated_bs_results]):
+        df, date_outliers, quantity_outliers = bs_results.get(
+            bs_type, (pd.DataFrame(), {}, pd.DataFrame())
+        )
+        (
+            updated_df,
+            updated_date_outliers,
+            updated_quantity_outliers,
+        ) = updated_bs_results.get(bs_type, (pd.DataFrame(), {}, pd.DataFrame()))
+
+        # The updated lines are replaced, wherever they were (including outliers)
+        ids = pd.concat(
+            [
+                updated_ids.loc[updated_ids["bs_type"] == bs_type, "id"],
+                *[
+                    data["id"]
+                    for data in [
+                        updated_df,
+                        updated_quantity_outliers,
+                        *updated_date_outliers.values(),
+                    ]
+                    if len(data) > 0
+                ],
+            ]
+        )
+
+        df = _concat([_drop_lines(df, ids, min_created_at), updated_df])
+        if len(df) > 0:
+            df = df.sort_values("createdAt", kind="stable").reset_index(drop=True)
+
+        quantity_outliers = _concat(
+            [
+                _drop_lines(quantity_outliers, ids, min_created_at),
+                updated_quantity_outliers,
+            ]
+        )
+
+        merged_date_outliers = {}
+        for colname in dict.fromkeys([*date_outliers, *updated_date_outliers]):
+            outliers_df = _concat(
+                [
+                    _drop_lines(
+                        date_outliers.get(colname, pd.DataFrame()), ids, min_created_at
+                    ),
+                    updated_date_outliers.get(colname, pd.DataFrame()),
+                ]
+            )
+            if len(outliers_df) > 0:
+                merged_date_outliers[colname] = outliers_df
+
+        merged_results[bs_type] = (df, merged_date_outliers, quantity_outliers)
+
+    return merged_results
+
+
+class BSIncrementalStore:
+    """Preprocessed 'bordereaux' data kept by SIRET and query, refreshed incrementally.
+
+    Parameters
+    ----------
+    backend: MemoryCacheBackend or DiskCacheBackend
+        Storage of the preprocessed data.
+    max_age: int
+        Time (in seconds) after which the data is fully fetched again.
+    watermark_overlap: int
+        Margin (in seconds) subtracted from the high-water mark when fetching the updated lines.
+    """
+
+    def __init__(self, backend, max_age: int, watermark_overlap: int) -> None:
+        self.backend = backend
+        self.max_age = max_age
+        self.watermark_overlap = watermark_overlap
+
+    def get_bs_data(
+        self,
+        sql_query_name: str,
+        siret: str,
+        bs_type: str = None,
+        chunksize: int = None,
+        columns: List[str] = None,
+    ) -> BSResults:
+        """Returns the preprocessed 'bordereaux' data of the SIRET, with the same arguments
+        and result as `get_preprocessed_bs_data`.
+        Only the lines updated since the previous call are fetched and preprocessed.
+        """
+
+        if columns is not None:
+            columns = [*columns, WATERMARK_COLUMN]
+
+        # Data kept with other dtypes can't be merged with the updated lines
+        key = (
+            "bs_incremental",
+            sql_query_name,
+            siret,
+            bs_type,
+            repr(columns),
+            BS_COMPACT_DTYPES,
+        )
+        now = pd.Timestamp.now(tz="UTC")
+        # Same window as the queries (`current_date - interval '1 year'`)
+        min_created_at = now.normalize() - pd.DateOffset(years=1)
+
+        state = self.backend.get(key)
+        if state is None:
+            bs_results = get_preprocessed_bs_data(
+                sql_query_name,
+                bs_type=bs_type,
+                chunksize=chunksize,
+                columns=columns,
+                siret=siret,
+            )
+            watermark = _get_watermark(bs_results)
+            if watermark is None:
+                # Without any line, the lines updated from now on will be fetched next time
+                watermark = _get_database_now()
+            self.backend.set(
+                key,
+                {
+                    "bs_results": bs_results,
+                    "watermark": watermark,
+                    "fetched_at": now,
+                },
+                self.max_age,
+            )
+            return bs_results
+
+        updated_since = (
+            (state["watermark"] - pd.Timedelta(seconds=self.watermark_overlap))
+            .tz_convert("UTC")
+            .tz_localize(None)
+            .to_pydatetime()
+        )
+
+        updated_ids = make_query(
+            "get_bs_updated_ids", updated_since=updated_since, siret=siret
+        )
+        updated_bs_results = {}
+        if len(updated_ids) > 0:
+            updated_bs_results = get_preprocessed_bs_data(
+                sql_query_name,
+                bs_type=bs_type,
+                columns=columns,
+                updated_since=updated_since,
+                siret=siret,
+            )
+
+        bs_results = merge_bs_results(
+            state["bs_results"], updated_bs_results, updated_ids, min_created_at
+        )
+
+        watermark = state["watermark"]
+        if len(updated_ids) > 0:
+            watermark = max(watermark, updated_ids[WATERMARK_COLUMN].max())
+
+        # The data expires `max_age` after the last full fetch, not after the last refresh
+        ttl = self.max_age - (now - state["fetched_at"]).total_seconds()
+        if ttl >= 1:
+            self.backend.set(
+                key,
+                {
+                    "bs_results": bs_results,
+                    "watermark": watermark,
+                    "fetched_at": state["fetched_at"],
+                },
+                int(ttl),
+            )
+
+        return bs_results
+
+
+def create_bs_incremental_store(backend_name: str) -> BSIncrementalStore:
+    """Create the store of the incremental refresh with the given backend, using the module configuration.
+
+    Parameters
+    ----------
+    backend_name : str
+        "memory", "disk", or an empty string to disable the incremental refresh.
+
+    Returns
+    -------
+    BSIncrementalStore
+        The store, or None if the incremental refresh is disabled.
+    """
+
+    if not backend_name:
+        return None
+
+    if backend_name == "memory":
+        backend = MemoryCacheBackend(BS_INCREMENTAL_MAX_ENTRIES)
+    elif backend_name == "disk":
+        backend = DiskCacheBackend(BS_INCREMENTAL_DIRECTORY, BS_INCREMENTAL_SIZE_LIMIT)
+    else:
+        raise ValueError(
+            "BS_INCREMENTAL_BACKEND must be either 'memory', 'disk' or empty"
+        )
+
+    return BSIncrementalStore(
+        backend, BS_INCREMENTAL_MAX_AGE, BS_INCREMENTAL_WATERMARK_OVERLAP
+    )
+
+
+BS_INCREMENTAL_STORE = create_bs_incremental_store(BS_INCREMENTAL_BACKEND)
@@ -0,0 +1,310 @@
+"""
+Local stand-in for the production databases, to run the data layer without PostgreSQL (benchmarks, profiling, CI).
+
+The stand-in is a set of SQLite files in a directory, one per PostgreSQL schema used by the SQL templates
+(`default$default` for the Trackdéchets tables, `refined_zone_icpe` for the DWH ICPE table),
+attached to each connection under the schema name so that the SQL templates run unchanged.
+The few PostgreSQL constructs used by the templates are handled by a dialect shim :
+- `substring(x from 'pattern')` and `date_trunc('month', x)` are rewritten or emulated with Python functions ;
+- `current_date - interval '1 year'` is rewritten as `date('now', '-1 year')` ;
+- `now()` is emulated (UTC) ;
+- dates given as parameters are bound as ISO strings, the format dates are stored in.
+`filter (where ...)` and `true`/`false` are natively supported by SQLite, `set_config`, `pg_cancel_backend`
+and prepared statements are only used with PostgreSQL.
+
+The tables only have the columns used by the SQL templates, see `LOCAL_SCHEMA`.
+"""
+import re
+from datetime import date, datetime, timezone
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.data.connections import create_managed_engine
+
+SUBSTRING_FROM_PATTERN = re.compile(
+    r"substring\(\s*(.+?)\s+from\s+('(?:[^']|'')*')\s*\)", re.IGNORECASE
+)
+CURRENT_DATE_INTERVAL_PATTERN = re.compile(
+    r"current_date\s*-\s*interval\s*'(\d+)\s+(\w+)'", re.IGNORECASE
+)
+
+# Columns of the 'bordereaux' tables shared by all the types
+_BS_COMMON_COLUMNS = {
+    "id": "text",
+    "createdAt": "timestamp",
+    "updatedAt": "timestamp",
+    "isDeleted": "boolean",
+    "status": "text",
+    "emitterCompanySiret": "text",
+    "emitterCompanyAddress": "text",
+}
+_BS_DESTINATION_COLUMNS = {
+    "destinationCompanySiret": "text",
+    "destinationReceptionDate": "timestamp",
+    "wasteCode": "text",
+    "destinationOperationCode": "text",
+}
+_RECEIPT_COLUMNS = {
+    "id": "text",
+    "receiptNumber": "text",
+    "validityLimit": "timestamp",
+    "department": "text",
+}
+_REVISION_REQUEST_COLUMNS = {
+    "id": "text",
+    "authoringCompanyId": "text",
+    "status": "text",
+    "createdAt": "timestamp",
+}
+
+# Tables of the stand-in, by (schema, table), with the columns used by the SQL templates and their types
+LOCAL_SCHEMA: Dict[tuple, Dict[str, str]] = {
+    ("default$default", "Form"): {
+        **_BS_COMMON_COLUMNS,
+        "sentAt": "timestamp",
+        "receivedAt": "timestamp",
+        "processedAt": "timestamp",
+        "recipientCompanySiret": "text",
+        "wasteDetailsQuantity": "double precision",
+        "quantityReceived": "double precision",
+        "wasteDetailsCode": "text",
+        "processingOperationDone": "text",
+        "transporterTransportMode": "text",
+        "noTraceability": "boolean",
+        "wasteDetailsPop": "boolean",
+    },
+    ("default$default", "Bsda"): {
+        **_BS_COMMON_COLUMNS,
+        **_BS_DESTINATION_COLUMNS,
+        "transporterTransportTakenOverAt": "timestamp",
+        "destinationOperationDate": "timestamp",
+        "weightValue": "double precision",
+        "destinationReceptionWeight": "double precision",
+        "transporterTransportMode": "text",
+        "wastePop": "boolean",
+    },
+    ("default$default", "Bsff"): {
+        **_BS_COMMON_COLUMNS,
+        **_BS_DESTINATION_COLUMNS,
+        "transporterTransportTakenOverAt": "timestamp",
+        "destinationOperationSignatureDate": "timestamp",
+        "weightValue": "double precision",
+        "destinationReceptionWeight": "double precision",
+        "transporterTransportMode": "text",
+    },
+    ("default$default", "Bsdasri"): {
+        **_BS_COMMON_COLUMNS,
+        **_BS_DESTINATION_COLUMNS,
+        "transporterTakenOverAt": "timestamp",
+        "destinationOperationSignatureDate": "timestamp",
+        "emitterWasteWeightValue": "double precision",
+        "destinationReceptionWasteWeightValue": "double precision",
+        "transporterTransportMode": "text",
+    },
+    ("default$default", "Bsvhu"): {
+        **_BS_COMMON_COLUMNS,
+        **_BS_DESTINATION_COLUMNS,
+        "transporterTransportTakenOverAt": "timestamp",
+        "destinationOperationSignatureDate": "timestamp",
+        "weightValue": "double precision",
+        "destinationReceptionWeight": "double precision",
+    },
+    ("default$default", "Company"): {
+        "id": "text",
+        "createdAt": "timestamp",
+        "siret": "text",
+        "name": "text",
+        "address": "text",
+        # PostgreSQL array, stored in its text representation ("{PRODUCER,TRANSPORTER}")
+        "companyTypes": "text",
+        "transporterReceiptId": "text",
+        "traderReceiptId": "text",
+        "ecoOrganismeAgreements": "text",
+        "brokerReceiptId": "text",
+        "vhuAgrementDemolisseurId": "text",
+        "vhuAgrementBroyeurId": "text",
+    },
+    ("default$default", "TransporterReceipt"): _RECEIPT_COLUMNS,
+    ("default$default", "TraderReceipt"): _RECEIPT_COLUMNS,
+    ("default$default", "BrokerReceipt"): _RECEIPT_COLUMNS,
+    ("default$default", "VhuAgrement"): {
+        "id": "text",
+        "agrementNumber": "text",
+        "department": "text",
+    },
+    ("default$default", "BsddRevisionRequest"): {
+        **_REVISION_REQUEST_COLUMNS,
+        "bsddId": "text",
+    },
+    ("default$default", "BsdaRevisionRequest"): {
+        **_REVISION_REQUEST_COLUMNS,
+        "bsdaId": "text",
+    },
+    ("refined_zone_icpe", "icpe_siretise"): {
+        "siret_clean": "text",
+        "code_s3ic": "text",
+        "id_nomenclature": "text",
+        "date_debut_exploitation": "timestamp",
+        "date_fin_validite": "timestamp",
+        "volume": "double precision",
+        "unite": "text",
+        "rubrique": "text",
+        "alinea": "text",
+        "libelle_court_activite": "text",
+        "en_vigueur": "boolean",
+        "id_regime": "text",
+    },
+}
+
+# Indexes of the stand-in, by (schema, table), like the ones of the production databases
+LOCAL_INDEXES: Dict[tuple, list] = {
+    **{
+        ("default$default", table): [
+            "emitterCompanySiret",
+            "recipientCompanySiret" if table == "Form" else "destinationCompanySiret",
+        ]
+        for table in ["Form", "Bsda", "Bsff", "Bsdasri", "Bsvhu"]
+    },
+    ("default$default", "Company"): ["siret"],
+    ("default$default", "BsddRevisionRequest"): ["authoringCompanyId"],
+    ("default$default", "BsdaRevisionRequest"): ["authoringCompanyId"],
+    ("refined_zone_icpe", "icpe_siretise"): ["siret_clean"],
+}
+
+LOCAL_SCHEMAS_NAMES = tuple(dict.fromkeys(schema for schema, _ in LOCAL_SCHEMA))
+
+
+@lru_cache(maxsize=None)
+def _compile_pattern(pattern: str) -> re.Pattern:
+    return re.compile(pattern)
+
+
+def _regexp_substr(value: Optional[str], pattern: str) -> Optional[str]:
+    """Emulates PostgreSQL `substring(value from pattern)` (pattern without capturing group)."""
+
+    if value is None:
+        return None
+    match = _compile_pattern(pattern).search(value)
+    return match.group(0) if match else None
+
+
+def _date_trunc(unit: str, value: Optional[str]) -> Optional[str]:
+    """Emulates PostgreSQL `date_trunc` on the ISO strings the dates are stored as."""
+
+    if value is None:
+        return None
+
+    timestamp = datetime.fromisoformat(value)
+    if unit == "year":
+        timestamp = timestamp.replace(month=1, day=1)
+    elif unit == "month":
+        timestamp = timestamp.replace(day=1)
+    elif unit != "day":
+        raise ValueError(f"date_trunc unit {unit} is not supported")
+
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0).isoformat(
+        sep=" "
+    )
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).replace(tzinfo=None).isoformat(sep=" ")
+
+
+@lru_cache(maxsize=1024)
+def translate_statement(statement: str) -> str:
+    """Rewrites the PostgreSQL constructs of the SQL templates that SQLite does not understand."""
+
+    statement = SUBSTRING_FROM_PATTERN.sub(r"regexp_substr(\1, \2)", statement)
+    statement = CURRENT_DATE_INTERVAL_PATTERN.sub(r"date('now', '-\1 \2')", statement)
+    return statement
+
+
+def _adapt_parameter(value: Any) -> Any:
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat(sep=" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _before_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+) -> tuple:
+    statement = translate_statement(statement)
+    if executemany:
+        parameters = [tuple(map(_adapt_parameter, e)) for e in parameters]
+    elif parameters:
+        parameters = tuple(map(_adapt_parameter, parameters))
+    return statement, parameters
+
+
+def _on_connect(dbapi_connection, connection_record, directory: Path) -> None:
+    for schema in LOCAL_SCHEMAS_NAMES:
+        dbapi_connection.execute(
+            f'attach database ? as "{schema}"', (str(directory / f"{schema}.sqlite"),)
+        )
+
+    dbapi_connection.create_function(
+        "regexp_substr", 2, _regexp_substr, deterministic=True
+    )
+    dbapi_connection.create_function("date_trunc", 2, _date_trunc, deterministic=True)
+    dbapi_connection.create_function("now", 0, _now)
+
+
+def create_local_schema(engine: Engine) -> None:
+    """Creates the tables and indexes of the stand-in that do not exist yet."""
+
+    with engine.begin() as connection:
+        for (schema, table), columns in LOCAL_SCHEMA.items():
+            columns_definition = ", ".join(
+                f'"{column}" {type_}' for column, type_ in columns.items()
+            )
+            connection.exec_driver_sql(
+                f'create table if not exists "{schema}"."{table}"'
+                f" ({columns_definition})"
+            )
+        for (schema, table), columns in LOCAL_INDEXES.items():
+            for column in columns:
+                connection.exec_driver_sql(
+                    f'create index if not exists "{schema}"."{table}_{column}"'
+                    f' on "{table}" ("{column}")'
+                )
+
+
+def create_local_engine(name: str, directory: Path, env_prefix: str) -> Engine:
+    """Create an engine on the local stand-in databases of the directory, with their schema.
+
+    Parameters
+    ----------
+    name : str
+        Name of the engine, used for logging and telemetry.
+    directory : Path
+        Directory of the SQLite files (one per schema), created if needed.
+    env_prefix : str
+        Prefix of the environment variables holding the pool configuration (see `create_managed_engine`).
+
+    Returns
+    -------
+    Engine
+        The SQLAlchemy engine.
+    """
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    engine = create_managed_engine(
+        name, f"sqlite:///{directory / f'{name}.sqlite'}", env_prefix
+    )
+    event.listen(engine, "connect", partial(_on_connect, directory=directory))
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute, retval=True)
+
+    create_local_schema(engine)
+
+    return engine
@@ -0,0 +1,173 @@
+"""
+Instrumentation of the data layer, exposed in the Prometheus text format (prometheus_client).
+
+For each SQL template and engine, `make_query` records its latency, the number of rows
+and the memory size of the resulting DataFrame, and the number of errors.
+The connection pools (`app.data.connections`) and the query cache (`app.data.cache`) record their statistics
+as they change.
+
+With several worker processes (gunicorn), `PROMETHEUS_MULTIPROC_DIR` must be set to a directory shared by the workers,
+emptied at startup (see `gunicorn.conf.py`) : each worker writes its metrics there and `render_metrics` aggregates
+those of all the workers. Without it, the metrics are those of the current process only.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+
+import pandas as pd
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Directory of the metrics files of the worker processes, read by prometheus_client at import
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+# If True, the memory size of the object (str) columns is measured exactly, which is costly on large DataFrames
+METRICS_DEEP_MEMORY_USAGE = (
+    os.getenv("METRICS_DEEP_MEMORY_USAGE", "false").lower() == "true"
+)
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+ROWS_BUCKETS = (0, 10, 100, 1000, 10_000, 100_000, 1_000_000)
+BYTES_BUCKETS = (2**10, 2**14, 2**17, 2**20, 2**23, 2**26, 2**29)
+
+
+def _create_exposition_registry() -> CollectorRegistry:
+    """Registry rendered by the /metrics route : the metrics of all the workers in multiprocess mode,
+    else the default registry of the process."""
+
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return REGISTRY
+
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+# Collectors of values read when the metrics are rendered (e.g. the age of a file) are registered here,
+# they must return the same values whatever the worker rendering them
+EXPOSITION_REGISTRY = _create_exposition_registry()
+
+QUERY_DURATION = Histogram(
+    "fiche_inspection_query_duration_seconds",
+    "Duration of the SQL queries, by SQL template and engine.",
+    labelnames=("template", "engine"),
+    buckets=LATENCY_BUCKETS,
+)
+QUERY_ROWS = Histogram(
+    "fiche_inspection_query_rows",
+    "Number of rows returned by the SQL queries, by SQL template and engine.",
+    labelnames=("template", "engine"),
+    buckets=ROWS_BUCKETS,
+)
+QUERY_DATAFRAME_BYTES = Histogram(
+    "fiche_inspection_query_dataframe_bytes",
+    "Memory size of the DataFrames returned by the SQL queries, by SQL template and engine.",
+    labelnames=("template", "engine"),
+    buckets=BYTES_BUCKETS,
+)
+QUERY_ERRORS = Counter(
+    "fiche_inspection_query_errors",
+    "Number of failed SQL queries, by SQL template and engine.",
+    labelnames=("template", "engine"),
+)
+FICHE_GENERATION_DURATION = Histogram(
+    "fiche_inspection_generation_duration_seconds",
+    "Duration of the extraction and preprocessing of the data of a fiche.",
+    buckets=LATENCY_BUCKETS,
+)
+
+# Connection pools, by engine (gauges are summed over the live workers)
+POOL_SIZE = Gauge(
+    "fiche_inspection_pool_pool_size",
+    "Number of connections kept in the pool.",
+    labelnames=("engine",),
+    multiprocess_mode="livesum",
+)
+POOL_CHECKED_OUT = Gauge(
+    "fiche_inspection_pool_checked_out",
+    "Number of connections in use.",
+    labelnames=("engine",),
+    multiprocess_mode="livesum",
+)
+POOL_OVERFLOW = Gauge(
+    "fiche_inspection_pool_overflow",
+    "Number of connections beyond the pool size.",
+    labelnames=("engine",),
+    multiprocess_mode="livesum",
+)
+POOL_CHECKOUTS = Counter(
+    "fiche_inspection_pool_checkouts",
+    "Number of checked out connections.",
+    labelnames=("engine",),
+)
+POOL_CHECKOUT_WAIT = Counter(
+    "fiche_inspection_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection.",
+    labelnames=("engine",),
+)
+POOL_SATURATED_CHECKOUTS = Counter(
+    "fiche_inspection_pool_saturated_checkouts",
+    "Checkouts requested while all the connections were in use.",
+    labelnames=("engine",),
+)
+POOL_EXHAUSTED_CHECKOUTS = Counter(
+    "fiche_inspection_pool_exhausted_checkouts",
+    "Checkouts that failed on pool timeout.",
+    labelnames=("engine",),
+)
+
+# Query cache, by SQL template
+QUERY_CACHE_HITS = Counter(
+    "fiche_inspection_query_cache_hits",
+    "Number of query cache hits, by SQL template.",
+    labelnames=("template",),
+)
+QUERY_CACHE_MISSES = Counter(
+    "fiche_inspection_query_cache_misses",
+    "Number of query cache misses, by SQL template.",
+    labelnames=("template",),
+)
+
+
+@contextmanager
+def track_query(sql_query_name: str, engine: str) -> Iterator[None]:
+    """Records the duration of the enclosed query, and counts it as an error if an exception is raised."""
+
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        QUERY_ERRORS.labels(template=sql_query_name, engine=engine).inc()
+        raise
+    finally:
+        QUERY_DURATION.labels(template=sql_query_name, engine=engine).observe(
+            time.perf_counter() - start
+        )
+
+
+def get_dataframe_memory_usage(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=METRICS_DEEP_MEMORY_USAGE).sum())
+
+
+def record_query_result(
+    sql_query_name: str, engine: str, n_rows: int, n_bytes: int
+) -> None:
+    """Records the number of rows and the memory size of the result of a query."""
+    QUERY_ROWS.labels(template=sql_query_name, engine=engine).observe(n_rows)
+    QUERY_DATAFRAME_BYTES.labels(template=sql_query_name, engine=engine).observe(
+        n_bytes
+    )
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Returns the metrics in the Prometheus text exposition format, and its content type."""
+    return generate_latest(EXPOSITION_REGISTRY), CONTENT_TYPE_LATEST
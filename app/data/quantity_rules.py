@@ -0,0 +1,137 @@
+"""
+Rules identifying the 'bordereaux' with an inconsistent quantity (quantity outliers), e.g. kilograms typed as tonnes.
+
+The rules are business rules, declared as data in `QUANTITY_OUTLIERS_RULES` : each rule applies to some
+'bordereau' types and flags the lines with a quantity above its threshold, optionally only for a transport mode
+and/or some waste codes. All the rules are evaluated at once, in a single vectorized pass, on the data of one
+'bordereau' type or on the combined data of all types (with a `bs_type` column). When several rules match a line,
+the first one gives its reason code.
+"""
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Column holding the reason code of the quantity outliers (in the combined data while it is split by type,
+# then in the quantity outliers DataFrames)
+QUANTITY_OUTLIER_REASON_COLUMN = "quantityOutlierReason"
+
+# Quantity outliers rules, evaluated in this order. Keys :
+# - reason : reason code of the lines flagged by the rule ;
+# - label : description of the rule displayed in the fiche ;
+# - bs_types : 'bordereau' types the rule applies to ;
+# - column : quantity column compared to the threshold ;
+# - threshold : lines with a quantity strictly above the threshold (in tonnes) are flagged ;
+# - transport_mode (optional) : the rule only applies to this transport mode ;
+# - waste_codes (optional) : the rule only applies to these waste codes.
+QUANTITY_OUTLIERS_RULES: List[Dict[str, Any]] = [
+    {
+        "reason": "ROAD_QUANTITY_ABOVE_40T",
+        "label": "quantité reçue supérieure à 40 tonnes en transport routier",
+        "bs_types": ["BSDD", "BSDA"],
+        "column": "quantityReceived",
+        "threshold": 40,
+        "transport_mode": "ROAD",
+    },
+    {
+        "reason": "ROAD_QUANTITY_ABOVE_20T",
+        "label": "quantité reçue supérieure à 20 tonnes en transport routier",
+        "bs_types": ["BSDASRI"],
+        "column": "quantityReceived",
+        "threshold": 20,
+        "transport_mode": "ROAD",
+    },
+    {
+        "reason": "QUANTITY_ABOVE_40T",
+        "label": "quantité reçue supérieure à 40 tonnes",
+        "bs_types": ["BSVHU"],
+        "column": "quantityReceived",
+        "threshold": 40,
+    },
+    {
+        "reason": "QUANTITY_ABOVE_20T",
+        "label": "quantité reçue supérieure à 20 tonnes",
+        "bs_types": ["BSFF"],
+        "column": "quantityReceived",
+        "threshold": 20,
+    },
+]
+# Description of the rules, by reason code
+QUANTITY_OUTLIERS_LABELS = {
+    rule["reason"]: rule["label"] for rule in QUANTITY_OUTLIERS_RULES
+}
+
+
+def get_rules_columns(
+    rules: List[Dict[str, Any]] = QUANTITY_OUTLIERS_RULES,
+) -> List[str]:
+    """Columns needed to evaluate the rules."""
+
+    columns = []
+    for rule in rules:
+        columns.append(rule["column"])
+        if "transport_mode" in rule:
+            columns.append("transporterTransportMode")
+        if "waste_codes" in rule:
+            columns.append("wasteCode")
+
+    return list(dict.fromkeys(columns))
+
+
+def evaluate_quantity_rules(
+    df: pd.DataFrame,
+    bs_type: str = None,
+    rules: List[Dict[str, Any]] = QUANTITY_OUTLIERS_RULES,
+) -> pd.Series:
+    """Evaluates the quantity outliers rules on 'bordereaux' data, in a single vectorized pass.
+
+    Parameters
+    ----------
+    df : DataFrame
+        'bordereaux' data of one type, or of all types with a `bs_type` column.
+    bs_type : str
+        'bordereau' type of the data (BSDD, BSDA, BSFF, BSVHU or BSDASRI), None for the combined data.
+    rules : list of dict
+        Rules to evaluate, see `QUANTITY_OUTLIERS_RULES`.
+
+    Returns
+    -------
+    Series
+        Reason code of the first rule matching each line, None for the lines without inconsistent quantity.
+        The outliers mask is `reasons.notna()`.
+    """
+
+    conditions = []
+    reasons = []
+    bs_types_masks = {}
+    for rule in rules:
+        if bs_type is not None and bs_type not in rule["bs_types"]:
+            continue
+
+        # NaN quantities are never above the threshold
+        condition = df[rule["column"]].to_numpy(dtype=float, na_value=np.nan) > (
+            rule["threshold"]
+        )
+        if bs_type is None:
+            rule_bs_types = tuple(rule["bs_types"])
+            if rule_bs_types not in bs_types_masks:
+                bs_types_masks[rule_bs_types] = (
+                    df["bs_type"].isin(rule_bs_types).to_numpy()
+                )
+            condition &= bs_types_masks[rule_bs_types]
+        if "transport_mode" in rule:
+            condition &= (
+                df["transporterTransportMode"] == rule["transport_mode"]
+            ).to_numpy()
+        if "waste_codes" in rule:
+            condition &= df["wasteCode"].isin(rule["waste_codes"]).to_numpy()
+
+        conditions.append(condition)
+        reasons.append(rule["reason"])
+
+    return pd.Series(
+        np.select(conditions, reasons, default=None) if conditions else None,
+        index=df.index,
+        dtype=object,
+        name=QUANTITY_OUTLIER_REASON_COLUMN,
+    )
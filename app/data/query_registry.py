@@ -0,0 +1,360 @@
+"""
+Registry of the SQL templates used by `make_query`.
+
+All the `.sql` files of a directory are read, validated and compiled once (at startup for `app/data/sql/`),
+so that no file is read on the hot path and a broken template is detected before serving any request.
+For each template, the registry records :
+- its named bind parameters (`:param_name`), checked against the parameters given at each call ;
+- the engine it runs on, its result columns, the dtypes/date columns to apply to them
+  and its class of statement timeout, declared in `QUERY_TEMPLATES_SPECS`.
+Templates with declared columns can also be queried for a subset of their columns (projection),
+and, if they return the `updatedAt` column, for the lines updated since a given date only (incremental query).
+"""
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
+
+from app.data.utils import BS_TYPES_MISSING_COLUMNS
+
+# Same pattern as the one used by SQLAlchemy to find bind parameters in `text()` constructs
+BIND_PARAMS_PATTERN = re.compile(r"(?<![:\w\x5c]):(\w+)(?!:)")
+# Trailing ORDER BY clause of a query (no parenthesis after it, so not in a subquery)
+ORDER_BY_PATTERN = re.compile(r"\border\s+by\s+([^()]+?)\s*;?\s*$", re.IGNORECASE)
+
+ENGINES_NAMES = ("db-prod", "dwh")
+
+# Classes of statement timeout, the 'bordereaux' queries of big establishments are allowed to run longer
+# and exports (snapshots) are not meant to be bounded
+TIMEOUT_CLASSES = ("default", "bordereaux", "export")
+
+ICPE_COLUMNS = [
+    "code_s3ic",
+    "id_nomenclature",
+    "date_debut_exploitation",
+    "date_fin_validite",
+    "volume",
+    "unite",
+    "rubrique",
+    "alinea",
+    "libelle_court_activite",
+]
+ICPE_DATE_COLUMNS = ["date_debut_exploitation", "date_fin_validite"]
+
+# Column with the last update date of the lines, used by incremental queries
+WATERMARK_COLUMN = "updatedAt"
+
+BS_COLUMNS = [
+    "id",
+    "createdAt",
+    "updatedAt",
+    "sentAt",
+    "receivedAt",
+    "processedAt",
+    "emitterCompanySiret",
+    "emitterCompanyAddress",
+    "emitterCompanyPostalCode",
+    "recipientCompanySiret",
+    "wasteDetailsQuantity",
+    "quantityReceived",
+    "wasteCode",
+    "processing_operation_code",
+    "status",
+    "transporterTransportMode",
+    "noTraceability",
+    "wastePop",
+]
+
+# Dates are kept as returned by the driver : they are parsed, and the outliers flagged, by the preprocessing
+# (see `app.data.utils.get_outliers_datetimes_df`)
+BS_DTYPES = {
+    "id": str,
+    "emitterCompanySiret": str,
+    "emitterCompanyAddress": str,
+    "recipientCompanySiret": str,
+    "wasteDetailsQuantity": float,
+    "quantityReceived": float,
+    "wasteCode": str,
+    "status": str,
+}
+
+BS_DATA_SQL_FILES = {
+    "BSDD": "get_bsdd_data",
+    "BSDA": "get_bsda_data",
+    "BSFF": "get_bsff_data",
+    "BSDASRI": "get_bsdasri_data",
+    "BSVHU": "get_bsvhu_data",
+}
+
+# Engine, result columns, dtypes and date columns of each SQL template
+QUERY_TEMPLATES_SPECS: Dict[str, Dict[str, Any]] = {
+    "get_company_data": {
+        "columns": [
+            "id",
+            "createdAt",
+            "siret",
+            "name",
+            "address",
+            "companyTypes",
+            "transporterReceiptId",
+            "traderReceiptId",
+            "ecoOrganismeAgreements",
+            "brokerReceiptId",
+            "vhuAgrementDemolisseurId",
+            "vhuAgrementBroyeurId",
+        ],
+        "date_columns": ["createdAt"],
+    },
+    "get_receipts_agreements_data": {
+        "columns": [
+            "receiptType",
+            "id",
+            "receiptNumber",
+            "validityLimit",
+            "department",
+        ],
+        "date_columns": ["validityLimit"],
+    },
+    "get_icpe_data": {
+        "engine": "dwh",
+        "columns": ICPE_COLUMNS,
+        "date_columns": ICPE_DATE_COLUMNS,
+    },
+    "get_icpe_snapshot_data": {
+        "engine": "dwh",
+        "columns": ["siret_clean", *ICPE_COLUMNS],
+        "date_columns": ICPE_DATE_COLUMNS,
+        "timeout_class": "export",
+    },
+    **{
+        sql_file: {
+            "columns": [
+                column
+                for column in BS_COLUMNS
+                if column not in BS_TYPES_MISSING_COLUMNS[bs_type]
+            ],
+            "dtypes": BS_DTYPES,
+            "timeout_class": "bordereaux",
+        }
+        for bs_type, sql_file in BS_DATA_SQL_FILES.items()
+    },
+    "get_bs_data": {
+        "columns": ["bs_type", *BS_COLUMNS],
+        "dtypes": {"bs_type": str, **BS_DTYPES},
+        "timeout_class": "bordereaux",
+    },
+    "get_bs_updated_ids": {
+        "columns": ["bs_type", "id", "updatedAt"],
+        "date_columns": ["updatedAt"],
+    },
+    "get_database_now": {
+        "columns": ["now"],
+        "date_columns": ["now"],
+    },
+    "get_bs_revised_data": {
+        "columns": ["bs_type", "id", "bsId", "createdAt"],
+        "date_columns": ["createdAt"],
+        "dtypes": {"bs_type": str, "id": str, "bsId": str},
+    },
+}
+
+
+class QueryTemplateError(ValueError):
+    """Raised when a SQL template is invalid or called with wrong parameters."""
+
+
+class QueryTemplate:
+    """SQL template loaded in memory, with its bind parameters and its result description.
+
+    Parameters
+    ----------
+    name : str
+        Name of the template (name of the sql file without the .sql extension).
+    sql : str
+        SQL query with named bind parameters (`:param_name`).
+    engine : str
+        Name of the engine the query runs on ("db-prod" or "dwh").
+    columns : list of str
+        Result columns of the query, None if not declared.
+    date_columns : list of str
+        Names of columns to parse as dates by default.
+    dtypes : dict
+        Dict mapping column name to corresponding dtype, applied by default.
+    timeout_class : str
+        Class of the query, that sets its statement timeout ("default", "bordereaux" or "export").
+    """
+
+    def __init__(
+        self,
+        name: str,
+        sql: str,
+        engine: str = "db-prod",
+        columns: List[str] = None,
+        date_columns: List[str] = None,
+        dtypes: Dict[str, Any] = None,
+        timeout_class: str = "default",
+    ) -> None:
+        self.name = name
+        self.sql = sql
+        self.engine = engine
+        self.columns = columns
+        self.date_columns = date_columns
+        self.dtypes = dtypes
+        self.timeout_class = timeout_class
+
+        # Parameters in order of first appearance
+        self.params = tuple(dict.fromkeys(BIND_PARAMS_PATTERN.findall(sql)))
+        self.statement: TextClause = text(sql)
+
+        # Projections already built, by tuple of columns and incremental flag
+        self._projections: Dict[
+            Tuple[Tuple[str, ...], bool], Tuple[str, TextClause]
+        ] = {}
+
+        self.validate()
+
+    def validate(self) -> None:
+        """Checks the consistency of the template with its declared result description."""
+
+        if not self.sql.strip():
+            raise QueryTemplateError(f"SQL template {self.name} is empty")
+
+        if self.engine not in ENGINES_NAMES:
+            raise QueryTemplateError(
+                f"SQL template {self.name} : engine must be one of {ENGINES_NAMES}"
+            )
+
+        if self.timeout_class not in TIMEOUT_CLASSES:
+            raise QueryTemplateError(
+                f"SQL template {self.name} : timeout class must be one of {TIMEOUT_CLASSES}"
+            )
+
+        if self.columns is None:
+            return
+
+        for column in self.columns:
+            if not re.search(
+                rf'(?<![\w$"])"?{re.escape(column)}"?(?![\w$"])', self.sql
+            ):
+                raise QueryTemplateError(
+                    f"SQL template {self.name} : column {column} not found in the query"
+                )
+
+        for column in [*(self.date_columns or []), *(self.dtypes or {})]:
+            if column not in self.columns:
+                raise QueryTemplateError(
+                    f"SQL template {self.name} : {column} is not a result column"
+                )
+
+    def get_projection(
+        self, columns: List[str] = None, incremental: bool = False
+    ) -> Tuple[str, TextClause]:
+        """Returns the SQL query (and its compiled statement) selecting only the given result columns.
+
+        Parameters
+        ----------
+        columns : list of str
+            Result columns to select, they must be declared columns of the template.
+            All the declared columns if None.
+        incremental : bool
+            If True, only the lines updated after the `:updated_since` bind parameter are selected.
+
+        Returns
+        -------
+        tuple
+            SQL query and corresponding `text()` statement.
+        """
+
+        if self.columns is None:
+            raise QueryTemplateError(
+                f"SQL template {self.name} has no declared columns to project"
+            )
+        if columns is None:
+            columns = self.columns
+
+        key = (tuple(columns), incremental)
+        projection = self._projections.get(key)
+        if projection is not None:
+            return projection
+
+        unknown_columns = [column for column in columns if column not in self.columns]
+        if unknown_columns:
+            raise QueryTemplateError(
+                f"SQL template {self.name} : unknown columns {unknown_columns}"
+            )
+
+        # PostgreSQL does not flatten a subquery with an ORDER BY, so the ORDER BY of the template
+        # is moved to the projection query : the planner can then pull the subquery up, unused
+        # columns are neither computed nor sent and the incremental condition is pushed down
+        # to the tables
+        order_by = ORDER_BY_PATTERN.search(self.sql)
+        inner_sql = self.sql if order_by is None else self.sql[: order_by.start()]
+        selected_columns = ", ".join(f'"{column}"' for column in columns)
+        sql = f"select {selected_columns} from (\n{inner_sql.rstrip()}\n) as projected"
+        if incremental:
+            if WATERMARK_COLUMN not in self.columns:
+                raise QueryTemplateError(
+                    f"SQL template {self.name} has no {WATERMARK_COLUMN} column"
+                )
+            sql += f'\nwhere "{WATERMARK_COLUMN}" > :updated_since'
+        if order_by is not None:
+            sql += f"\norder by {order_by.group(1)}"
+        projection = (sql, text(sql))
+        self._projections[key] = projection
+
+        return projection
+
+    def check_params(self, query_params: Dict[str, Any]) -> None:
+        """Checks that the given parameters are exactly the bind parameters of the template."""
+
+        missing = set(self.params) - set(query_params)
+        unexpected = set(query_params) - set(self.params)
+        if missing or unexpected:
+            raise QueryTemplateError(
+                f"SQL template {self.name} expects parameters {list(self.params)},"
+                f" missing : {sorted(missing)}, unexpected : {sorted(unexpected)}"
+            )
+
+
+class QueryRegistry:
+    """Set of SQL templates, by name.
+
+    Parameters
+    ----------
+    specs : dict
+        Result description (engine, columns, date_columns, dtypes, timeout_class) by template name,
+        templates without description get the default ones.
+    """
+
+    def __init__(self, specs: Dict[str, Dict[str, Any]]) -> None:
+        self.specs = specs
+        self.templates: Dict[str, QueryTemplate] = {}
+
+    def load(self, directory: Path) -> None:
+        """Loads and validates all the `.sql` files of the directory.
+
+        Raises
+        ------
+        QueryTemplateError
+            If a template is invalid, or if a described template has no sql file.
+        """
+
+        for path in sorted(directory.glob("*.sql")):
+            self.register(path.stem, path.read_text())
+
+        for name in self.specs:
+            if name not in self.templates:
+                raise QueryTemplateError(f"SQL template {name} has no sql file")
+
+    def register(self, name: str, sql: str) -> QueryTemplate:
+        template = QueryTemplate(name, sql, **self.specs.get(name, {}))
+        self.templates[name] = template
+        return template
+
+    def get(self, name: str) -> QueryTemplate:
+        try:
+            return self.templates[name]
+        except KeyError:
+            raise QueryTemplateError(f"Unknown SQL template {name}") from None
@@ -0,0 +1,147 @@
+select
+    'BSDD' as bs_type,
+    id,
+    "createdAt",
+    "updatedAt",
+    "sentAt",
+    "receivedAt",
+    "processedAt",
+    "emitterCompanySiret",
+    "emitterCompanyAddress",
+    substring("emitterCompanyAddress" from '[0-9]{5}') as "emitterCompanyPostalCode",
+    "recipientCompanySiret",
+    "wasteDetailsQuantity",
+    "quantityReceived",
+    "wasteDetailsCode" as "wasteCode",
+    "processingOperationDone" as "processing_operation_code",
+    cast("status" as text) as "status",
+    cast("transporterTransportMode" as text) as "transporterTransportMode",
+    "noTraceability",
+    "wasteDetailsPop" as "wastePop"
+from
+    "default$default"."Form"
+where
+    ("emitterCompanySiret" = :siret
+    or "recipientCompanySiret" = :siret)
+    and "isDeleted" = false
+    and "createdAt" >= current_date - INTERVAL '1 year'
+    and cast("status" as text) not in ('DRAFT', 'INITIAL', 'SIGNED_BY_WORKER')
+union all
+select
+    'BSDA' as bs_type,
+    id,
+    "createdAt",
+    "updatedAt",
+    "transporterTransportTakenOverAt" as "sentAt",
+    "destinationReceptionDate" as "receivedAt",
+    "destinationOperationDate" as "processedAt",
+    "emitterCompanySiret",
+    "emitterCompanyAddress",
+    substring("emitterCompanyAddress" from '[0-9]{5}') as "emitterCompanyPostalCode",
+    "destinationCompanySiret" as "recipientCompanySiret",
+    "weightValue" as "wasteDetailsQuantity",
+    "destinationReceptionWeight"/1000 as "quantityReceived",
+    "wasteCode",
+    "destinationOperationCode" as "processing_operation_code",
+    cast("status" as text) as "status",
+    cast("transporterTransportMode" as text) as "transporterTransportMode",
+    cast(null as boolean) as "noTraceability",
+    "wastePop"
+from
+    "default$default"."Bsda"
+where
+    ("emitterCompanySiret" = :siret
+        or "destinationCompanySiret" = :siret)
+    and "isDeleted" = false
+    and "createdAt" >= current_date - interval '1 year'
+    and cast("status" as text) not in ('DRAFT', 'INITIAL', 'SIGNED_BY_WORKER')
+union all
+select
+    'BSFF' as bs_type,
+    id,
+    "createdAt",
+    "updatedAt",
+    "transporterTransportTakenOverAt" as "sentAt",
+    "destinationReceptionDate" as "receivedAt",
+    "destinationOperationSignatureDate" as "processedAt",
+    "emitterCompanySiret",
+    "emitterCompanyAddress",
+    substring("emitterCompanyAddress" from '[0-9]{5}') as "emitterCompanyPostalCode",
+    "destinationCompanySiret" as "recipientCompanySiret",
+    "weightValue" as "wasteDetailsQuantity",
+    "destinationReceptionWeight"/1000 as "quantityReceived",
+    "wasteCode",
+    "destinationOperationCode" as "processing_operation_code",
+    cast("status" as text) as "status",
+    cast("transporterTransportMode" as text) as "transporterTransportMode",
+    cast(null as boolean) as "noTraceability",
+    cast(null as boolean) as "wastePop"
+from
+    "default$default"."Bsff"
+where
+    ("emitterCompanySiret" = :siret
+        or "destinationCompanySiret" = :siret)
+    and "isDeleted" = false
+    and "createdAt" >= current_date - interval '1 year'
+    and cast("status" as text) not in ('DRAFT', 'INITIAL', 'SIGNED_BY_WORKER')
+union all
+select
+    'BSDASRI' as bs_type,
+    id,
+    "createdAt",
+    "updatedAt",
+    "transporterTakenOverAt" as "sentAt",
+    "destinationReceptionDate" as "receivedAt",
+    "destinationOperationSignatureDate" as "processedAt",
+    "emitterCompanySiret",
+    "emitterCompanyAddress",
+    substring("emitterCompanyAddress" from '[0-9]{5}') as "emitterCompanyPostalCode",
+    "destinationCompanySiret" as "recipientCompanySiret",
+    "emitterWasteWeightValue" as "wasteDetailsQuantity",
+    "destinationReceptionWasteWeightValue"/1000 as "quantityReceived",
+    "wasteCode",
+    "destinationOperationCode" as "processing_operation_code",
+    cast("status" as text) as "status",
+    cast("transporterTransportMode" as text) as "transporterTransportMode",
+    cast(null as boolean) as "noTraceability",
+    cast(null as boolean) as "wastePop"
+from
+    "default$default"."Bsdasri"
+where
+    ("emitterCompanySiret" = :siret
+        or "destinationCompanySiret" = :siret)
+    and "isDeleted" = false
+    and "createdAt" >= current_date - interval '1 year'
+    and cast("status" as text) not in ('DRAFT', 'INITIAL', 'SIGNED_BY_WORKER')
+union all
+select
+    'BSVHU' as bs_type,
+    id,
+    "createdAt",
+    "updatedAt",
+    "transporterTransportTakenOverAt" as "sentAt",
+    "destinationReceptionDate" as "receivedAt",
+    "destinationOperationSignatureDate" as "processedAt",
+    "emitterCompanySiret",
+    "emitterCompanyAddress",
+    substring("emitterCompanyAddress" from '[0-9]{5}') as "emitterCompanyPostalCode",
+    "destinationCompanySiret" as "recipientCompanySiret",
+    "weightValue" as "wasteDetailsQuantity",
+    "destinationReceptionWeight"/1000 as "quantityReceived",
+    "wasteCode",
+    "destinationOperationCode" as "processing_operation_code",
+    cast("status" as text) as "status",
+    cast(null as text) as "transporterTransportMode",
+    cast(null as boolean) as "noTraceability",
+    cast(null as boolean) as "wastePop"
+from
+    "default$default"."Bsvhu"
+where
+    ("emitterCompanySiret" = :siret
+        or "destinationCompanySiret" = :siret)
+    and "isDeleted" = false
+    and "createdAt" >= current_date - interval '1 year'
+    and cast("status" as text) not in ('DRAFT', 'INITIAL', 'SIGNED_BY_WORKER')
+order by
+    bs_type,
+    "createdAt" asc
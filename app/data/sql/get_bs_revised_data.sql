@@ -0,0 +1,23 @@
+select
+    'BSDD' as bs_type,
+    id,
+    "bsddId" as "bsId",
+    "createdAt"
+from
+    "default$default"."BsddRevisionRequest"
+where
+    "authoringCompanyId" = :company_id
+    and "status" = 'ACCEPTED'
+    and "createdAt" >= current_date - interval '1 year'
+union all
+select
+    'BSDA' as bs_type,
+    id,
+    "bsdaId" as "bsId",
+    "createdAt"
+from
+    "default$default"."BsdaRevisionRequest"
+where
+    "authoringCompanyId" = :company_id
+    and "status" = 'ACCEPTED'
+    and "createdAt" >= current_date - interval '1 year'
@@ -0,0 +1,49 @@
+select
+    'BSDD' as bs_type,
+    id,
+    "updatedAt"
+from
+    "default$default"."Form"
+where
+    "emitterCompanySiret" = :siret
+    or "recipientCompanySiret" = :siret
+union all
+select
+    'BSDA' as bs_type,
+    id,
+    "updatedAt"
+from
+    "default$default"."Bsda"
+where
+    "emitterCompanySiret" = :siret
+    or "destinationCompanySiret" = :siret
+union all
+select
+    'BSFF' as bs_type,
+    id,
+    "updatedAt"
+from
+    "default$default"."Bsff"
+where
+    "emitterCompanySiret" = :siret
+    or "destinationCompanySiret" = :siret
+union all
+select
+    'BSDASRI' as bs_type,
+    id,
+    "updatedAt"
+from
+    "default$default"."Bsdasri"
+where
+    "emitterCompanySiret" = :siret
+    or "destinationCompanySiret" = :siret
+union all
+select
+    'BSVHU' as bs_type,
+    id,
+    "updatedAt"
+from
+    "default$default"."Bsvhu"
+where
+    "emitterCompanySiret" = :siret
+    or "destinationCompanySiret" = :siret
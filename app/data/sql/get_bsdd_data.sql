@@ -1,11 +1,13 @@
 select
     id,
     "createdAt",
+    "updatedAt",
     "sentAt",
     "receivedAt",
     "processedAt",
     "emitterCompanySiret",
     "emitterCompanyAddress",
+    substring("emitterCompanyAddress" from '[0-9]{5}') as "emitterCompanyPostalCode",
     "recipientCompanySiret",
     "wasteDetailsQuantity",
     "quantityReceived",
@@ -18,8 +20,8 @@ select
  from
     "default$default"."Form" f
 where
-    ("emitterCompanySiret" = '{siret}'
-    or "recipientCompanySiret" = '{siret}')
+    ("emitterCompanySiret" = :siret
+    or "recipientCompanySiret" = :siret)
     and "isDeleted" = false
     and "createdAt" >= current_date - INTERVAL '1 year'
     and cast("status" as text) not in ('DRAFT', 'INITIAL', 'SIGNED_BY_WORKER')
@@ -1,11 +1,13 @@
 select
     id,
     "createdAt",
+    "updatedAt",
     "transporterTransportTakenOverAt" as "sentAt",
     "destinationReceptionDate" as "receivedAt",
     "destinationOperationSignatureDate" as "processedAt",
     "emitterCompanySiret",
     "emitterCompanyAddress",
+    substring("emitterCompanyAddress" from '[0-9]{5}') as "emitterCompanyPostalCode",
     "destinationCompanySiret" as "recipientCompanySiret",
     "weightValue" as "wasteDetailsQuantity",
     "destinationReceptionWeight"/1000 as "quantityReceived",
@@ -16,8 +18,8 @@ select
 from
     "default$default"."Bsff" 
 where
-    ("emitterCompanySiret" = '{siret}'
-        or "destinationCompanySiret" = '{siret}')
+    ("emitterCompanySiret" = :siret
+        or "destinationCompanySiret" = :siret)
     and "isDeleted" = false
     and "createdAt" >= current_date - interval '1 year'
     and cast("status" as text) not in ('DRAFT', 'INITIAL', 'SIGNED_BY_WORKER')
@@ -11,4 +11,4 @@ select id,
     "vhuAgrementDemolisseurId",
     "vhuAgrementBroyeurId"
 from "default$default"."Company" c
-where c."siret" = '{siret}'
\ No newline at end of file
+where c."siret" = :siret
\ No newline at end of file
@@ -0,0 +1,2 @@
+select
+    now() as "now"
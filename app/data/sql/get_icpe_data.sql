@@ -10,6 +10,6 @@ select
     libelle_court_activite
 from
     refined_zone_icpe.icpe_siretise
-where siret_clean = '{siret}'
+where siret_clean = :siret
 AND en_vigueur
 and id_regime in ('E','DC','D','A')
\ No newline at end of file
@@ -0,0 +1,16 @@
+select
+    siret_clean,
+    code_s3ic,
+    id_nomenclature,
+    date_debut_exploitation,
+    date_fin_validite,
+    volume,
+    unite,
+    rubrique,
+    alinea,
+    libelle_court_activite
+from
+    refined_zone_icpe.icpe_siretise
+where siret_clean is not null
+and en_vigueur
+and id_regime in ('E','DC','D','A')
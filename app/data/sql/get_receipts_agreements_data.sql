@@ -0,0 +1,49 @@
+select
+    'transporterReceiptId' as "receiptType",
+    r.id,
+    r."receiptNumber",
+    r."validityLimit",
+    r.department
+from "default$default"."Company" c
+    join "default$default"."TransporterReceipt" r on r.id = c."transporterReceiptId"
+where c."siret" = :siret
+union all
+select
+    'traderReceiptId' as "receiptType",
+    r.id,
+    r."receiptNumber",
+    r."validityLimit",
+    r.department
+from "default$default"."Company" c
+    join "default$default"."TraderReceipt" r on r.id = c."traderReceiptId"
+where c."siret" = :siret
+union all
+select
+    'brokerReceiptId' as "receiptType",
+    r.id,
+    r."receiptNumber",
+    r."validityLimit",
+    r.department
+from "default$default"."Company" c
+    join "default$default"."BrokerReceipt" r on r.id = c."brokerReceiptId"
+where c."siret" = :siret
+union all
+select
+    'vhuAgrementDemolisseurId' as "receiptType",
+    a.id,
+    a."agrementNumber" as "receiptNumber",
+    cast(null as timestamp) as "validityLimit",
+    a.department
+from "default$default"."Company" c
+    join "default$default"."VhuAgrement" a on a.id = c."vhuAgrementDemolisseurId"
+where c."siret" = :siret
+union all
+select
+    'vhuAgrementBroyeurId' as "receiptType",
+    a.id,
+    a."agrementNumber" as "receiptNumber",
+    cast(null as timestamp) as "validityLimit",
+    a.department
+from "default$default"."Company" c
+    join "default$default"."VhuAgrement" a on a.id = c."vhuAgrementBroyeurId"
+where c."siret" = :siret
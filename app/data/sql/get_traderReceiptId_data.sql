@@ -1,6 +0,0 @@
-SELECT id,
-    "receiptNumber",
-    "validityLimit",
-    department
-FROM "default$default"."TraderReceipt"
-WHERE id = '{id}'
\ No newline at end of file
@@ -1,8 +0,0 @@
-SELECT
-    id,
-    "agrementNumber" AS "receiptNumber",
-    department
-FROM
-    "default$default"."VhuAgrement"
-WHERE
-    id = '{id}'
@@ -0,0 +1,754 @@
+"""
+Seeded generator of synthetic Trackdéchets data, with the shapes seen in production, for benchmarks and tests.
+
+A `SyntheticDataset` is the data of one establishment (SIRET) : its company and receipts, its 'bordereaux'
+of each type (as emitter or recipient), its revision requests and its ICPE items. It provides :
+- the DataFrames returned by `make_query` for each SQL template (same columns, order and dtypes),
+  so that components can be benchmarked without any database. The dates of the 'bordereaux' are the ones
+  returned with PostgreSQL (`datetime` objects, parsed by pandas when all are in range), or their text
+  representation returned with the SQLite stand-in (`dates_as_text`) ;
+- `load`, that writes the data (plus lines the queries must leave out : deleted, draft or older than one year)
+  into the local stand-in databases (see `app.data.local_engine`), to run the whole data layer offline.
+
+The data reproduces what the preprocessing and the components have to deal with : skewed waste codes
+(`code_dechets.csv`) and partners, emitter addresses with postal codes of all the départements,
+date outliers (out of the range handled by pandas) and quantity outliers (kilograms typed as tonnes),
+revision requests and ICPE rubriques of `mapping_rubrique_code_operation.csv`.
+The same seed, sizes and reference date always give the same data.
+
+Usage, to fill the local stand-in databases (from the repository root):
+
+    python -m app.data.synthetic --directory ./cache/local_db --profile ttr_collector --scale 0.1
+"""
+import argparse
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.engine import Engine
+
+from app.data.local_engine import LOCAL_SCHEMA
+from app.data.query_registry import BS_DATA_SQL_FILES, QUERY_TEMPLATES_SPECS
+
+STATIC_FILES_PATH = Path("app/data/static")
+
+# Sizes (number of 'bordereaux' returned by the queries, by type) and characteristics of typical establishments
+SIZE_PROFILES = {
+    "small_producer": {
+        "sizes": {"BSDD": 20},
+        "company_types": ["PRODUCER"],
+        # Share of the 'bordereaux' the establishment is the recipient of
+        "recipient_share": 0.0,
+        "icpe_rubriques": [],
+    },
+    "ttr_collector": {
+        "sizes": {"BSDD": 200_000, "BSDA": 30_000},
+        "company_types": ["PRODUCER", "COLLECTOR", "TRANSPORTER"],
+        "recipient_share": 0.6,
+        "icpe_rubriques": ["2718-1", "2790", "2791", "2760-2", "2771", "2716"],
+    },
+    "vhu_center": {
+        "sizes": {"BSVHU": 3_000, "BSDD": 400},
+        "company_types": ["PRODUCER", "WASTE_VEHICLES"],
+        "recipient_share": 0.7,
+        "icpe_rubriques": ["2712-1", "2718-2"],
+    },
+}
+
+# Status of the 'bordereaux' with their frequency and the last step reached
+# (0: created, 1: sent, 2: received, 3: processed)
+BS_STATUSES = {
+    "BSDD": [
+        ("SEALED", 0.1, 0),
+        ("SENT", 0.08, 1),
+        ("RECEIVED", 0.05, 2),
+        ("ACCEPTED", 0.05, 2),
+        ("REFUSED", 0.03, 2),
+        ("AWAITING_GROUP", 0.06, 3),
+        ("NO_TRACEABILITY", 0.01, 3),
+        ("PROCESSED", 0.62, 3),
+    ],
+    **{
+        bs_type: [
+            ("SIGNED_BY_PRODUCER", 0.1, 0),
+            ("SENT", 0.1, 1),
+            ("RECEIVED", 0.05, 2),
+            ("REFUSED", 0.03, 2),
+            ("PROCESSED", 0.72, 3),
+        ]
+        for bs_type in ["BSDA", "BSFF", "BSDASRI", "BSVHU"]
+    },
+}
+
+# Median quantity (in tonnes) of a 'bordereau' of each type
+BS_MEDIAN_QUANTITIES = {
+    "BSDD": 2.0,
+    "BSDA": 3.0,
+    "BSFF": 0.05,
+    "BSDASRI": 0.02,
+    "BSVHU": 1.0,
+}
+
+# Columns of the 'bordereaux' tables, by result column of the queries (columns with the same name are omitted)
+BS_TABLES = {
+    "BSDD": (
+        "Form",
+        {
+            "wasteCode": "wasteDetailsCode",
+            "processing_operation_code": "processingOperationDone",
+            "wastePop": "wasteDetailsPop",
+        },
+    ),
+    "BSDA": (
+        "Bsda",
+        {
+            "sentAt": "transporterTransportTakenOverAt",
+            "receivedAt": "destinationReceptionDate",
+            "processedAt": "destinationOperationDate",
+            "recipientCompanySiret": "destinationCompanySiret",
+            "wasteDetailsQuantity": "weightValue",
+            "quantityReceived": "destinationReceptionWeight",
+            "processing_operation_code": "destinationOperationCode",
+        },
+    ),
+    "BSFF": (
+        "Bsff",
+        {
+            "sentAt": "transporterTransportTakenOverAt",
+            "receivedAt": "destinationReceptionDate",
+            "processedAt": "destinationOperationSignatureDate",
+            "recipientCompanySiret": "destinationCompanySiret",
+            "wasteDetailsQuantity": "weightValue",
+            "quantityReceived": "destinationReceptionWeight",
+            "processing_operation_code": "destinationOperationCode",
+        },
+    ),
+    "BSDASRI": (
+        "Bsdasri",
+        {
+            "sentAt": "transporterTakenOverAt",
+            "receivedAt": "destinationReceptionDate",
+            "processedAt": "destinationOperationSignatureDate",
+            "recipientCompanySiret": "destinationCompanySiret",
+            "wasteDetailsQuantity": "emitterWasteWeightValue",
+            "quantityReceived": "destinationReceptionWasteWeightValue",
+            "processing_operation_code": "destinationOperationCode",
+        },
+    ),
+    "BSVHU": (
+        "Bsvhu",
+        {
+            "sentAt": "transporterTransportTakenOverAt",
+            "receivedAt": "destinationReceptionDate",
+            "processedAt": "destinationOperationSignatureDate",
+            "recipientCompanySiret": "destinationCompanySiret",
+            "wasteDetailsQuantity": "weightValue",
+            "quantityReceived": "destinationReceptionWeight",
+            "processing_operation_code": "destinationOperationCode",
+        },
+    ),
+}
+
+# Dates of the 'bordereaux' queries, returned as the driver gives them (no date parsing in `make_query`)
+BS_DATE_COLUMNS = ["createdAt", "updatedAt", "sentAt", "receivedAt", "processedAt"]
+
+PARTNERS_COUNT = 500
+# Share of the partners located in the département of the establishment
+LOCAL_PARTNERS_SHARE = 0.6
+DATE_OUTLIERS_SHARE = 0.001
+QUANTITY_OUTLIERS_SHARE = 0.002
+REVISION_REQUESTS_SHARE = 0.01
+# Share of lines added to the tables that the queries leave out (deleted, draft, older than one year)
+LEFT_OUT_SHARE = 0.02
+
+INSERT_BATCH_SIZE = 10_000
+
+STREETS = [
+    "rue de la Gare",
+    "avenue Jean Jaurès",
+    "zone industrielle",
+    "chemin des Prés",
+]
+
+
+def _zipf_weights(n: int, exponent: float = 1.1) -> np.ndarray:
+    weights = 1 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _format_dates(dates: np.ndarray) -> List[str]:
+    """Formats dates (datetime64[ms], NaT for missing dates) like `str(datetime)`, None for missing dates."""
+
+    formatted_dates = []
+    for date in np.datetime_as_string(dates, unit="ms"):
+        if date == "NaT":
+            formatted_dates.append(None)
+        elif date.endswith(".000"):
+            formatted_dates.append(f"{date[:10]} {date[11:19]}")
+        else:
+            formatted_dates.append(f"{date[:10]} {date[11:]}000")
+    return formatted_dates
+
+
+def _to_native_dates(dates: pd.Series) -> pd.Series:
+    """Converts text dates to the time-zone aware `datetime` objects returned by psycopg2, None for missing dates."""
+
+    return pd.Series(
+        [
+            None
+            if e is None
+            else datetime.fromisoformat(e).replace(tzinfo=timezone.utc)
+            for e in dates
+        ],
+        index=dates.index,
+        dtype=object,
+    )
+
+
+def _to_query_result(
+    df: pd.DataFrame, sql_query_name: str, dates_as_text: bool = True
+) -> pd.DataFrame:
+    """Applies the date columns and dtypes of the SQL template, the way `make_query` does.
+
+    The 'bordereaux' dates (not parsed by `make_query`) are kept as text if `dates_as_text` is True (SQLite stand-in),
+    else they are converted to `datetime` objects and the DataFrame is built from the rows like `pd.read_sql_query`
+    does with psycopg2 : pandas parses the columns where all the dates are in range.
+    """
+
+    spec = QUERY_TEMPLATES_SPECS[sql_query_name]
+    df = df[spec["columns"]].copy()
+    if not dates_as_text:
+        for column in BS_DATE_COLUMNS:
+            if column in df.columns and column not in (spec.get("date_columns") or []):
+                df[column] = _to_native_dates(df[column])
+        df = pd.DataFrame.from_records(
+            list(df.itertuples(index=False, name=None)), columns=df.columns
+        )
+    for column in spec.get("date_columns") or []:
+        df[column] = pd.to_datetime(df[column], utc=True)
+    if spec.get("dtypes"):
+        df = df.astype(spec["dtypes"])
+    return df
+
+
+class SyntheticDataset:
+    """Synthetic data of one establishment.
+
+    Parameters
+    ----------
+    sizes : dict
+        Number of 'bordereaux' returned by the queries, by type (BSDD, BSDA, BSFF, BSDASRI, BSVHU).
+    seed : int
+        Seed of the random generator.
+    company_types : list of str
+        Profiles of the establishment (Company.companyTypes).
+    recipient_share : float
+        Share of the 'bordereaux' the establishment is the recipient of (it is the emitter of the others).
+    icpe_rubriques : list of str
+        ICPE items of the establishment, as "rubrique" or "rubrique-alinea".
+    reference_date : datetime
+        Date the data is generated at (defaults to today), all the 'bordereaux' are created in the year before.
+    """
+
+    def __init__(
+        self,
+        sizes: Dict[str, int],
+        seed: int = 0,
+        company_types: List[str] = ["PRODUCER"],
+        recipient_share: float = 0.5,
+        icpe_rubriques: List[str] = [],
+        reference_date: datetime = None,
+    ) -> None:
+        self.sizes = sizes
+        self.seed = seed
+        self.company_types = company_types
+        self.recipient_share = recipient_share
+        self.icpe_rubriques = icpe_rubriques
+        if reference_date is None:
+            reference_date = datetime.combine(
+                datetime.utcnow().date(), datetime.min.time()
+            )
+        self.reference_date = reference_date
+
+        self.rng = np.random.default_rng(seed)
+
+        self.waste_codes = pd.read_csv(
+            STATIC_FILES_PATH / "code_dechets.csv", dtype=str
+        )
+        self.mapping_rubrique_code_operation = pd.read_csv(
+            STATIC_FILES_PATH / "mapping_rubrique_code_operation.csv", dtype=str
+        )
+        departements = pd.read_csv(
+            STATIC_FILES_PATH / "departement_2022.csv", dtype=str
+        )
+
+        self.siret = f"1{self.rng.integers(10**12, 10**13)}"
+        self.company_id = f"cl{self.rng.integers(10**15, 10**16):x}"
+        self.departement = self.rng.choice(departements["DEP"][:95])
+        self.address = self._get_address(self.departement)
+
+        # Partners, the first ones being the most frequent
+        partners_departements = np.where(
+            self.rng.random(PARTNERS_COUNT) < LOCAL_PARTNERS_SHARE,
+            self.departement,
+            self.rng.choice(departements["DEP"], PARTNERS_COUNT),
+        )
+        self.partners_sirets = np.array(
+            [f"9{e}" for e in self.rng.integers(10**12, 10**13, PARTNERS_COUNT)],
+            dtype=object,
+        )
+        self.partners_addresses = np.array(
+            [self._get_address(departement) for departement in partners_departements],
+            dtype=object,
+        )
+
+        # Result of the queries of each 'bordereau' type, with raw values (None for missing dates)
+        self.bs_raw_data = {
+            bs_type: self._generate_bs_data(bs_type, sizes.get(bs_type, 0))
+            for bs_type in BS_DATA_SQL_FILES
+        }
+        self.revision_requests = self._generate_revision_requests()
+        self.icpe_items = self._generate_icpe_items()
+
+    @classmethod
+    def from_profile(
+        cls, profile: str, seed: int = 0, scale: float = 1, **kwargs
+    ) -> "SyntheticDataset":
+        """Create the dataset of a typical establishment of `SIZE_PROFILES`, with its sizes multiplied by `scale`."""
+
+        config = SIZE_PROFILES[profile]
+        sizes = {
+            bs_type: max(1, round(size * scale))
+            for bs_type, size in config["sizes"].items()
+        }
+        return cls(
+            sizes,
+            seed=seed,
+            company_types=config["company_types"],
+            recipient_share=config["recipient_share"],
+            icpe_rubriques=config["icpe_rubriques"],
+            **kwargs,
+        )
+
+    def _get_address(self, departement: str) -> str:
+        """Returns an address with a postal code of the département."""
+
+        if departement == "2A":
+            postal_code = f"20{self.rng.integers(0, 20) * 10:03d}"
+        elif departement == "2B":
+            postal_code = f"20{self.rng.integers(20, 30) * 10:03d}"
+        elif len(departement) == 3:
+            postal_code = f"{departement}{self.rng.integers(0, 10) * 10:02d}"
+        else:
+            postal_code = f"{departement}{self.rng.integers(0, 30) * 10:03d}"
+
+        street = STREETS[self.rng.integers(len(STREETS))]
+        number = self.rng.integers(1, 200)
+        return f"{number} {street} {postal_code} COMMUNE {departement}"
+
+    def _choose_skewed(self, values: List[str], n: int) -> np.ndarray:
+        """Draws `n` values with a Zipf distribution over the values, in a random order of popularity."""
+
+        values = self.rng.permutation(np.array(values, dtype=object))
+        return self.rng.choice(values, n, p=_zipf_weights(len(values)))
+
+    def _get_waste_codes(self, bs_type: str) -> List[str]:
+        codes = self.waste_codes
+        if bs_type == "BSDA":
+            codes = codes[codes["description"].str.contains("amiante")]
+        elif bs_type == "BSFF":
+            codes = codes[codes["code"].str.startswith("14 06")]
+        elif bs_type == "BSDASRI":
+            codes = codes[codes["code"].str.match(r"18 0[12]")]
+        elif bs_type == "BSVHU":
+            codes = codes[codes["code"].isin(["16 01 04*", "16 01 06"])]
+        return codes["code"].tolist()
+
+    def _generate_bs_data(self, bs_type: str, n: int) -> pd.DataFrame:
+        rng = self.rng
+        ms_per_day = 24 * 3600 * 1000
+        reference = np.datetime64(self.reference_date, "ms")
+
+        # Creation dates in ascending order, like the queries results
+        created_at = reference - np.sort(rng.integers(ms_per_day, 364 * ms_per_day, n))[
+            ::-1
+        ].astype("timedelta64[ms]")
+
+        statuses, frequencies, steps = zip(*BS_STATUSES[bs_type])
+        status_index = rng.choice(len(statuses), n, p=np.array(frequencies))
+        status = np.array(statuses, dtype=object)[status_index]
+        step = np.array(steps)[status_index]
+
+        def add_delay(dates, max_days, reached):
+            delays = rng.integers(3600 * 1000, max_days * ms_per_day, n)
+            dates = np.minimum(dates + delays.astype("timedelta64[ms]"), reference)
+            return np.where(reached, dates, np.datetime64("NaT"))
+
+        sent_at = add_delay(created_at, 3, step >= 1)
+        received_at = add_delay(sent_at, 3, step >= 2)
+        processed_at = add_delay(received_at, 20, step >= 3)
+        updated_at = np.fmax(
+            np.fmax(created_at, sent_at), np.fmax(received_at, processed_at)
+        )
+
+        median_quantity = BS_MEDIAN_QUANTITIES[bs_type]
+        quantity = np.round(
+            rng.lognormal(np.log(median_quantity), 0.8, n).clip(0.001, 30), 3
+        )
+        quantity_received = np.round(quantity * rng.uniform(0.9, 1.05, n), 3)
+        quantity_received[status == "REFUSED"] = 0
+        quantity_outliers = rng.random(n) < QUANTITY_OUTLIERS_SHARE
+        quantity_received[quantity_outliers] *= 1000
+        quantity_received[step < 2] = np.nan
+
+        is_recipient = rng.random(n) < self.recipient_share
+        partners = rng.choice(PARTNERS_COUNT, n, p=_zipf_weights(PARTNERS_COUNT))
+        emitter_address = np.where(
+            is_recipient, self.partners_addresses[partners], self.address
+        )
+
+        operation_codes = [
+            f"{code[0]} {code[1:]}"
+            for code in self.mapping_rubrique_code_operation["code_operation"].unique()
+        ]
+        processing_operation_code = np.where(
+            (step == 3) & (status != "NO_TRACEABILITY"),
+            self._choose_skewed(operation_codes, n),
+            None,
+        )
+
+        df = pd.DataFrame(
+            {
+                "id": [f"{bs_type}-{self.seed}-{i:07d}" for i in range(n)],
+                "createdAt": _format_dates(created_at),
+                "updatedAt": _format_dates(updated_at),
+                "sentAt": _format_dates(sent_at),
+                "receivedAt": _format_dates(received_at),
+                "processedAt": _format_dates(processed_at),
+                "emitterCompanySiret": np.where(
+                    is_recipient, self.partners_sirets[partners], self.siret
+                ),
+                "emitterCompanyAddress": emitter_address,
+                "recipientCompanySiret": np.where(
+                    is_recipient, self.siret, self.partners_sirets[partners]
+                ),
+                "wasteDetailsQuantity": quantity,
+                "quantityReceived": quantity_received,
+                "wasteCode": self._choose_skewed(self._get_waste_codes(bs_type), n),
+                "processing_operation_code": processing_operation_code,
+                "status": status,
+                "transporterTransportMode": rng.choice(
+                    np.array(["ROAD", "RAIL", "RIVER", "SEA"], dtype=object),
+                    n,
+                    p=[0.95, 0.02, 0.02, 0.01],
+                ),
+                "noTraceability": status == "NO_TRACEABILITY",
+                "wastePop": rng.random(n) < 0.01,
+            }
+        )
+        df.insert(
+            df.columns.get_loc("recipientCompanySiret"),
+            "emitterCompanyPostalCode",
+            df["emitterCompanyAddress"].str.extract("([0-9]{5})", expand=False),
+        )
+
+        # Date outliers : a few dates of a year pandas can't handle
+        date_outliers = np.flatnonzero(
+            (rng.random(n) < DATE_OUTLIERS_SHARE) & (step >= 1)
+        )
+        for i in date_outliers:
+            column = ["sentAt", "receivedAt", "processedAt"][rng.integers(step[i])]
+            year = rng.choice(["0022", "9999"])
+            df.at[i, column] = year + df.at[i, column][4:]
+
+        columns = QUERY_TEMPLATES_SPECS[BS_DATA_SQL_FILES[bs_type]]["columns"]
+        return df[columns]
+
+    def _generate_revision_requests(self) -> pd.DataFrame:
+        rng = self.rng
+        revision_requests = []
+        for bs_type in ["BSDD", "BSDA"]:
+            df = self.bs_raw_data[bs_type]
+            revised = df[
+                (df["emitterCompanySiret"] == self.siret)
+                & (rng.random(len(df)) < REVISION_REQUESTS_SHARE)
+            ]
+            created_at = pd.to_datetime(revised["createdAt"]) + pd.to_timedelta(
+                rng.integers(1, 10, len(revised)), unit="D"
+            )
+            revision_requests.append(
+                pd.DataFrame(
+                    {
+                        "bs_type": bs_type,
+                        "id": [f"{e}-revision" for e in revised["id"]],
+                        "bsId": revised["id"],
+                        "createdAt": _format_dates(
+                            np.minimum(
+                                created_at.to_numpy("datetime64[ms]"),
+                                np.datetime64(self.reference_date, "ms"),
+                            )
+                        ),
+                        "status": rng.choice(
+                            np.array(["ACCEPTED", "REFUSED", "PENDING"], dtype=object),
+                            len(revised),
+                            p=[0.8, 0.1, 0.1],
+                        ),
+                    }
+                )
+            )
+        return pd.concat(revision_requests, ignore_index=True)
+
+    def _generate_icpe_items(self) -> pd.DataFrame:
+        rng = self.rng
+        n = len(self.icpe_rubriques)
+        rubriques_alineas = [f"{e}-".split("-")[:2] for e in self.icpe_rubriques]
+        start_dates = self.reference_date - pd.to_timedelta(
+            rng.integers(365, 30 * 365, n), unit="D"
+        )
+        return pd.DataFrame(
+            {
+                "code_s3ic": f"{rng.integers(1, 100):04d}.{rng.integers(10**4, 10**5)}",
+                "id_nomenclature": [str(e) for e in rng.integers(10**5, 10**6, n)],
+                "date_debut_exploitation": [e.date() for e in start_dates],
+                "date_fin_validite": None,
+                "volume": np.round(rng.lognormal(np.log(500), 1, n)),
+                "unite": rng.choice(np.array(["t", "t/j", "m3"], dtype=object), n),
+                "rubrique": [rubrique for rubrique, _ in rubriques_alineas],
+                "alinea": [alinea or None for _, alinea in rubriques_alineas],
+                "libelle_court_activite": [
+                    f"Installation de gestion de déchets ({e})"
+                    for e in self.icpe_rubriques
+                ],
+                "id_regime": rng.choice(
+                    np.array(["E", "DC", "D", "A"], dtype=object), n
+                ),
+            }
+        )
+
+    def get_bs_data(self, bs_type: str, dates_as_text: bool = False) -> pd.DataFrame:
+        """Returns the 'bordereaux' of the type, like `make_query` with the query of the type (e.g. get_bsdd_data).
+
+        Parameters
+        ----------
+        bs_type : str
+            'bordereau' type (BSDD, BSDA, BSFF, BSDASRI or BSVHU).
+        dates_as_text : bool
+            If True, the dates are returned as text, like with the SQLite stand-in,
+            else as `datetime` objects parsed by pandas when all are in range, like with PostgreSQL.
+        """
+
+        return _to_query_result(
+            self.bs_raw_data[bs_type], BS_DATA_SQL_FILES[bs_type], dates_as_text
+        )
+
+    def get_bs_data_dfs(self, dates_as_text: bool = False) -> Dict[str, pd.DataFrame]:
+        """Returns the 'bordereaux' of all the types, by type (see `get_bs_data`)."""
+
+        return {
+            bs_type: self.get_bs_data(bs_type, dates_as_text)
+            for bs_type in BS_DATA_SQL_FILES
+        }
+
+    def get_company_data(self) -> pd.DataFrame:
+        """Returns the company, like `make_query("get_company_data")`."""
+
+        receipts = self._get_receipts()
+        df = pd.DataFrame(
+            {
+                "id": [self.company_id],
+                "createdAt": [str(self.reference_date - timedelta(days=1000))],
+                "siret": [self.siret],
+                "name": [f"ETABLISSEMENT {self.siret}"],
+                "address": [self.address],
+                "companyTypes": ["{" + ",".join(self.company_types) + "}"],
+                **{
+                    column: [receipts[column]["id"] if column in receipts else None]
+                    for column in [
+                        "transporterReceiptId",
+                        "traderReceiptId",
+                        "brokerReceiptId",
+                        "vhuAgrementDemolisseurId",
+                        "vhuAgrementBroyeurId",
+                    ]
+                },
+                "ecoOrganismeAgreements": ["{}"],
+            }
+        )
+        return _to_query_result(df, "get_company_data")
+
+    def _get_receipts(self) -> Dict[str, dict]:
+        """Receipts and agreements of the company, by Company column."""
+
+        receipts = {}
+        expiration = str(self.reference_date + timedelta(days=400))
+        if "TRANSPORTER" in self.company_types:
+            receipts["transporterReceiptId"] = {"validityLimit": expiration}
+        if "TRADER" in self.company_types:
+            receipts["traderReceiptId"] = {"validityLimit": expiration}
+        if "BROKER" in self.company_types:
+            receipts["brokerReceiptId"] = {"validityLimit": expiration}
+        if "WASTE_VEHICLES" in self.company_types:
+            receipts["vhuAgrementDemolisseurId"] = {"validityLimit": None}
+
+        for i, (column, receipt) in enumerate(receipts.items()):
+            receipt["id"] = f"{self.company_id}-receipt-{i}"
+            receipt["receiptNumber"] = f"{self.departement}-{self.seed}-{i}"
+            receipt["department"] = self.departement
+        return receipts
+
+    def get_receipts_agreements_data(self) -> pd.DataFrame:
+        """Returns the receipts and agreements, like `make_query("get_receipts_agreements_data")`."""
+
+        df = pd.DataFrame(
+            [
+                {"receiptType": column, **receipt}
+                for column, receipt in self._get_receipts().items()
+            ],
+            columns=[
+                "receiptType",
+                "id",
+                "receiptNumber",
+                "validityLimit",
+                "department",
+            ],
+        )
+        return _to_query_result(df, "get_receipts_agreements_data")
+
+    def get_bs_revised_data(self) -> pd.DataFrame:
+        """Returns the accepted revision requests, like `make_query("get_bs_revised_data")`."""
+
+        df = self.revision_requests
+        accepted = df[df["status"] == "ACCEPTED"].reset_index(drop=True)
+        return _to_query_result(accepted, "get_bs_revised_data")
+
+    def get_icpe_data(self) -> pd.DataFrame:
+        """Returns the ICPE items, like `make_query("get_icpe_data")`."""
+
+        return _to_query_result(self.icpe_items.copy(), "get_icpe_data")
+
+    def _get_tables(self) -> Dict[tuple, pd.DataFrame]:
+        """Rows of the tables of the local stand-in, by (schema, table)."""
+
+        rng = self.rng
+        tables = {}
+        for bs_type, (table, columns_mapping) in BS_TABLES.items():
+            df = self.bs_raw_data[bs_type].drop(columns="emitterCompanyPostalCode")
+            if len(df) == 0:
+                continue
+            df["isDeleted"] = False
+
+            # Lines left out by the queries
+            left_out = df.sample(
+                frac=LEFT_OUT_SHARE, random_state=rng.integers(2**31)
+            )
+            left_out["id"] = left_out["id"] + "-left-out"
+            left_out_kind = rng.integers(0, 3, len(left_out))
+            left_out.loc[left_out_kind == 0, "isDeleted"] = True
+            left_out.loc[left_out_kind == 1, "status"] = (
+                "DRAFT" if bs_type == "BSDD" else "INITIAL"
+            )
+            left_out.loc[left_out_kind == 2, "createdAt"] = str(
+                self.reference_date - timedelta(days=400)
+            )
+            df = pd.concat([df, left_out], ignore_index=True)
+
+            if bs_type != "BSDD":
+                # Received weight is stored in kilograms
+                df["quantityReceived"] = (df["quantityReceived"] * 1000).round()
+            tables[("default$default", table)] = df.rename(columns=columns_mapping)
+
+        company = self.get_company_data().drop(columns="createdAt")
+        company["createdAt"] = str(self.reference_date - timedelta(days=1000))
+        tables[("default$default", "Company")] = company
+
+        receipts_tables = {
+            "transporterReceiptId": "TransporterReceipt",
+            "traderReceiptId": "TraderReceipt",
+            "brokerReceiptId": "BrokerReceipt",
+        }
+        for column, receipt in self._get_receipts().items():
+            if column in receipts_tables:
+                table = ("default$default", receipts_tables[column])
+                tables[table] = pd.DataFrame([receipt])
+            else:
+                tables[("default$default", "VhuAgrement")] = pd.DataFrame(
+                    [{**receipt, "agrementNumber": receipt["receiptNumber"]}]
+                )
+
+        for bs_type, id_column in [("BSDD", "bsddId"), ("BSDA", "bsdaId")]:
+            df = self.revision_requests
+            table = ("default$default", f"{bs_type.capitalize()}RevisionRequest")
+            tables[table] = (
+                df[df["bs_type"] == bs_type]
+                .rename(columns={"bsId": id_column})
+                .assign(authoringCompanyId=self.company_id)
+            )
+
+        icpe_items = self.icpe_items.assign(siret_clean=self.siret, en_vigueur=True)
+        # An item no longer in force
+        tables[("refined_zone_icpe", "icpe_siretise")] = pd.concat(
+            [icpe_items, icpe_items.head(1).assign(en_vigueur=False)],
+            ignore_index=True,
+        )
+
+        return tables
+
+    def load(self, engine: Engine) -> None:
+        """Writes the data into the local stand-in databases (see `app.data.local_engine`)."""
+
+        with engine.begin() as connection:
+            for (schema, table), df in self._get_tables().items():
+                columns = [
+                    column for column in LOCAL_SCHEMA[(schema, table)] if column in df
+                ]
+                df = df[columns].astype(object)
+                df = df.where(df.notna(), None)
+
+                columns_list = ", ".join(f'"{column}"' for column in columns)
+                placeholders = ", ".join("?" for _ in columns)
+                statement = (
+                    f'insert into "{schema}"."{table}" ({columns_list})'
+                    f" values ({placeholders})"
+                )
+                rows = list(df.itertuples(index=False, name=None))
+                for start in range(0, len(rows), INSERT_BATCH_SIZE):
+                    connection.exec_driver_sql(
+                        statement, rows[start : start + INSERT_BATCH_SIZE]
+                    )
+
+
+def main() -> None:
+    from app.data.local_engine import create_local_engine
+
+    parser = argparse.ArgumentParser(
+        description="Fill the local stand-in databases with synthetic data."
+    )
+    parser.add_argument(
+        "--directory",
+        default=os.getenv("LOCAL_DATABASE_DIRECTORY") or "./cache/local_db",
+        help="Directory of the local stand-in databases.",
+    )
+    parser.add_argument(
+        "--profile", choices=list(SIZE_PROFILES), action="append", required=True
+    )
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    engine = create_local_engine(
+        "synthetic", Path(args.directory), env_prefix="SYNTHETIC"
+    )
+    for i, profile in enumerate(args.profile):
+        # Each establishment gets its own seed, hence its own SIRET
+        dataset = SyntheticDataset.from_profile(
+            profile, seed=args.seed + i, scale=args.scale
+        )
+        dataset.load(engine)
+        print(f"{profile} : SIRET {dataset.siret}, {dataset.sizes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,78 @@
 from typing import Dict, List, Tuple
 
+import numpy as np
 import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype
+
+from app.data.compact_dtypes import compact_bs_data, concat_bs_data
+from app.data.quantity_rules import (
+    QUANTITY_OUTLIER_REASON_COLUMN,
+    evaluate_quantity_rules,
+    get_rules_columns,
+)
+
+# Columns of the combined 'bordereaux' query (get_bs_data) that are always NULL for a 'bordereau' type,
+# because they are not part of the 'bordereau' type query.
+BS_TYPES_MISSING_COLUMNS = {
+    "BSDD": [],
+    "BSDA": ["noTraceability"],
+    "BSFF": ["noTraceability", "wastePop"],
+    "BSDASRI": ["noTraceability", "wastePop"],
+    "BSVHU": ["transporterTransportMode", "noTraceability", "wastePop"],
+}
+
+# Columns needed by the preprocessing of 'bordereaux' data (outliers detection), whatever the components displayed.
+# The 'bordereau' id identifies the lines of the downloadable outliers.
+BS_PREPROCESSING_COLUMNS = list(
+    dict.fromkeys(
+        [
+            "id",
+            "createdAt",
+            "sentAt",
+            "receivedAt",
+            "processedAt",
+            *get_rules_columns(),
+        ]
+    )
+)
+
+# Text representation of missing dates (dates formatted with `str`)
+MISSING_DATES_VALUES = ["None", "NaT"]
+
+
+def parse_datetimes(dates: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """Parses a column of dates to time-zone aware (UTC) dates with a single coercing parse.
+
+    The column can hold native dates (as returned by the driver, `datetime` objects for dates out of the range
+    handled by pandas) or their text representation (SQLite stand-in). Missing values (None, NaN, NaT,
+    or their text representation) are missing dates, not invalid ones.
+
+    Parameters
+    ----------
+    dates : Series
+        Column of dates.
+
+    Returns
+    -------
+    Tuple consisting of :
+    1. Series of parsed dates, NaT for missing and invalid dates.
+    2. Boolean Series, True for invalid dates (unparsable or out of the range handled by pandas).
+    """
+
+    if is_datetime64_any_dtype(dates.dtype):
+        # Already parsed by the driver, so all the dates are in range
+        if dates.dt.tz is None:
+            parsed = dates.dt.tz_localize("UTC")
+        else:
+            parsed = dates.dt.tz_convert("UTC")
+        return parsed, pd.Series(False, index=dates.index)
+
+    parsed = pd.to_datetime(dates, errors="coerce", utc=True)
+    invalid = parsed.isna() & dates.notna()
+    if invalid.any():
+        invalid &= ~dates.isin(MISSING_DATES_VALUES)
+
+    return parsed, invalid
 
 
 def get_outliers_datetimes_df(
@@ -8,11 +80,12 @@ def get_outliers_datetimes_df(
 ) -> Tuple[pd.DataFrame, Dict[str, pd.DataFrame]]:
     """For a given DataFrame, separate lines with date outliers
     from lines with consistent (parsable) dates in provided list of date columns.
+    Each date column, and the `createdAt` column, is parsed once (see `parse_datetimes`).
 
     Parameters
     ----------
     df : DataFrame
-        DataFrame with raw (str) date data.
+        DataFrame with raw date data (native dates or their text representation).
     date_columns : list of str
         Names of columns to parse as dates in pandas (time-zone aware dates are casted to UTC).
 
@@ -22,34 +95,27 @@ def get_outliers_datetimes_df(
     1. DataFrame with consistent dates.
     2. Dict with keys being date column names and values being the DataFrame's lines with inconsistent date for this column.
     """
-    df = df.copy()
-    outliers = {}
-    idx_with_outliers = set()
-
-    for colname in date_columns:
-        time_data = pd.to_datetime(df[colname], errors="coerce")
-        outliers_df = df[time_data.isna() & (~df[colname].isin(["None", "NaT"]))]
-        if len(outliers_df) > 0:
-            idx_with_outliers.update(outliers_df.index.tolist())
-            outliers[colname] = outliers_df
-
-    if len(idx_with_outliers) > 0:
-        df = df[~df.index.isin(idx_with_outliers)]
-
-    for colname in date_columns:
-        df[colname] = pd.to_datetime(
-            df[colname].replace(["None", "NaT"], pd.NaT), utc=True
-        )
+    parsed_columns = {}
+    outliers_masks = {}
+    for colname in dict.fromkeys([*date_columns, "createdAt"]):
+        parsed_columns[colname], invalid = parse_datetimes(df[colname])
+        if colname in date_columns and invalid.any():
+            outliers_masks[colname] = invalid
+
+    # Outliers keep the raw dates, to be downloaded as they are in the database
+    outliers = {colname: df[mask] for colname, mask in outliers_masks.items()}
+
+    df = df.assign(**parsed_columns)
+    if len(outliers_masks) > 0:
+        df = df[~np.logical_or.reduce(list(outliers_masks.values()))]
 
-    df["createdAt"] = pd.to_datetime(
-        df["createdAt"].replace(["None", "NaT"], pd.NaT), utc=True
-    )
     return df, outliers
 
 
 def get_quantity_outliers(df: pd.DataFrame, bs_type: str) -> pd.DataFrame:
     """Filter out lines from 'bordereau' DataFrame with inconsistent received quantity.
-    The rules to identify outliers in received quantity are business rules and may be tweaked in the future.
+    The rules to identify outliers in received quantity are business rules, declared in
+    `app.data.quantity_rules.QUANTITY_OUTLIERS_RULES`.
 
     Parameters
     ----------
@@ -61,21 +127,203 @@ def get_quantity_outliers(df: pd.DataFrame, bs_type: str) -> pd.DataFrame:
     Returns
     -------
     DataFrame
-        DataFrame with lines with received quantity outliers removed.
+        DataFrame with the lines with received quantity outliers.
+    """
+
+    return df[evaluate_quantity_rules(df, bs_type).notna()]
+
+
+def split_bs_data_by_type(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """Split the result of the combined 'bordereaux' query into one DataFrame per 'bordereau' type,
+    with the same columns as the DataFrames returned by the query of each 'bordereau' type.
+
+    Parameters
+    ----------
+    df : DataFrame
+        DataFrame with data of all 'bordereau' types, with a `bs_type` column.
+
+    Returns
+    -------
+    dict
+        Dict with keys being 'bordereau' types (BSDD, BSDA, BSFF, BSDASRI and BSVHU) and values their DataFrame
+        (empty if there is no data for this type).
     """
 
-    df = df.copy()
-    if bs_type in ["BSDD", "BSDA"]:
-        df_quantity_outliers = df[
-            (df["quantityReceived"] > 40) & (df["transporterTransportMode"] == "ROAD")
+    grouped = df.groupby("bs_type", sort=False)
+
+    dfs = {}
+    for bs_type, missing_columns in BS_TYPES_MISSING_COLUMNS.items():
+        if bs_type in grouped.groups:
+            bs_df = grouped.get_group(bs_type)
+        else:
+            bs_df = df.iloc[0:0]
+
+        # Missing columns may have been left out of the query by a projection
+        columns_to_drop = [
+            column for column in ["bs_type", *missing_columns] if column in df.columns
         ]
-    elif bs_type == "BSDASRI":
-        df_quantity_outliers = df[
-            (df["quantityReceived"] > 20) & (df["transporterTransportMode"] == "ROAD")
+        dfs[bs_type] = (
+            bs_df.drop(columns=columns_to_drop).reset_index(drop=True).infer_objects()
+        )
+
+    return dfs
+
+
+def split_by_bs_type(df: pd.DataFrame, bs_types: List[str]) -> Dict[str, pd.DataFrame]:
+    """Split data about several 'bordereau' types (with a `bs_type` column) into one DataFrame per type.
+
+    Parameters
+    ----------
+    df : DataFrame
+        DataFrame with a `bs_type` column.
+    bs_types : list of str
+        'bordereau' types to return.
+
+    Returns
+    -------
+    dict
+        Dict with keys being the given 'bordereau' types and values their DataFrame, without the `bs_type` column
+        (empty if there is no data for this type).
+    """
+
+    return {
+        bs_type: df[df["bs_type"] == bs_type]
+        .drop(columns="bs_type")
+        .reset_index(drop=True)
+        for bs_type in bs_types
+    }
+
+
+def split_receipts_agreements_data(
+    df: pd.DataFrame, receipts_agreements_configs: List[dict]
+) -> Dict[str, pd.DataFrame]:
+    """Split the result of the batched receipts and agreements query (get_receipts_agreements_data)
+    into one DataFrame per receipt/agreement.
+
+    Parameters
+    ----------
+    df : DataFrame
+        DataFrame with all the receipts and agreements of the company, with a `receiptType` column
+        holding the name of the Company column referencing the receipt/agreement.
+    receipts_agreements_configs : list of dict
+        Configs of the receipts/agreements, with keys `name` (displayed name), `column` (Company column)
+        and `validity_limit` (False if this type of receipt/agreement has no validity limit).
+
+    Returns
+    -------
+    dict
+        Dict with keys being the names of the receipts/agreements found for the company
+        and values their DataFrame.
+    """
+
+    grouped = df.groupby("receiptType", sort=False)
+
+    dfs = {}
+    for config in receipts_agreements_configs:
+        if config["column"] not in grouped.groups:
+            continue
+
+        columns_to_drop = ["receiptType"]
+        if not config["validity_limit"]:
+            columns_to_drop.append("validityLimit")
+
+        dfs[config["name"]] = (
+            grouped.get_group(config["column"])
+            .drop(columns=columns_to_drop)
+            .reset_index(drop=True)
+        )
+
+    return dfs
+
+
+class BSDataPreprocessor:
+    """Incremental separation of date and quantity outliers from 'bordereau' data, fed chunk by chunk.
+
+    Each chunk is preprocessed as soon as it is added, so that only the cleaned data is kept in memory.
+    The final result is the same as the one of `get_quantity_outliers` and `get_outliers_datetimes_df`
+    applied to the whole data.
+
+    Parameters
+    ----------
+    bs_type : str
+        Name of the 'bordereau' (BSDD, BSDA, BSFF, BSVHU or BSDASRI).
+    date_columns : list of str
+        Names of the date columns to check for outliers.
+    compact_dtypes : bool
+        If True, the data without outliers is converted to compact dtypes (see `app.data.compact_dtypes`),
+        the outliers keep the raw dtypes.
+    """
+
+    def __init__(
+        self,
+        bs_type: str,
+        date_columns: List[str] = ["sentAt", "receivedAt", "processedAt"],
+        compact_dtypes: bool = False,
+    ) -> None:
+        self.bs_type = bs_type
+        self.date_columns = date_columns
+        self.compact_dtypes = compact_dtypes
+
+        self._n_rows = 0
+        self._chunks = []
+        self._quantity_outliers = []
+        self._date_outliers = {}
+
+    def add_chunk(self, df: pd.DataFrame) -> None:
+        """Preprocess a chunk of 'bordereau' data.
+
+        Parameters
+        ----------
+        df : DataFrame
+            Chunk of data, with raw date data. The reason codes of the quantity outliers may have been
+            evaluated on the combined data of all types (`QUANTITY_OUTLIER_REASON_COLUMN` column),
+            they are evaluated on the chunk otherwise. They are kept in the quantity outliers DataFrame.
+        """
+
+        # Index is made continuous across chunks, like if the whole data was read at once
+        df.index = pd.RangeIndex(self._n_rows, self._n_rows + len(df))
+        self._n_rows += len(df)
+
+        if QUANTITY_OUTLIER_REASON_COLUMN in df.columns:
+            quantity_outliers_reasons = df.pop(QUANTITY_OUTLIER_REASON_COLUMN)
+        else:
+            quantity_outliers_reasons = evaluate_quantity_rules(df, self.bs_type)
+        is_quantity_outlier = quantity_outliers_reasons.notna()
+        quantity_outliers = df[is_quantity_outlier].copy()
+        quantity_outliers[QUANTITY_OUTLIER_REASON_COLUMN] = quantity_outliers_reasons[
+            is_quantity_outlier
         ]
-    elif bs_type == "BSVHU":
-        df_quantity_outliers = df[(df["quantityReceived"] > 40)]
-    elif bs_type == "BSFF":
-        df_quantity_outliers = df[df["quantityReceived"] > 20]
+        self._quantity_outliers.append(quantity_outliers)
+
+        df, date_outliers = get_outliers_datetimes_df(df, self.date_columns)
+        if self.compact_dtypes:
+            df = compact_bs_data(df)
+        self._chunks.append(df)
+        for colname, outliers_df in date_outliers.items():
+            self._date_outliers.setdefault(colname, []).append(outliers_df)
+
+    def get_results(
+        self,
+    ) -> Tuple[pd.DataFrame, Dict[str, pd.DataFrame], pd.DataFrame]:
+        """Returns the preprocessed data of all the chunks added so far.
+
+        Returns
+        -------
+        Tuple consisting of :
+        1. DataFrame with consistent dates.
+        2. Dict with keys being date column names and values being the lines with inconsistent date for this column.
+        3. DataFrame with the lines with received quantity outliers, with the reason code of the rule
+        that flagged them (`QUANTITY_OUTLIER_REASON_COLUMN` column).
+        """
+
+        if len(self._chunks) == 0:
+            return pd.DataFrame(), {}, pd.DataFrame()
+
+        df = concat_bs_data(self._chunks) if len(self._chunks) > 1 else self._chunks[0]
+        quantity_outliers = pd.concat(self._quantity_outliers)
+        date_outliers = {
+            colname: pd.concat(outliers_dfs)
+            for colname, outliers_dfs in self._date_outliers.items()
+        }
 
-    return df_quantity_outliers
+        return df, date_outliers, quantity_outliers
@@ -1,3 +1,5 @@
+from typing import List
+
 from dash_extensions.enrich import html
 
 
@@ -19,8 +21,13 @@ class BaseComponent:
         If True, the component has no data to display after preprocessing the data.
     component_layout: list of dash components
         Full layout of the component.
+    required_bs_columns: list of str
+        'Bordereaux' data columns used by the component, only these columns (and the ones needed by the
+        'bordereaux' preprocessing) are fetched from the database.
     """
 
+    required_bs_columns: List[str] = []
+
     def __init__(self, component_title: str, company_siret: str = None) -> None:
         self.component_title = component_title
         self.company_siret = company_siret
@@ -4,13 +4,13 @@ from datetime import datetime, timedelta, timezone
 from typing import Dict
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 from dash_extensions.enrich import dcc
-import numpy as np
 
 from .base_component import BaseComponent
-from .utils import format_number_str, get_code_departement
+from .utils import format_number_str, get_monthly_serie
 
 logger = logging.getLogger()
 
@@ -73,48 +73,44 @@ class BSCreatedAndRevisedComponent(FigureComponent):
         Title of the component that will be displayed in the component layout.
     company_siret: str
         SIRET number of the establishment for which the data is displayed (used for data preprocessing).
-    bs_data: DataFrame
-        DataFrame containing data for a given 'bordereau' type.
+    bs_monthly_data: DataFrame
+        Monthly aggregates of a given 'bordereau' type (see `app.data.analysis_context.create_bs_monthly_data`).
     bs_revised_data: DataFrame
         DataFrame containing list of revised 'bordereaux' for a given 'bordereau' type.
     """
 
+    # Columns used to compute the monthly aggregates (see `create_bs_monthly_data`)
+    required_bs_columns = [
+        "emitterCompanySiret",
+        "recipientCompanySiret",
+        "createdAt",
+        "receivedAt",
+    ]
+
     def __init__(
         self,
         component_title: str,
         company_siret: str,
-        bs_data: pd.DataFrame,
+        bs_monthly_data: pd.DataFrame,
         bs_revised_data: pd.DataFrame = None,
     ) -> None:
 
         super().__init__(component_title, company_siret)
-        self.bs_data = bs_data
+        self.bs_monthly_data = bs_monthly_data
         self.bs_revised_data = bs_revised_data
         self.bs_emitted_by_month = None
         self.bs_received_by_month = None
         self.bs_revised_by_month = None
 
     def _preprocess_bs_data(self) -> None:
-        """Preprocess raw 'bordereaux' data to prepare it for plotting."""
-        bs_data = self.bs_data
-
-        bs_emitted = bs_data[
-            bs_data["emitterCompanySiret"] == self.company_siret
-        ].dropna(subset=["createdAt"])
-
-        bs_emitted_by_month = bs_emitted.groupby(
-            pd.Grouper(key="createdAt", freq="1M")
-        ).id.count()
-
-        bs_received = bs_data[
-            bs_data["recipientCompanySiret"] == self.company_siret
-        ].dropna(subset=["receivedAt"])
-        bs_received_by_month = bs_received.groupby(
-            pd.Grouper(key="receivedAt", freq="1M")
-        ).id.count()
+        """Slices the monthly aggregates of 'bordereaux' to prepare them for plotting."""
 
-        self.bs_emitted_by_month = bs_emitted_by_month
-        self.bs_received_by_month = bs_received_by_month
+        self.bs_emitted_by_month = get_monthly_serie(
+            self.bs_monthly_data, "emitter", "createdAt"
+        )
+        self.bs_received_by_month = get_monthly_serie(
+            self.bs_monthly_data, "recipient", "receivedAt"
+        )
 
     def _preprocess_bs_revised_data(self) -> None:
         """Preprocess raw revised 'bordereaux' data to prepare it for plotting."""
@@ -239,55 +235,55 @@ class StockComponent(FigureComponent):
         Title of the component that will be displayed in the component layout.
     company_siret: str
         SIRET number of the establishment for which the data is displayed (used for data preprocessing).
-    bs_data: DataFrame
-        DataFrame containing data for a given 'bordereau' type.
+    bs_monthly_data: DataFrame
+        Monthly aggregates of a given 'bordereau' type (see `app.data.analysis_context.create_bs_monthly_data`).
     """
 
+    # Columns used to compute the monthly aggregates (see `create_bs_monthly_data`)
+    required_bs_columns = [
+        "emitterCompanySiret",
+        "recipientCompanySiret",
+        "sentAt",
+        "receivedAt",
+        "quantityReceived",
+    ]
+
     def __init__(
-        self, component_title: str, company_siret: str, bs_data: pd.DataFrame
+        self,
+        component_title: str,
+        company_siret: str,
+        bs_monthly_data: pd.DataFrame,
     ) -> None:
         super().__init__(component_title, company_siret)
 
-        self.bs_data = bs_data
+        self.bs_monthly_data = bs_monthly_data
 
         self.incoming_data_by_month = None
         self.outgoing_data_by_month = None
 
     def _preprocess_data(self) -> None:
 
-        bs_data = self.bs_data
         one_year_ago = (
             datetime.utcnow().replace(tzinfo=timezone.utc) - timedelta(days=365)
         ).strftime("%Y-%m-01")
-        today_date = (
-            datetime.utcnow().replace(tzinfo=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-        )
 
-        incoming_data = bs_data[
-            (bs_data["recipientCompanySiret"] == self.company_siret)
-            & (bs_data["receivedAt"] >= one_year_ago)
-            & (bs_data["receivedAt"] <= today_date)
-        ]
-        outgoing_data = bs_data[
-            (bs_data["emitterCompanySiret"] == self.company_siret)
-            & (bs_data["sentAt"] >= one_year_ago)
-        ]
-
-        self.incoming_data_by_month = (
-            incoming_data.groupby(pd.Grouper(key="receivedAt", freq="1M"))[
-                "quantityReceived"
-            ]
-            .sum()
-            .replace(0, np.nan)
-        )
-
-        self.outgoing_data_by_month = (
-            outgoing_data.groupby(pd.Grouper(key="sentAt", freq="1M"))[
-                "quantityReceived"
-            ]
-            .sum()
-            .replace(0, np.nan)
-        )
+        min_month = pd.Timestamp(one_year_ago, tz="UTC")
+        # 'bordereaux' received after today are left out, so that the serie stops at the current month
+        self.incoming_data_by_month = get_monthly_serie(
+            self.bs_monthly_data,
+            "recipient",
+            "receivedAt",
+            value_column="quantity",
+            min_month=min_month,
+            until_now=True,
+        ).replace(0, np.nan)
+        self.outgoing_data_by_month = get_monthly_serie(
+            self.bs_monthly_data,
+            "emitter",
+            "sentAt",
+            value_column="quantity",
+            min_month=min_month,
+        ).replace(0, np.nan)
 
     def _check_data_empty(self) -> bool:
 
@@ -385,20 +381,28 @@ class BSRefusalsComponent(FigureComponent):
         Title of the component that will be displayed in the component layout.
     company_siret: str
         SIRET number of the establishment for which the data is displayed (used for data preprocessing).
-    bs_data_dfs: dict
-        Dict with key being the 'bordereau' type and values the DataFrame containing the bordereau data.
+    bs_monthly_data_dfs: dict
+        Dict with key being the 'bordereau' type and values the monthly aggregates of the 'bordereaux'
+        (see `app.data.analysis_context.create_bs_monthly_data`).
     """
 
+    # Columns used to compute the monthly aggregates (see `create_bs_monthly_data`)
+    required_bs_columns = [
+        "emitterCompanySiret",
+        "status",
+        "createdAt",
+    ]
+
     def __init__(
         self,
         component_title: str,
         company_siret: str,
-        bs_data_dfs: Dict[str, pd.DataFrame],
+        bs_monthly_data_dfs: Dict[str, pd.DataFrame],
     ) -> None:
 
         super().__init__(component_title, company_siret)
 
-        self.bs_data_dfs = bs_data_dfs
+        self.bs_monthly_data_dfs = bs_monthly_data_dfs
 
         self.preprocessed_series = None
 
@@ -419,14 +423,10 @@ class BSRefusalsComponent(FigureComponent):
     def _preprocess_data(self) -> None:
 
         preprocessed_series = {}
-        for name, df in self.bs_data_dfs.items():
-            preprocessed_serie = (
-                df[
-                    (df["emitterCompanySiret"] == self.company_siret)
-                    & (df["status"] == "REFUSED")
-                ]
-                .groupby(pd.Grouper(key="createdAt", freq="1M"))
-                .id.count()
+
+        for name, df in self.bs_monthly_data_dfs.items():
+            preprocessed_serie = get_monthly_serie(
+                df, "emitter", "createdAt", statuses=["REFUSED"]
             )
             if len(preprocessed_serie) > 0:
                 preprocessed_series[name] = preprocessed_serie
@@ -486,38 +486,44 @@ class WasteOriginsComponent(FigureComponent):
         Title of the component that will be displayed in the component layout.
     company_siret: str
         SIRET number of the establishment for which the data is displayed (used for data preprocessing).
-    bs_data_dfs: dict
-        Dict with key being the 'bordereau' type and values the DataFrame containing the bordereau data.
+    bs_analysis_data: DataFrame
+        'bordereaux' data of all types with the analysis columns (see `app.data.analysis_context`),
+        None if there is no 'bordereaux' data.
     departements_regions_df: DataFrame
         Static data about regions and départements with their codes.
     """
 
+    required_bs_columns = [
+        "emitterCompanyPostalCode",
+        "recipientCompanySiret",
+        "quantityReceived",
+    ]
+
     def __init__(
         self,
         component_title: str,
         company_siret: str,
-        bs_data_dfs: Dict[str, pd.DataFrame],
+        bs_analysis_data: pd.DataFrame,
         departements_regions_df: pd.DataFrame,
     ) -> None:
         super().__init__(component_title, company_siret)
-        self.bs_data_dfs = bs_data_dfs
+        self.bs_analysis_data = bs_analysis_data
         self.departements_regions_df = departements_regions_df
 
         self.preprocessed_serie = None
 
     def _preprocess_data(self) -> None:
 
-        if len(self.bs_data_dfs) == 0:
+        if self.bs_analysis_data is None:
             return
 
-        concat_df = pd.concat(list(self.bs_data_dfs.values()))
+        df = self.bs_analysis_data
+        incoming_df = df.loc[df["is_incoming"], ["code_dep", "quantityReceived"]]
+        if len(incoming_df) == 0:
+            return
 
-        concat_df["cp"] = concat_df["emitterCompanyAddress"].str.extract(
-            r"([0-9]{5})", expand=False
-        )
-        concat_df["code_dep"] = concat_df["cp"].apply(get_code_departement)
         concat_df = pd.merge(
-            concat_df,
+            incoming_df,
             self.departements_regions_df,
             left_on="code_dep",
             right_on="DEP",
@@ -529,11 +535,7 @@ class WasteOriginsComponent(FigureComponent):
             concat_df["LIBELLE_dep"] + " (" + concat_df["code_dep"] + ")"
         )
         concat_df.loc[concat_df["code_dep"].isna(), "cp_formatted"] = "Origine inconnue"
-        serie = (
-            concat_df[concat_df["recipientCompanySiret"] == self.company_siret]
-            .groupby("cp_formatted")["quantityReceived"]
-            .sum()
-        )
+        serie = concat_df.groupby("cp_formatted")["quantityReceived"].sum()
 
         serie.sort_values(ascending=False, inplace=True)
 
@@ -643,25 +645,32 @@ class WasteOriginsMapComponent(FigureComponent):
         Title of the component that will be displayed in the component layout.
     company_siret: str
         SIRET number of the establishment for which the data is displayed (used for data preprocessing).
-    bs_data_dfs: dict
-        Dict with key being the 'bordereau' type and values the DataFrame containing the bordereau data.
+    bs_analysis_data: DataFrame
+        'bordereaux' data of all types with the analysis columns (see `app.data.analysis_context`),
+        None if there is no 'bordereaux' data.
     departements_regions_df: DataFrame
         Static data about regions and départements with their codes.
     regions_geodata: GeoDataFrame
         GeoDataFrame including regions geometries.
     """
 
+    required_bs_columns = [
+        "emitterCompanyPostalCode",
+        "recipientCompanySiret",
+        "quantityReceived",
+    ]
+
     def __init__(
         self,
         component_title: str,
         company_siret: str,
-        bs_data_dfs: Dict[str, pd.DataFrame],
+        bs_analysis_data: pd.DataFrame,
         departements_regions_df: pd.DataFrame,
         regions_geodata: gpd.GeoDataFrame,
     ) -> None:
         super().__init__(component_title, company_siret)
 
-        self.bs_data_dfs = bs_data_dfs
+        self.bs_analysis_data = bs_analysis_data
         self.departements_regions_df = departements_regions_df
         self.regions_geodata = regions_geodata
 
@@ -669,27 +678,24 @@ class WasteOriginsMapComponent(FigureComponent):
 
     def _preprocess_data(self) -> None:
 
-        if len(self.bs_data_dfs) == 0:
+        if self.bs_analysis_data is None:
             return
 
-        concat_df = pd.concat(list(self.bs_data_dfs.values()))
+        df = self.bs_analysis_data
+        incoming_df = df.loc[df["is_incoming"], ["code_dep", "quantityReceived"]]
+        if len(incoming_df) == 0:
+            return
 
-        concat_df["cp"] = concat_df["emitterCompanyAddress"].str.extract(
-            r"([0-9]{5})", expand=False
-        )
-        concat_df["code_dep"] = concat_df["cp"].apply(get_code_departement)
         concat_df = pd.merge(
-            concat_df,
+            incoming_df,
             self.departements_regions_df,
             left_on="code_dep",
             right_on="DEP",
             how="left",
             validate="many_to_one",
         )
-        df_grouped = (
-            concat_df[concat_df["recipientCompanySiret"] == self.company_siret]
-            .groupby("LIBELLE_reg")
-            .aggregate({"quantityReceived": "sum", "REG": "max"})
+        df_grouped = concat_df.groupby("LIBELLE_reg").aggregate(
+            {"quantityReceived": "sum", "REG": "max"}
         )
 
         final_df = pd.merge(
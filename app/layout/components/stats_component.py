@@ -1,11 +1,16 @@
 import re
-from datetime import datetime, timedelta, timezone
+from datetime import datetime
 from typing import Dict
 
-import numpy as np
 import pandas as pd
 from dash_extensions.enrich import html
 
+from app.data.compact_dtypes import siret_equals
+from app.data.quantity_rules import (
+    QUANTITY_OUTLIER_REASON_COLUMN,
+    QUANTITY_OUTLIERS_LABELS,
+)
+
 from .base_component import BaseComponent
 from .utils import format_number_str
 
@@ -19,24 +24,31 @@ class BSStatsComponent(BaseComponent):
         Title of the component that will be displayed in the component layout.
     company_siret: str
         SIRET number of the establishment for which the data is displayed (used for data preprocessing).
-    bs_data: DataFrame
-        DataFrame containing data for a given 'bordereau' type.
-    bs_revised_data: DataFrame
-        DataFrame containing list of revised 'bordereaux' for a given 'bordereau' type.
+    bs_stats: Series
+        Annual statistics of a given 'bordereau' type, computed by `app.data.analysis_context.compute_bs_stats`.
     """
 
+    # Columns used to compute the statistics (see `compute_bs_stats`)
+    required_bs_columns = [
+        "emitterCompanySiret",
+        "recipientCompanySiret",
+        "status",
+        "sentAt",
+        "receivedAt",
+        "processedAt",
+        "quantityReceived",
+    ]
+
     def __init__(
         self,
         component_title: str,
         company_siret: str,
-        bs_data: pd.DataFrame,
-        bs_revised_data: pd.DataFrame = None,
+        bs_stats: pd.Series,
     ) -> None:
 
         super().__init__(component_title, company_siret)
 
-        self.bs_data = bs_data
-        self.bs_revised_data = bs_revised_data
+        self.bs_stats = bs_stats
 
         self.emitted_bs_count = None
         self.archived_bs_count = None
@@ -49,13 +61,10 @@ class BSStatsComponent(BaseComponent):
 
     def _check_data_empty(self) -> bool:
 
-        bs_data = self.bs_data
-        siret = self.company_siret
-        bs_data = bs_data[bs_data["emitterCompanySiret"] == siret]
-        bs_revised_data = self.bs_revised_data
+        bs_stats = self.bs_stats
 
-        if (len(bs_data) == 0) and (
-            (bs_revised_data is None) or (len(bs_revised_data) == 0)
+        if (bs_stats is None) or (
+            (bs_stats["emitted_bs_count"] == 0) and (bs_stats["revised_bs_count"] == 0)
         ):
             self.is_component_empty = True
             return True
@@ -65,55 +74,17 @@ class BSStatsComponent(BaseComponent):
 
     def _preprocess_data(self) -> None:
 
-        one_year_ago = (
-            datetime.utcnow().replace(tzinfo=timezone.utc) - timedelta(days=365)
-        ).strftime("%Y-%m-01")
+        bs_stats = self.bs_stats
 
-        bs_data = self.bs_data
-        bs_revised_data = self.bs_revised_data
-        siret = self.company_siret
-
-        self.emitted_bs_count = len(bs_data[bs_data["emitterCompanySiret"] == siret])
-        self.archived_bs_count = len(
-            bs_data[
-                (bs_data["emitterCompanySiret"] == siret)
-                & bs_data["status"].isin(["PROCESSED", "REFUSED", "NO_TRACEABILITY"])
-            ]
-        )
-        self.revised_bs_count = (
-            bs_revised_data["bsId"].nunique() if bs_revised_data is not None else 0
-        )
-        self.more_than_one_month_bs_count = len(
-            bs_data[
-                (bs_data["recipientCompanySiret"] == siret)
-                & (
-                    (bs_data["processedAt"] - bs_data["receivedAt"])
-                    > np.timedelta64(1, "M")
-                )
-            ]
-        )
-        self.total_incoming_weight = bs_data.loc[
-            (bs_data["recipientCompanySiret"] == siret)
-            & (bs_data["receivedAt"] >= one_year_ago),
-            "quantityReceived",
-        ].sum()
-        self.total_outgoing_weight = bs_data.loc[
-            (bs_data["emitterCompanySiret"] == siret)
-            & (bs_data["sentAt"] >= one_year_ago),
-            "quantityReceived",
-        ].sum()
-
-        if self.total_outgoing_weight != 0:
-            self.theorical_stock = (
-                self.total_incoming_weight - self.total_outgoing_weight
-            )
-        else:
-            self.theorical_stock = 0
-
-        if self.total_incoming_weight != 0:
-            self.fraction_outgoing = int(
-                round(self.total_outgoing_weight / self.total_incoming_weight, 2) * 100
-            )
+        self.emitted_bs_count = bs_stats["emitted_bs_count"]
+        self.archived_bs_count = bs_stats["archived_bs_count"]
+        self.revised_bs_count = bs_stats["revised_bs_count"]
+        self.more_than_one_month_bs_count = bs_stats["more_than_one_month_bs_count"]
+        self.total_incoming_weight = bs_stats["total_incoming_weight"]
+        self.total_outgoing_weight = bs_stats["total_outgoing_weight"]
+        self.theorical_stock = bs_stats["theorical_stock"]
+        if not pd.isna(bs_stats["fraction_outgoing"]):
+            self.fraction_outgoing = int(bs_stats["fraction_outgoing"])
 
     def _add_stats(self) -> None:
 
@@ -268,23 +239,33 @@ class StorageStatsComponent(BaseComponent):
         Title of the component that will be displayed in the component layout.
     company_siret: str
         SIRET number of the establishment for which the data is displayed (used for data preprocessing).
-    bs_data_dfs: dict
-        Dict with key being the 'bordereau' type and values the DataFrame containing the bordereau data.
+    bs_analysis_data: DataFrame
+        'bordereaux' data of all types with the analysis columns (see `app.data.analysis_context`),
+        None if there is no 'bordereaux' data.
     waste_codes_df: DataFrame
         DataFrame containing list of waste codes with their descriptions.
     """
 
+    required_bs_columns = [
+        "emitterCompanySiret",
+        "recipientCompanySiret",
+        "sentAt",
+        "receivedAt",
+        "wasteCode",
+        "quantityReceived",
+    ]
+
     def __init__(
         self,
         component_title: str,
         company_siret: str,
-        bs_data_dfs: Dict[str, pd.DataFrame],
+        bs_analysis_data: pd.DataFrame,
         waste_codes_df: pd.DataFrame,
     ) -> None:
 
         super().__init__(component_title, company_siret)
 
-        self.bs_data_dfs = bs_data_dfs
+        self.bs_analysis_data = bs_analysis_data
         self.waste_codes_df = waste_codes_df
 
         self.stock_by_waste_code = None
@@ -292,20 +273,24 @@ class StorageStatsComponent(BaseComponent):
 
     def _preprocess_data(self) -> pd.Series:
 
-        siret = self.company_siret
+        df = self.bs_analysis_data
 
-        dfs_to_concat = [df for df in self.bs_data_dfs.values()]
-
-        if len(dfs_to_concat) == 0:
+        if df is None:
             self.stock_by_waste_code = pd.Series()
             return
 
-        df = pd.concat(dfs_to_concat)
-
-        emitted_mask = (df.emitterCompanySiret == siret) & ~df.sentAt.isna()
-        received_mask = (df.recipientCompanySiret == siret) & ~df.receivedAt.isna()
-        emitted = df[emitted_mask].groupby("wasteCode")["quantityReceived"].sum()
-        received = df[received_mask].groupby("wasteCode")["quantityReceived"].sum()
+        emitted_mask = df.is_outgoing & ~df.sentAt.isna()
+        received_mask = df.is_incoming & ~df.receivedAt.isna()
+        emitted = (
+            df[emitted_mask]
+            .groupby("wasteCode", observed=True)["quantityReceived"]
+            .sum()
+        )
+        received = (
+            df[received_mask]
+            .groupby("wasteCode", observed=True)["quantityReceived"]
+            .sum()
+        )
 
         stock_by_waste_code: pd.Series = (
             (-emitted + received).fillna(-emitted).fillna(received)
@@ -507,6 +492,20 @@ class AdditionalInfoComponent(BaseComponent):
         quantity_outliers_bs_list_layout = []
         for bs_type, outlier_data in self.quantity_outliers_data.items():
 
+            # Rules that flagged the lines (lines stored before the reason codes were kept have none)
+            reasons = outlier_data.get(QUANTITY_OUTLIER_REASON_COLUMN)
+            rules_layout = []
+            if reasons is not None and reasons.notna().any():
+                rules_layout = [
+                    html.Div(
+                        "Règle(s) : "
+                        + ", ".join(
+                            QUANTITY_OUTLIERS_LABELS.get(reason, reason)
+                            for reason in reasons.dropna().unique()
+                        )
+                    )
+                ]
+
             quantity_outliers_bs_list_layout.append(
                 html.Li(
                     [
@@ -520,6 +519,7 @@ class AdditionalInfoComponent(BaseComponent):
                                 ),
                             ]
                         ),
+                        *rules_layout,
                         html.Button(
                             "Télécharger les données correspondantes",
                             id={
@@ -574,26 +574,35 @@ class ICPEItemsComponent(BaseComponent):
         SIRET number of the establishment for which the data is displayed (used for data preprocessing).
     icpe_data: DataFrame
         DataFrame containing list of ICPE authorized items
-    bs_data_dfs: dict
-        Dict with key being the 'bordereau' type and values the DataFrame containing the bordereau data.
+    bs_analysis_data: DataFrame
+        'bordereaux' data of all types with the analysis columns (see `app.data.analysis_context`),
+        None if there is no 'bordereaux' data.
     mapping_processing_operation_code_rubrique: DataFrame
         Mapping between operation codes and rubriques.
 
     """
 
+    required_bs_columns = [
+        "emitterCompanySiret",
+        "recipientCompanySiret",
+        "processedAt",
+        "processing_operation_code",
+        "quantityReceived",
+    ]
+
     def __init__(
         self,
         component_title: str,
         company_siret: str,
         icpe_data: pd.DataFrame,
-        bs_data_dfs: Dict[str, pd.DataFrame],
+        bs_analysis_data: pd.DataFrame,
         mapping_processing_operation_code_rubrique: pd.DataFrame,
     ) -> None:
 
         super().__init__(component_title, company_siret)
 
         self.icpe_data = icpe_data
-        self.bs_data_dfs = bs_data_dfs
+        self.bs_analysis_data = bs_analysis_data
 
         self.unit_pattern = re.compile(
             r"""^t$
@@ -621,44 +630,35 @@ class ICPEItemsComponent(BaseComponent):
 
     def _preprocess_data(self) -> None:
 
-        preprocessed_inputs_dfs = []
-        preprocessed_output_dfs = []
         actual_year = datetime.now().year
-        for df in self.bs_data_dfs.values():
-            df = df.dropna(subset=["processing_operation_code"])
-
-            if len(df) == 0:
-                continue
-
-            df["processing_operation_code"] = df[
-                "processing_operation_code"
-            ].str.replace(" ", "", regex=False)
-
-            df = pd.merge(
-                df,
-                self.mapping_processing_operation_code_rubrique,
-                left_on="processing_operation_code",
-                right_on="code_operation",
-                validate="many_to_many",
-                how="left",
-            )
-
-            preprocessed_inputs_dfs.append(
-                df[(df["recipientCompanySiret"] == self.company_siret)]
-            )
-            preprocessed_output_dfs.append(
-                df[(df["emitterCompanySiret"] == self.company_siret)]
-            )
-
-        if len(preprocessed_inputs_dfs) == 0:
+        if self.bs_analysis_data is None:
             return
 
-        if all(len(df) == 0 for df in preprocessed_inputs_dfs):
+        # Operation codes are already normalized in the analysis data
+        df = self.bs_analysis_data[
+            [
+                "processing_operation_code",
+                "processedAt",
+                "quantityReceived",
+                "is_incoming",
+                "is_outgoing",
+            ]
+        ]
+        df = pd.merge(
+            df.dropna(subset=["processing_operation_code"]),
+            self.mapping_processing_operation_code_rubrique,
+            left_on="processing_operation_code",
+            right_on="code_operation",
+            validate="many_to_many",
+            how="left",
+        )
+        preprocessed_inputs = df[df["is_incoming"]]
+        preprocessed_outputs = df[df["is_outgoing"]]
+
+        if len(preprocessed_inputs) == 0:
             return
 
         # 2718 preprocessing
-        preprocessed_inputs = pd.concat(preprocessed_inputs_dfs)
-        preprocessed_outputs = pd.concat(preprocessed_output_dfs)
 
         preprocessed_inputs_filtered = preprocessed_inputs[
             (preprocessed_inputs["rubrique"] == "2718")
@@ -695,7 +695,7 @@ class ICPEItemsComponent(BaseComponent):
         # 2760 preprocessing
         quantity = preprocessed_inputs.loc[
             (preprocessed_inputs["rubrique"] == "2760-1")
-            & (preprocessed_outputs["processedAt"].dt.year == actual_year),
+            & (preprocessed_inputs["processedAt"].dt.year == actual_year),
             "quantityReceived",
         ].sum()
         if quantity > 0:
@@ -918,25 +918,34 @@ class ICPEInfoComponent(BaseComponent):
         SIRET number of the establishment for which the data is displayed (used for data preprocessing).
     icpe_data: DataFrame
         DataFrame containing list of ICPE authorized items
-    bs_data_dfs: dict
-        Dict with key being the 'bordereau' type and values the DataFrame containing the bordereau data.
+    bs_analysis_data: DataFrame
+        'bordereaux' data of all types with the analysis columns (see `app.data.analysis_context`),
+        None if there is no 'bordereaux' data.
     mapping_processing_operation_code_rubrique: DataFrame
         Mapping between operation codes and rubriques.
     """
 
+    required_bs_columns = [
+        "recipientCompanySiret",
+        "receivedAt",
+        "wasteCode",
+        "wastePop",
+        "processing_operation_code",
+    ]
+
     def __init__(
         self,
         component_title: str,
         company_siret: str,
         icpe_data: pd.DataFrame,
-        bs_data_dfs: Dict[str, pd.DataFrame],
+        bs_analysis_data: pd.DataFrame,
         mapping_processing_operation_code_rubrique: pd.DataFrame,
     ) -> None:
 
         super().__init__(component_title, company_siret)
 
         self.icpe_data = icpe_data
-        self.bs_data_dfs = bs_data_dfs
+        self.bs_analysis_data = bs_analysis_data
 
         self.unit_pattern = re.compile(
             r"""^t$
@@ -959,16 +968,15 @@ class ICPEInfoComponent(BaseComponent):
 
     def _preprocess_data(self) -> None:
 
-        full_df = pd.concat(self.bs_data_dfs.values())
-        full_df = full_df[
-            (full_df["recipientCompanySiret"] == self.company_siret)
-            & (full_df["receivedAt"].notna())
-        ]
+        if self.bs_analysis_data is None:
+            return
+
+        full_df = self.bs_analysis_data
+        full_df = full_df[full_df["is_incoming"] & (full_df["receivedAt"].notna())]
 
         if len(full_df) == 0:
             return
 
-
         if (
             full_df["wasteCode"].str.contains("*", regex=False).any()
             or full_df["wastePop"].any()
@@ -1058,6 +1066,14 @@ class TraceabilityInterruptionsComponent(BaseComponent):
 
     """
 
+    required_bs_columns = [
+        "id",
+        "recipientCompanySiret",
+        "wasteCode",
+        "noTraceability",
+        "quantityReceived",
+    ]
+
     def __init__(
         self,
         component_title: str,
@@ -1080,15 +1096,20 @@ class TraceabilityInterruptionsComponent(BaseComponent):
 
         df_filtered = self.bsdd_data[
             self.bsdd_data["noTraceability"]
-            & (self.bsdd_data["recipientCompanySiret"] == self.company_siret)
+            & siret_equals(self.bsdd_data["recipientCompanySiret"], self.company_siret)
         ]
 
         if len(df_filtered) == 0:
             return
 
-        df_grouped = df_filtered.groupby("wasteCode", as_index=False).agg(
-            quantity=pd.NamedAgg(column="quantityReceived", aggfunc="sum"),
-            count=pd.NamedAgg(column="id", aggfunc="count"),
+        # With observed=True, pandas keeps categorical keys in order of appearance
+        df_grouped = (
+            df_filtered.groupby("wasteCode", as_index=False, observed=True)
+            .agg(
+                quantity=pd.NamedAgg(column="quantityReceived", aggfunc="sum"),
+                count=pd.NamedAgg(column="id", aggfunc="count"),
+            )
+            .sort_values("wasteCode", ignore_index=True)
         )
 
         final_df = pd.merge(
@@ -1,5 +1,4 @@
-from typing import Dict
-
+import numpy as np
 import pandas as pd
 from dash_extensions.enrich import dash_table
 
@@ -16,44 +15,49 @@ class InputOutputWasteTableComponent(BaseComponent):
         Title of the component that will be displayed in the component layout.
     company_siret: str
         SIRET number of the establishment for which the data is displayed (used for data preprocessing).
-    bs_data_dfs: dict
-        Dict with key being the 'bordereau' type and values the DataFrame containing the bordereau data.
+    bs_analysis_data: DataFrame
+        'bordereaux' data of all types with the analysis columns (see `app.data.analysis_context`),
+        None if there is no 'bordereaux' data.
     waste_codes_df: DataFrame
         DataFrame containing list of waste codes with their descriptions.
     """
 
+    required_bs_columns = [
+        "emitterCompanySiret",
+        "recipientCompanySiret",
+        "wasteCode",
+        "quantityReceived",
+    ]
+
     def __init__(
         self,
         component_title: str,
         company_siret: str,
-        bs_data_dfs: Dict[str, pd.DataFrame],
+        bs_analysis_data: pd.DataFrame,
         waste_codes_df: pd.DataFrame,
     ) -> None:
         super().__init__(component_title, company_siret)
 
-        self.bs_data_dfs = bs_data_dfs
+        self.bs_analysis_data = bs_analysis_data
         self.waste_codes_df = waste_codes_df
 
         self.preprocessed_df = None
 
     def _preprocess_data(self) -> None:
-        siret = self.company_siret
 
-        dfs_to_concat = [df for df in self.bs_data_dfs.values()]
-
-        if len(dfs_to_concat) == 0:
+        if self.bs_analysis_data is None:
             self.preprocessed_df = pd.DataFrame()
             return
 
-        df = pd.concat(dfs_to_concat)
-        df = df[(df.emitterCompanySiret == siret) | (df.recipientCompanySiret == siret)]
-        df["Entrant/Sortant"] = df.apply(
-            lambda x: "sortant➡️" if x["emitterCompanySiret"] == siret else "➡️entrant",
-            axis=1,
-        )
+        df = self.bs_analysis_data
+        df = df.loc[
+            df["is_outgoing"] | df["is_incoming"],
+            ["wasteCode", "quantityReceived", "is_outgoing"],
+        ]
+        df["Entrant/Sortant"] = np.where(df["is_outgoing"], "sortant➡️", "➡️entrant")
 
         df_grouped = (
-            df.groupby(["wasteCode", "Entrant/Sortant"], as_index=False)[
+            df.groupby(["wasteCode", "Entrant/Sortant"], as_index=False, observed=True)[
                 "quantityReceived"
             ]
             .sum()
@@ -1,25 +1,71 @@
 import re
+from typing import List
 
-import numpy as np
 import pandas as pd
 
 
-def get_code_departement(postal_code: str) -> str:
-    """Take a postal code and returns the département code."""
-    if pd.isna(postal_code):
-        return np.nan
-    if 20000 <= int(postal_code) < 21000:
-        if int(postal_code) <= 20190:
-            return "2A"
-        else:
-            return "2B"
-    if int(postal_code) > 97000:
-        return postal_code[:3]
-
-    return postal_code[:2]
-
-
 def format_number_str(input_number: float, precision: int = 2) -> str:
     """Format a float to a string with thousands separated by space and rounding it at the given precision."""
     input_number = round(input_number, precision)
     return re.sub(r"\.0$", "", "{:,}".format(input_number).replace(",", " "))
+
+
+def get_monthly_serie(
+    bs_monthly_data: pd.DataFrame,
+    direction: str,
+    date_column: str,
+    value_column: str = "count",
+    statuses: List[str] = None,
+    min_month: pd.Timestamp = None,
+    until_now: bool = False,
+) -> pd.Series:
+    """Builds a monthly serie from the monthly aggregates of 'bordereaux' data (see `app.data.analysis_context.create_bs_monthly_data`).
+
+    The serie has the same index as a `groupby(pd.Grouper(key=date_column, freq="1M"))` on the raw data :
+    month ends, with every month between the first and last months of data.
+
+    Parameters
+    ----------
+    bs_monthly_data : DataFrame
+        Monthly aggregates of a 'bordereau' type.
+    direction : str
+        'emitter' for the 'bordereaux' emitted by the company, 'recipient' for the ones it received.
+    date_column : str
+        Date column the aggregates are grouped by (createdAt, sentAt or receivedAt).
+    value_column : str
+        'count' for the number of 'bordereaux', 'quantity' for the sum of the received quantities.
+    statuses : list of str
+        If given, only the 'bordereaux' with these statuses are taken into account.
+    min_month : Timestamp
+        If given, only the months starting from this one are taken into account.
+    until_now : bool
+        If True, only the 'bordereaux' dated up to now are taken into account
+        (aggregates of the specs with `until_now`, see `app.data.analysis_context.BS_MONTHLY_DATA_SPECS`).
+
+    Returns
+    -------
+    Series
+        Serie indexed by month.
+    """
+
+    df = bs_monthly_data[
+        (bs_monthly_data["direction"] == direction)
+        & (bs_monthly_data["date_column"] == date_column)
+        & (bs_monthly_data["until_now"] == until_now)
+    ]
+    if statuses is not None:
+        df = df[df["status"].isin(statuses)]
+    if min_month is not None:
+        df = df[df["month"] >= min_month]
+
+    serie = df.groupby("month")[value_column].sum()
+    serie.index = serie.index + pd.offsets.MonthEnd(0)
+
+    if len(serie) > 0:
+        serie = serie.reindex(
+            pd.date_range(serie.index.min(), serie.index.max(), freq="M"),
+            fill_value=0,
+        )
+    serie.index.name = date_column
+
+    return serie
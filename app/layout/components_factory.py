@@ -40,6 +40,74 @@ PROCESSING_OPERATION_CODE_RUBRIQUE_MAPPING = (
     load_mapping_rubrique_processing_operation_code()
 )
 
+# Components displaying 'bordereaux' data, their required columns make the projection of the 'bordereaux' queries
+BS_DATA_COMPONENTS = [
+    BSCreatedAndRevisedComponent,
+    StockComponent,
+    BSStatsComponent,
+    BSRefusalsComponent,
+    StorageStatsComponent,
+    WasteOriginsComponent,
+    WasteOriginsMapComponent,
+    InputOutputWasteTableComponent,
+    ICPEItemsComponent,
+    ICPEInfoComponent,
+    TraceabilityInterruptionsComponent,
+]
+
+# Labels of the data fetched by `get_data_for_siret`, displayed when its extraction failed
+FAILED_DATA_LABELS = {
+    "receipts_agreements": "récépissés et agréments",
+    "icpe": "installations classées (ICPE)",
+    "BSDD": "BSDD",
+    "BSDA": "BSDA",
+    "BSFF": "BSFF",
+    "BSDASRI": "BSDASRI",
+    "BSVHU": "BSVHU",
+    "bs_revised": "révisions de bordereaux",
+}
+
+
+def get_required_bs_columns() -> List[str]:
+    """Returns the 'bordereaux' data columns used by at least one of the enabled components.
+
+    Returns
+    -------
+    list of str
+        Names of the columns, without duplicates.
+    """
+
+    return list(
+        dict.fromkeys(
+            column
+            for component in BS_DATA_COMPONENTS
+            for column in component.required_bs_columns
+        )
+    )
+
+
+def create_data_error_block(failed_data: List[str]) -> html.Div:
+    """Creates the block displayed in a section when some of its data could not be fetched.
+
+    Parameters
+    ----------
+    failed_data : list of str
+        Names of the data whose extraction failed (keys of `FAILED_DATA_LABELS`).
+
+    Returns
+    -------
+    dash component
+        Block to insert into the layout of the section.
+    """
+
+    labels = ", ".join(FAILED_DATA_LABELS[e] for e in failed_data)
+
+    return html.Div(
+        f"ERREUR LORS DE LA RÉCUPÉRATION DES DONNÉES ({labels}) : "
+        "les informations qui en dépendent sont absentes ou incomplètes.",
+        className="fr-text--lead data-error-message",
+    )
+
 
 def create_company_infos(
     company_data: pd.Series, receipts_agreements_data: Dict[str, pd.DataFrame]
@@ -122,17 +190,18 @@ def create_bs_components_layouts(
 
     siret = company_data["siret"]
 
-    bs_data_df = bs_data["bs_data"]
-
     if bs_data.get("bs_revised_data") is not None:
         bs_revised_data_df = bs_data["bs_revised_data"]
     else:
         bs_revised_data_df = None
 
+    # Monthly aggregates of the 'bordereaux', sliced by the time series figures
+    bs_monthly_data_df = bs_data["bs_monthly_data"]
+
     bs_created_revised_component = BSCreatedAndRevisedComponent(
         component_title=components_titles[0],
         company_siret=siret,
-        bs_data=bs_data_df,
+        bs_monthly_data=bs_monthly_data_df,
         bs_revised_data=bs_revised_data_df,
     )
     bs_created_revised_component_layout = bs_created_revised_component.create_layout()
@@ -140,15 +209,14 @@ def create_bs_components_layouts(
     stock_component = StockComponent(
         component_title=components_titles[1],
         company_siret=siret,
-        bs_data=bs_data_df,
+        bs_monthly_data=bs_monthly_data_df,
     )
     stock_component_layout = stock_component.create_layout()
 
     annual_stats_component = BSStatsComponent(
         component_title=components_titles[2],
         company_siret=siret,
-        bs_data=bs_data_df,
-        bs_revised_data=bs_revised_data_df,
+        bs_stats=bs_data.get("bs_stats"),
     )
 
     annual_stats_layout = annual_stats_component.create_layout()
@@ -228,12 +296,12 @@ def create_complementary_figure_components(
         "DASRI": bsdasri_data,
         "VHU": bsvhu_data,
     }
-    dfs = {k: v.get("bs_data") for k, v in dfs.items() if v is not None}
+    monthly_dfs = {k: v["bs_monthly_data"] for k, v in dfs.items() if v is not None}
 
     bs_refusals_component = BSRefusalsComponent(
         component_title=r"Nombre de bordereaux refusés",
         company_siret=siret,
-        bs_data_dfs=dfs,
+        bs_monthly_data_dfs=monthly_dfs,
     )
 
     bs_refusals_component.create_layout()
@@ -285,11 +353,7 @@ def create_complementary_figure_components(
 
 def create_onsite_waste_components(
     company_data: pd.Series,
-    bsdd_data: pd.DataFrame,
-    bsda_data: pd.DataFrame,
-    bsff_data: pd.DataFrame,
-    bsdasri_data: pd.DataFrame,
-    bsvhu_data: pd.DataFrame,
+    bs_analysis_data: pd.DataFrame,
 ) -> list:
     """Creates the components about on site wastes (three components).
 
@@ -297,16 +361,9 @@ def create_onsite_waste_components(
     ----------
     company_data : Series
         Series containing company data.
-    bsdd_data: str
-        DataFrame containing data for BSDDs.
-    bsda_data: str
-        DataFrame containing data for BSDAs.
-    bsff_data: str
-        DataFrame containing data for BSFFs.
-    bsdasri_data: str
-        DataFrame containing data for BSDASRIs.
-    bsvhu_data: str
-        DataFrame containing data for BSVHUs.
+    bs_analysis_data: DataFrame
+        'bordereaux' data of all types with the analysis columns (see `app.data.analysis_context`),
+        None if there is no 'bordereaux' data.
 
     Returns
     -------
@@ -316,19 +373,10 @@ def create_onsite_waste_components(
 
     siret = company_data["siret"]
 
-    dfs = {
-        "Déchets Dangereux": bsdd_data,
-        "Amiante": bsda_data,
-        "Fluides Frigo": bsff_data,
-        "DASRI": bsdasri_data,
-        "VHU": bsvhu_data,
-    }
-    dfs = {k: v.get("bs_data") for k, v in dfs.items() if v is not None}
-
     storage_stats_component = StorageStatsComponent(
         component_title="Déchets entreposés sur site actuellement",
         company_siret=siret,
-        bs_data_dfs=dfs,
+        bs_analysis_data=bs_analysis_data,
         waste_codes_df=WASTE_CODES_DATA,
     )
 
@@ -337,7 +385,7 @@ def create_onsite_waste_components(
     waste_origins_component = WasteOriginsComponent(
         component_title="Origine des déchets",
         company_siret=siret,
-        bs_data_dfs=dfs,
+        bs_analysis_data=bs_analysis_data,
         departements_regions_df=DEPARTEMENTS_REGION_DATA,
     )
     waste_origins_component_layout = waste_origins_component.create_layout()
@@ -345,7 +393,7 @@ def create_onsite_waste_components(
     waste_origins_map_component = WasteOriginsMapComponent(
         component_title="Origine des déchets",
         company_siret=siret,
-        bs_data_dfs=dfs,
+        bs_analysis_data=bs_analysis_data,
         departements_regions_df=DEPARTEMENTS_REGION_DATA,
         regions_geodata=REGIONS_GEODATA,
     )
@@ -387,11 +435,7 @@ def create_onsite_waste_components(
 
 def create_waste_input_output_table_component(
     company_data: pd.Series,
-    bsdd_data: pd.DataFrame,
-    bsda_data: pd.DataFrame,
-    bsff_data: pd.DataFrame,
-    bsdasri_data: pd.DataFrame,
-    bsvhu_data: pd.DataFrame,
+    bs_analysis_data: pd.DataFrame,
 ) -> list:
     """Creates the table component with the list of inbound and outbound wastes.
 
@@ -399,17 +443,9 @@ def create_waste_input_output_table_component(
     ----------
     company_data : Series
         Series containing company data.
-    bsdd_data: DataFrame
-        DataFrame containing data for BSDDs.
-    bsda_data: DataFrame
-        DataFrame containing data for BSDAs.
-    bsff_data: DataFrame
-        DataFrame containing data for BSFFs.
-    bsdasri_data: DataFrame
-        DataFrame containing data for BSDASRIs.
-    bsvhu_data: DataFrame
-        DataFrame containing data for BSVHUs.
-
+    bs_analysis_data: DataFrame
+        'bordereaux' data of all types with the analysis columns (see `app.data.analysis_context`),
+        None if there is no 'bordereaux' data.
 
     Returns
     -------
@@ -420,20 +456,10 @@ def create_waste_input_output_table_component(
 
     siret = company_data["siret"]
 
-    dfs = {
-        "Déchets Dangereux": bsdd_data,
-        "Amiante": bsda_data,
-        "Fluides Frigo": bsff_data,
-        "DASRI": bsdasri_data,
-        "VHU": bsvhu_data,
-    }
-
-    dfs = {k: v.get("bs_data") for k, v in dfs.items() if v is not None}
-
     input_output_waste_component = InputOutputWasteTableComponent(
         "Déchets entrants sortants par code déchet",
         company_siret=siret,
-        bs_data_dfs=dfs,
+        bs_analysis_data=bs_analysis_data,
         waste_codes_df=WASTE_CODES_DATA,
     )
     layout = input_output_waste_component.create_layout()
@@ -451,41 +477,23 @@ def create_waste_input_output_table_component(
 def create_icpe_components(
     company_data: pd.Series,
     icpe_data: pd.DataFrame,
-    bsdd_data: pd.DataFrame,
-    bsda_data: pd.DataFrame,
-    bsff_data: pd.DataFrame,
-    bsdasri_data: pd.DataFrame,
-    bsvhu_data: pd.DataFrame,
+    bs_analysis_data: pd.DataFrame,
+    bsdd_data: Dict[str, pd.DataFrame],
 ) -> tuple:
 
     siret = company_data["siret"]
 
-    if all(
-        e is None
-        for e in [icpe_data, bsdd_data, bsda_data, bsff_data, bsdasri_data, bsvhu_data]
-    ):
+    if all(e is None for e in [icpe_data, bs_analysis_data, bsdd_data]):
         return [html.Div()], {"display": "block"}
 
     final_layout = []
-    if any(
-        e is not None
-        for e in [icpe_data, bsdd_data, bsda_data, bsff_data, bsdasri_data, bsvhu_data]
-    ):
-
-        dfs = {
-            "Déchets Dangereux": bsdd_data,
-            "Amiante": bsda_data,
-            "Fluides Frigo": bsff_data,
-            "DASRI": bsdasri_data,
-            "VHU": bsvhu_data,
-        }
-        dfs = {k: v.get("bs_data") for k, v in dfs.items() if v is not None}
+    if any(e is not None for e in [icpe_data, bs_analysis_data]):
 
         icpe_info_component = ICPEInfoComponent(
             component_title="Informations sur l'établissement",
             company_siret=siret,
             icpe_data=icpe_data,
-            bs_data_dfs=dfs,
+            bs_analysis_data=bs_analysis_data,
             mapping_processing_operation_code_rubrique=PROCESSING_OPERATION_CODE_RUBRIQUE_MAPPING,
         )
 
@@ -506,7 +514,7 @@ def create_icpe_components(
             "Rubriques ICPE autorisées",
             company_siret=siret,
             icpe_data=icpe_data,
-            bs_data_dfs=dfs,
+            bs_analysis_data=bs_analysis_data,
             mapping_processing_operation_code_rubrique=PROCESSING_OPERATION_CODE_RUBRIQUE_MAPPING,
         )
 
@@ -524,7 +532,7 @@ def create_icpe_components(
     traceability_interruption_component = TraceabilityInterruptionsComponent(
         component_title="Rupture de traçabilité",
         company_siret=siret,
-        bsdd_data=dfs["Déchets Dangereux"],
+        bsdd_data=bsdd_data["bs_data"] if bsdd_data is not None else None,
         waste_codes_df=WASTE_CODES_DATA,
     )
 
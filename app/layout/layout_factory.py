@@ -1,6 +1,9 @@
 import logging
+import time
+import uuid
 from datetime import datetime, timezone
-from typing import Dict
+from functools import partial
+from typing import Dict, List
 
 import pandas as pd
 from dash_extensions.enrich import (
@@ -17,20 +20,74 @@ from dash_extensions.enrich import (
     no_update,
 )
 
-from app.data.data_extract import make_query
-from app.data.utils import get_outliers_datetimes_df, get_quantity_outliers
+from app.data.analysis_context import (
+    compute_bs_stats,
+    create_bs_analysis_data,
+    create_bs_monthly_data,
+)
+from app.data.cancellation import QueryCancelledError
+from app.data.connections import get_pools_stats
+from app.data.data_extract import (
+    BS_COMBINED_EXTRACTION,
+    BS_STREAMING_CHUNKSIZE,
+    QUERY_CACHE,
+    QUERY_CANCELLATION,
+    get_preprocessed_bs_data,
+    make_query,
+    run_concurrently,
+)
+from app.data.icpe_snapshot import get_icpe_data
+from app.data.incremental import BS_INCREMENTAL_STORE
+from app.data.metrics import FICHE_GENERATION_DURATION
+from app.data.utils import split_by_bs_type, split_receipts_agreements_data
 from app.layout.components_factory import (
+    FAILED_DATA_LABELS,
     create_bs_components_layouts,
     create_company_infos,
     create_complementary_figure_components,
+    create_data_error_block,
     create_icpe_components,
     create_onsite_waste_components,
     create_waste_input_output_table_component,
+    get_required_bs_columns,
 )
 
 logger = logging.getLogger()
 
 
+def get_failed_data(
+    tasks_errors: Dict[str, Exception], bs_configs: List[dict]
+) -> List[str]:
+    """Returns the data of the fiche whose extraction failed (keys of `FAILED_DATA_LABELS`).
+
+    Parameters
+    ----------
+    tasks_errors : dict
+        Dict with keys being the names of the failed tasks of `get_data_for_siret` and values their exception.
+    bs_configs : list of dict
+        Configs of the 'bordereau' types, with their type and the name of their data task.
+
+    Returns
+    -------
+    list of str
+        Names of the failed data, in the order of `FAILED_DATA_LABELS`.
+    """
+
+    failed_data = set()
+    if "receipts_agreements_data" in tasks_errors:
+        failed_data.add("receipts_agreements")
+    if "icpe_data" in tasks_errors:
+        failed_data.add("icpe")
+    if "bs_revised_data" in tasks_errors:
+        failed_data.add("bs_revised")
+    for bs_config in bs_configs:
+        # The combined extraction fetches all the 'bordereau' types at once
+        if "get_bs_data" in tasks_errors or bs_config["bs_data"] in tasks_errors:
+            failed_data.add(bs_config["bs_type"])
+
+    return [e for e in FAILED_DATA_LABELS if e in failed_data]
+
+
 def get_layout() -> html.Main:
     layout = html.Main(
         children=[
@@ -81,6 +138,8 @@ def get_layout() -> html.Main:
                         html.Div(
                             [
                                 html.Div(id="company-name"),
+                                # Data whose extraction failed, the fiche is incomplete
+                                html.Div(id="data-errors"),
                                 html.Div(
                                     id="company-infos", className="grid-container"
                                 ),
@@ -166,6 +225,8 @@ def get_layout() -> html.Main:
                     ),
                 ],
             ),
+            # Identifies the browser tab, the queries of its superseded requests are cancelled
+            dcc.Store(id="session-id", data=uuid.uuid4().hex),
             dcc.Store(id="company-data"),
             dcc.Store(id="receipt-agrement-data"),
             dcc.Store(id="icpe-data"),
@@ -175,6 +236,8 @@ def get_layout() -> html.Main:
             dcc.Store(id="bsdasri-data"),
             dcc.Store(id="bsvhu-data"),
             dcc.Store(id="additional-data"),
+            dcc.Store(id="bs-analysis-data"),
+            dcc.Store(id="failed-data"),
             dcc.Download(id="download-df-csv"),
         ]
     )
@@ -192,15 +255,23 @@ def get_layout() -> html.Main:
         ServersideOutput("bsdasri-data", "data"),
         ServersideOutput("bsvhu-data", "data"),
         ServersideOutput("additional-data", "data"),
+        ServersideOutput("bs-analysis-data", "data"),
+        Output("failed-data", "data"),
+        Output("data-errors", "children"),
         Output("alert-container", "children"),
         Output("main-layout-fiche", "style"),
     ],
-    inputs=[Input("submit-siret", "n_clicks"), State("siret", "value")],
+    inputs=[
+        Input("submit-siret", "n_clicks"),
+        State("siret", "value"),
+        State("session-id", "data"),
+    ],
 )
-def get_data_for_siret(n_clicks: int, siret: str):
+def get_data_for_siret(n_clicks: int, siret: str, session_id: str):
 
     if n_clicks is not None:
 
+        start = time.perf_counter()
         res = []
         if siret is None or len(siret) != 14 or (not siret.isdigit()):
             return (
@@ -213,164 +284,265 @@ def get_data_for_siret(n_clicks: int, siret: str):
                 no_update,
                 no_update,
                 no_update,
+                no_update,
+                no_update,
+                no_update,
                 html.Div(
                     "SIRET non conforme",
                 ),
                 {"display": "none"},
             )
 
-        company_data_df = make_query(
-            "get_company_data", siret=siret, date_columns=["createdAt"]
-        )
+        with QUERY_CANCELLATION.request_scope(session_id):
+            try:
+                company_data_df = make_query("get_company_data", siret=siret)
+            except QueryCancelledError:
+                raise exceptions.PreventUpdate
+
+            if len(company_data_df) == 0:
+
+                return (
+                    no_update,
+                    no_update,
+                    no_update,
+                    no_update,
+                    no_update,
+                    no_update,
+                    no_update,
+                    no_update,
+                    no_update,
+                    no_update,
+                    no_update,
+                    no_update,
+                    html.Div(
+                        "Pas d'entreprise inscrite sur Trackdechets avec ce SIRET.",
+                    ),
+                    {"display": "none"},
+                )
 
-        if len(company_data_df) == 0:
+            res.append(company_data_df.iloc[0])
+
+            receipts_agreements_configs = [
+                {
+                    "name": "Récépissé Transporteur",
+                    "column": "transporterReceiptId",
+                    "validity_limit": True,
+                },
+                {
+                    "name": "Récépissé Négociant",
+                    "column": "traderReceiptId",
+                    "validity_limit": True,
+                },
+                {
+                    "name": "Récépissé Courtier",
+                    "column": "brokerReceiptId",
+                    "validity_limit": True,
+                },
+                {
+                    "name": "Agrément Démolisseur ",
+                    "column": "vhuAgrementDemolisseurId",
+                    "validity_limit": False,
+                },
+                {
+                    "name": "Agrément Broyeur",
+                    "column": "vhuAgrementBroyeurId",
+                    "validity_limit": False,
+                },
+            ]
+
+            bs_configs = [
+                {"bs_type": "BSDD", "bs_data": "get_bsdd_data"},
+                {"bs_type": "BSDA", "bs_data": "get_bsda_data"},
+                {"bs_type": "BSFF", "bs_data": "get_bsff_data"},
+                {"bs_type": "BSDASRI", "bs_data": "get_bsdasri_data"},
+                {"bs_type": "BSVHU", "bs_data": "get_bsvhu_data"},
+            ]
+
+            # All the remaining queries only depend on the SIRET and on the company data,
+            # so they are run concurrently. 'bordereaux' data is preprocessed (outliers separation)
+            # in the same worker threads, chunk by chunk if streaming is enabled.
+            tasks = {}
+            if any(
+                company_data_df[config["column"]].item() is not None
+                for config in receipts_agreements_configs
+            ):
+                # All receipts and agreements are fetched in one query, split afterwards
+                tasks["receipts_agreements_data"] = partial(
+                    make_query, "get_receipts_agreements_data", siret=siret
+                )
 
-            return (
-                no_update,
-                no_update,
-                no_update,
-                no_update,
-                no_update,
-                no_update,
-                no_update,
-                no_update,
-                no_update,
-                html.Div(
-                    "Pas d'entreprise inscrite sur Trackdechets avec ce SIRET.",
-                ),
-                {"display": "none"},
+            tasks["icpe_data"] = partial(get_icpe_data, siret)
+
+            chunksize = BS_STREAMING_CHUNKSIZE if BS_STREAMING_CHUNKSIZE > 0 else None
+            # Only the columns used by the components are fetched
+            bs_columns = get_required_bs_columns()
+            # Only the 'bordereaux' updated since the last fiche of this SIRET are fetched, if enabled
+            get_bs_data = (
+                BS_INCREMENTAL_STORE.get_bs_data
+                if BS_INCREMENTAL_STORE is not None
+                else get_preprocessed_bs_data
             )
+            if BS_COMBINED_EXTRACTION:
+                # All 'bordereau' types are fetched in one query, split afterwards
+                tasks["get_bs_data"] = partial(
+                    get_bs_data,
+                    "get_bs_data",
+                    chunksize=chunksize,
+                    columns=bs_columns,
+                    siret=siret,
+                )
 
-        res.append(company_data_df.iloc[0])
-
-        receipts_agreements_data = {}
-        for config in [
-            {
-                "name": "Récépissé Transporteur",
-                "column": "transporterReceiptId",
-                "sql_file": "get_transporterReceiptId_data",
-            },
-            {
-                "name": "Récépissé Négociant",
-                "column": "traderReceiptId",
-                "sql_file": "get_traderReceiptId_data",
-            },
-            {
-                "name": "Récépissé Courtier",
-                "column": "brokerReceiptId",
-                "sql_file": "get_brokerReceiptId_data",
-            },
-            {
-                "name": "Agrément Démolisseur ",
-                "column": "vhuAgrementDemolisseurId",
-                "sql_file": "get_vhuAgrement_data",
-            },
-            {
-                "name": "Agrément Broyeur",
-                "column": "vhuAgrementBroyeurId",
-                "sql_file": "get_vhuAgrement_data",
-            },
-        ]:
-            id_ = company_data_df[config["column"]].item()
-            if id_ is not None:
-                data = make_query(
-                    config["sql_file"],
-                    date_columns=["validityLimit"],
-                    id=id_,
+            if not BS_COMBINED_EXTRACTION:
+                for bs_config in bs_configs:
+                    tasks[bs_config["bs_data"]] = partial(
+                        get_bs_data,
+                        bs_config["bs_data"],
+                        bs_type=bs_config["bs_type"],
+                        chunksize=chunksize,
+                        columns=bs_columns,
+                        siret=siret,
+                    )
+
+            # Revision requests of all 'bordereau' types are fetched in one query, split afterwards
+            tasks["bs_revised_data"] = partial(
+                make_query,
+                "get_bs_revised_data",
+                company_id=company_data_df["id"].item(),
+            )
+
+            tasks_results = run_concurrently(tasks)
+
+            # A failed task is isolated (the error has already been logged by `run_concurrently`) :
+            # its data is flagged as failed, so that the fiche does not display it as missing data
+            tasks_errors = {
+                name: result
+                for name, result in tasks_results.items()
+                if isinstance(result, Exception)
+            }
+            tasks_results = {
+                name: (None if name in tasks_errors else result)
+                for name, result in tasks_results.items()
+            }
+            failed_data = get_failed_data(tasks_errors, bs_configs)
+            if len(failed_data) > 0:
+                logger.error(
+                    "Incomplete fiche for SIRET %s, failed data : %s",
+                    siret,
+                    ", ".join(failed_data),
                 )
-                if len(data) != 0:
-                    receipts_agreements_data[config["name"]] = data
 
-        res.append(receipts_agreements_data)
+            preprocessed_bs_data = {}
+            if BS_COMBINED_EXTRACTION:
+                preprocessed_bs_data = tasks_results.pop("get_bs_data") or {}
+            else:
+                for bs_config in bs_configs:
+                    result = tasks_results[bs_config["bs_data"]]
+                    if result is not None:
+                        preprocessed_bs_data[bs_config["bs_type"]] = result.get(
+                            bs_config["bs_type"]
+                        )
+
+            bs_types = [bs_config["bs_type"] for bs_config in bs_configs]
+
+            bs_revised_data = {}
+            if tasks_results["bs_revised_data"] is not None:
+                bs_revised_data = split_by_bs_type(
+                    tasks_results["bs_revised_data"], bs_types
+                )
 
-        icpe_data = make_query(
-            "get_icpe_data",
-            engine="dwh",
-            date_columns=["date_debut_exploitation", "date_fin_validite"],
-            siret=siret,
-            # dtypes={"alinea": str, "rubrique": str},
-        )
+            receipts_agreements_data = {}
+            if tasks_results.get("receipts_agreements_data") is not None:
+                receipts_agreements_data = split_receipts_agreements_data(
+                    tasks_results["receipts_agreements_data"],
+                    receipts_agreements_configs,
+                )
 
-        if len(icpe_data):
-            res.append(icpe_data)
-        else:
-            res.append(None)
-
-        bs_dtypes = {
-            "id": str,
-            "createdAt": str,
-            "sentAt": str,
-            "receivedAt": str,
-            "processedAt": str,
-            "emitterCompanySiret": str,
-            "emitterCompanyAddress": str,
-            "recipientCompanySiret": str,
-            "wasteDetailsQuantity": float,
-            "quantityReceived": float,
-            "wasteCode": str,
-            "status": str,
-        }
-
-        bs_configs = [
-            {
-                "bs_type": "BSDD",
-                "bs_data": "get_bsdd_data",
-                "bs_revised_data": "get_bsdd_revised_data",
-            },
-            {
-                "bs_type": "BSDA",
-                "bs_data": "get_bsda_data",
-                "bs_revised_data": "get_bsda_revised_data",
-            },
-            {"bs_type": "BSFF", "bs_data": "get_bsff_data"},
-            {"bs_type": "BSDASRI", "bs_data": "get_bsdasri_data"},
-            {"bs_type": "BSVHU", "bs_data": "get_bsvhu_data"},
-        ]
+            res.append(receipts_agreements_data)
 
-        additional_data = {"date_outliers": {}, "quantity_outliers": {}}
+            icpe_data = tasks_results["icpe_data"]
 
-        for bs_config in bs_configs:
+            if icpe_data is not None and len(icpe_data):
+                res.append(icpe_data)
+            else:
+                res.append(None)
 
-            to_store = {"bs_data": None, "bs_revised_data": None}
+            additional_data = {"date_outliers": {}, "quantity_outliers": {}}
 
-            bs_data_df = make_query(
-                bs_config["bs_data"],
-                dtypes=bs_dtypes,
-                siret=siret,
+            # Shared by the components working on all the 'bordereau' types at once
+            bs_analysis_data = create_bs_analysis_data(
+                siret,
+                {
+                    bs_type: preprocessed_bs_data[bs_type][0]
+                    for bs_type in bs_types
+                    if preprocessed_bs_data.get(bs_type) is not None
+                },
+            )
+            # Annual statistics of all the 'bordereau' types, computed in a single pass
+            bs_stats = compute_bs_stats(
+                bs_analysis_data, tasks_results["bs_revised_data"]
+            )
+            # The counts stay integers in the line of each type
+            bs_stats = bs_stats.astype(object)
+            # Monthly aggregates sliced by the time series figures
+            bs_monthly_data = split_by_bs_type(
+                create_bs_monthly_data(bs_analysis_data), bs_types
             )
 
-            quantity_outliers = get_quantity_outliers(bs_data_df, bs_config["bs_type"])
+            for bs_config in bs_configs:
 
-            if len(quantity_outliers) > 0:
-                additional_data["quantity_outliers"][
+                to_store = {
+                    "bs_data": None,
+                    "bs_revised_data": None,
+                    "bs_monthly_data": bs_monthly_data.get(bs_config["bs_type"]),
+                    "bs_stats": None,
+                }
+
+                if preprocessed_bs_data.get(bs_config["bs_type"]) is None:
+                    res.append(None)
+                    continue
+
+                bs_data_df, date_outliers, quantity_outliers = preprocessed_bs_data[
                     bs_config["bs_type"]
-                ] = quantity_outliers
+                ]
 
-            bs_data_df, date_outliers = get_outliers_datetimes_df(
-                bs_data_df, date_columns=["sentAt", "receivedAt", "processedAt"]
-            )
+                if len(quantity_outliers) > 0:
+                    additional_data["quantity_outliers"][
+                        bs_config["bs_type"]
+                    ] = quantity_outliers
 
-            if len(date_outliers) > 0:
-                additional_data["date_outliers"][bs_config["bs_type"]] = date_outliers
+                if len(date_outliers) > 0:
+                    additional_data["date_outliers"][
+                        bs_config["bs_type"]
+                    ] = date_outliers
 
-            if len(bs_data_df) != 0:
+                if len(bs_data_df) != 0:
 
-                to_store["bs_data"] = bs_data_df
-                if bs_config.get("bs_revised_data") is not None:
-                    bs_revised_data_df = make_query(
-                        bs_config["bs_revised_data"],
-                        date_columns=["createdAt"],
-                        company_id=company_data_df["id"],
-                    )
-                    if len(bs_revised_data_df) > 0:
+                    to_store["bs_data"] = bs_data_df
+                    if bs_config["bs_type"] in bs_stats.index:
+                        to_store["bs_stats"] = bs_stats.loc[bs_config["bs_type"]]
+                    bs_revised_data_df = bs_revised_data.get(bs_config["bs_type"])
+                    if bs_revised_data_df is not None and len(bs_revised_data_df) > 0:
                         to_store["bs_revised_data"] = bs_revised_data_df
 
-                res.append(to_store)
-            else:
-                res.append(None)
-
-        res.append(additional_data)
-        return res + [None, {"display": "revert"}]
+                    res.append(to_store)
+                else:
+                    res.append(None)
+
+            res.append(additional_data)
+            res.append(bs_analysis_data)
+            FICHE_GENERATION_DURATION.observe(time.perf_counter() - start)
+            logger.info("Connection pools stats : %s", get_pools_stats())
+            if QUERY_CACHE is not None:
+                logger.info("Query cache stats : %s", QUERY_CACHE.get_stats())
+            # A newer request of the same session superseded this one, its results are discarded
+            if QUERY_CANCELLATION.is_cancelled():
+                raise exceptions.PreventUpdate
+
+        data_errors = None
+        if len(failed_data) > 0:
+            data_errors = create_data_error_block(failed_data)
+
+        return res + [failed_data, data_errors, None, {"display": "revert"}]
     else:
         raise exceptions.PreventUpdate
 
@@ -392,11 +564,17 @@ def populate_company_header(company_data: str):
     Output("company-infos", "children"),
     Input("company-data", "data"),
     Input("receipt-agrement-data", "data"),
+    Input("failed-data", "data"),
 )
-def populate_company_details(company_data: str, receipt_agrement_data: str):
+def populate_company_details(
+    company_data: str, receipt_agrement_data: str, failed_data: List[str]
+):
 
     layouts = create_company_infos(company_data, receipt_agrement_data)
 
+    if "receipts_agreements" in (failed_data or []):
+        layouts.append(create_data_error_block(["receipts_agreements"]))
+
     return layouts
 
 
@@ -410,6 +588,7 @@ def populate_company_details(company_data: str, receipt_agrement_data: str):
         Input("bsdasri-data", "data"),
         Input("bsvhu-data", "data"),
         Input("additional-data", "data"),
+        Input("failed-data", "data"),
     ),
 )
 def populate_bs_components(
@@ -420,8 +599,11 @@ def populate_bs_components(
     bsdasri_data: Dict[str, pd.DataFrame],
     bsvhu_data: Dict[str, pd.DataFrame],
     additional_data: Dict[str, Dict[str, pd.DataFrame]],
+    failed_data: List[str],
 ):
 
+    failed_data = failed_data or []
+
     configs = [
         {
             "data": bsdd_data,
@@ -480,11 +662,16 @@ def populate_bs_components(
     ]
 
     layouts = []
-    bs_without_data = []
+    if "bs_revised" in failed_data:
+        layouts.append(create_data_error_block(["bs_revised"]))
+
     for config in configs:
 
+        if config["name"] in failed_data:
+            layouts.append(create_data_error_block([config["name"]]))
+            continue
+
         if config["data"] is None:
-            bs_without_data.append(config["name"])
             continue
 
         layouts.extend(
@@ -511,21 +698,35 @@ def populate_bs_components(
     return layouts
 
 
+def add_bs_data_errors(
+    layout: list, no_data_style: dict, failed_data: List[str]
+) -> tuple:
+    """Adds the error block to the layout of a section using the data of all the 'bordereau' types,
+    if the data of some types could not be fetched."""
+
+    failed_bs_data = [
+        e
+        for e in (failed_data or [])
+        if e not in ["receipts_agreements", "icpe", "bs_revised"]
+    ]
+    if len(failed_bs_data) == 0:
+        return layout, no_data_style
+
+    return [create_data_error_block(failed_bs_data), *layout], {"display": "none"}
+
+
 @callback(
     output=(Output("stock-data-figures", "children"), Output("stock-no-data", "style")),
     inputs=(
         Input("company-data", "data"),
-        Input("bsdd-data", "data"),
-        Input("bsda-data", "data"),
-        Input("bsff-data", "data"),
-        Input("bsdasri-data", "data"),
-        Input("bsvhu-data", "data"),
+        Input("bs-analysis-data", "data"),
+        Input("failed-data", "data"),
     ),
 )
-def populate_onsite_waste_section(*args):
-    layout = create_onsite_waste_components(*args)
+def populate_onsite_waste_section(company_data, bs_analysis_data, failed_data):
+    layout = create_onsite_waste_components(company_data, bs_analysis_data)
 
-    return layout
+    return add_bs_data_errors(*layout, failed_data)
 
 
 @callback(
@@ -535,17 +736,14 @@ def populate_onsite_waste_section(*args):
     ),
     inputs=(
         Input("company-data", "data"),
-        Input("bsdd-data", "data"),
-        Input("bsda-data", "data"),
-        Input("bsff-data", "data"),
-        Input("bsdasri-data", "data"),
-        Input("bsvhu-data", "data"),
+        Input("bs-analysis-data", "data"),
+        Input("failed-data", "data"),
     ),
 )
-def populate_waste_input_output_table(*args):
-    layout = create_waste_input_output_table_component(*args)
+def populate_waste_input_output_table(company_data, bs_analysis_data, failed_data):
+    layout = create_waste_input_output_table_component(company_data, bs_analysis_data)
 
-    return layout
+    return add_bs_data_errors(*layout, failed_data)
 
 
 @callback(
@@ -553,17 +751,23 @@ def populate_waste_input_output_table(*args):
     inputs=(
         Input("company-data", "data"),
         Input("icpe-data", "data"),
+        Input("bs-analysis-data", "data"),
         Input("bsdd-data", "data"),
-        Input("bsda-data", "data"),
-        Input("bsff-data", "data"),
-        Input("bsdasri-data", "data"),
-        Input("bsvhu-data", "data"),
+        Input("failed-data", "data"),
     ),
 )
-def populate_icpe_section(*args):
-    layout = create_icpe_components(*args)
+def populate_icpe_section(
+    company_data, icpe_data, bs_analysis_data, bsdd_data, failed_data
+):
 
-    return layout
+    if "icpe" in (failed_data or []):
+        return [create_data_error_block(["icpe"])], {"display": "none"}
+
+    layout = create_icpe_components(
+        company_data, icpe_data, bs_analysis_data, bsdd_data
+    )
+
+    return add_bs_data_errors(*layout, failed_data)
 
 
 @callback(
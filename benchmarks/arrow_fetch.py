@@ -0,0 +1,171 @@
+"""
+Benchmark of the two fetch backends of `make_query` ("pandas" and "arrow") on a bordereau-like table
+of 10k, 100k and 1M synthetic rows, with the dtypes used for 'bordereaux' in `get_data_for_siret`.
+Both backends are checked to return the same DataFrame (all columns), with these dtypes and without dtypes
+(the types then come from the database, e.g. postal codes with leading zeros stay strings).
+
+With PostgreSQL (DATABASE_URL), the arrow backend uses `COPY ... TO STDOUT`.
+Without DATABASE_URL, a local SQLite database is used as a stand-in and the arrow backend goes through
+the DBAPI cursor, so only the conversion part is compared.
+The benchmark creates (and drops) its own `fiche_inspection_bench_arrow` table.
+
+Usage (from the repository root):
+
+    python -m benchmarks.arrow_fetch --rows 10000 100000 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{Path(tempfile.gettempdir()) / 'bench.sqlite'}"
+)
+os.environ.setdefault("DWH_URL", os.environ["DATABASE_URL"])
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+from app.data import data_extract  # noqa: E402
+from app.data.data_extract import make_query  # noqa: E402
+from app.data.query_registry import BS_DTYPES  # noqa: E402
+
+TABLE_NAME = "fiche_inspection_bench_arrow"
+SIRET = "12345678901234"
+
+QUERY_TEMPLATE = f"""
+select
+    id,
+    "createdAt",
+    "sentAt",
+    "receivedAt",
+    "processedAt",
+    "emitterCompanySiret",
+    "emitterCompanyAddress",
+    "emitterCompanyPostalCode",
+    "recipientCompanySiret",
+    "wasteDetailsQuantity",
+    "quantityReceived",
+    "wasteCode",
+    "status",
+    "noTraceability"
+from {TABLE_NAME}
+where
+    "emitterCompanySiret" = :siret
+    or "recipientCompanySiret" = :siret
+"""
+
+DATE_COLUMNS = ["createdAt", "sentAt", "receivedAt", "processedAt"]
+
+
+def create_bench_table(n_rows: int) -> None:
+    """Creates and fills the benchmark table, all rows matching the benchmark SIRET."""
+
+    rng = np.random.default_rng(0)
+    created_at = pd.Timestamp("2022-01-01", tz="UTC") + pd.to_timedelta(
+        rng.integers(0, 365 * 24 * 3600, n_rows), unit="s"
+    )
+    df = pd.DataFrame(
+        {
+            "id": [f"BSD-20220101-{i:08d}" for i in range(n_rows)],
+            "createdAt": created_at,
+            "sentAt": created_at + pd.Timedelta(days=1),
+            "receivedAt": created_at + pd.Timedelta(days=2),
+            "processedAt": (created_at + pd.Timedelta(days=10)).where(
+                rng.random(n_rows) > 0.2
+            ),
+            "emitterCompanySiret": np.where(
+                rng.random(n_rows) > 0.5, SIRET, "98765432109876"
+            ),
+            "emitterCompanyAddress": "1 rue de la Paix 75002 Paris",
+            "emitterCompanyPostalCode": rng.choice(
+                np.array(["01000", "75002", "06100", None], dtype=object), n_rows
+            ),
+            "recipientCompanySiret": SIRET,
+            "wasteDetailsQuantity": rng.random(n_rows) * 20,
+            "quantityReceived": rng.random(n_rows) * 20,
+            "wasteCode": rng.choice(["17 05 04", "15 01 10*", "16 01 04*"], n_rows),
+            "status": rng.choice(["PROCESSED", "SENT", "RECEIVED"], n_rows),
+            "noTraceability": rng.random(n_rows) > 0.9,
+        }
+    )
+    with data_extract.DB_ENGINE.begin() as connection:
+        df.to_sql(
+            TABLE_NAME, connection, index=False, if_exists="replace", chunksize=50000
+        )
+
+
+def parse_dates(df: pd.DataFrame) -> pd.DataFrame:
+    for column in DATE_COLUMNS:
+        df[column] = pd.to_datetime(
+            df[column].replace(["None", "NaT"], pd.NaT), utc=True
+        )
+    return df
+
+
+def drop_bench_table() -> None:
+    with data_extract.DB_ENGINE.begin() as connection:
+        connection.execute(text(f"drop table if exists {TABLE_NAME}"))
+
+
+def run(rows_counts: list) -> None:
+
+    print(f"{'rows':>9} {'pandas (s)':>11} {'arrow (s)':>10} {'speedup':>8}")
+    for n_rows in rows_counts:
+        create_bench_table(n_rows)
+        try:
+            timings = {}
+            results = {}
+            for fetch_backend in ("pandas", "arrow"):
+                start = time.perf_counter()
+                results[fetch_backend] = make_query(
+                    "bench_arrow_fetch",
+                    dtypes=BS_DTYPES,
+                    use_cache=False,
+                    fetch_backend=fetch_backend,
+                    siret=SIRET,
+                )
+                timings[fetch_backend] = time.perf_counter() - start
+
+            # Dates are compared in UTC, the time zone of the driver values depends on the connection
+            pd.testing.assert_frame_equal(
+                parse_dates(results["pandas"]), parse_dates(results["arrow"])
+            )
+            pd.testing.assert_frame_equal(
+                *[
+                    parse_dates(
+                        make_query(
+                            "bench_arrow_fetch",
+                            use_cache=False,
+                            fetch_backend=fetch_backend,
+                            siret=SIRET,
+                        )
+                    )
+                    for fetch_backend in ("pandas", "arrow")
+                ]
+            )
+            print(
+                f"{n_rows:>9} {timings['pandas']:>11.3f} {timings['arrow']:>10.3f}"
+                f" {timings['pandas'] / timings['arrow']:>7.1f}x"
+            )
+        finally:
+            drop_bench_table()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000],
+        help="Sizes of the benchmark table.",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        (Path(tmp_dir) / "bench_arrow_fetch.sql").write_text(QUERY_TEMPLATE)
+        data_extract.QUERY_REGISTRY.load(Path(tmp_dir))
+        run(args.rows)
@@ -0,0 +1,129 @@
+"""
+Micro-benchmark of the same bordereau-like query run for many different SIRETs :
+- with the SIRET formatted into the SQL text (a distinct statement for each SIRET) ;
+- with a named bind parameter through `make_query` ;
+- with a named bind parameter and server-side prepared statements (PostgreSQL only).
+
+Without DATABASE_URL, a local SQLite database is used as a stand-in.
+The benchmark creates (and drops) its own `fiche_inspection_bench_form` table.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bind_parameters --sirets 2000 --rows 200000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{Path(tempfile.gettempdir()) / 'bench.sqlite'}"
+)
+os.environ.setdefault("DWH_URL", os.environ["DATABASE_URL"])
+
+import pandas as pd  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+from app.data import data_extract  # noqa: E402
+from app.data.data_extract import make_query  # noqa: E402
+
+TABLE_NAME = "fiche_inspection_bench_form"
+
+QUERY_TEMPLATE = f"""
+select
+    id,
+    "createdAt",
+    "emitterCompanySiret",
+    "recipientCompanySiret",
+    "quantityReceived",
+    "status"
+from {TABLE_NAME}
+where
+    ("emitterCompanySiret" = {{siret}}
+    or "recipientCompanySiret" = {{siret}})
+    and "isDeleted" = false
+    and cast("status" as text) not in ('DRAFT', 'INITIAL', 'SIGNED_BY_WORKER')
+order by
+    "createdAt" asc
+"""
+
+
+def create_bench_table(sirets: list, n_rows: int) -> None:
+    """Creates and fills the benchmark table, with indexes on SIRET columns."""
+
+    df = pd.DataFrame(
+        {
+            "id": [f"BSD-{i}" for i in range(n_rows)],
+            "createdAt": pd.date_range("2022-01-01", periods=n_rows, freq="1min"),
+            "emitterCompanySiret": random.choices(sirets, k=n_rows),
+            "recipientCompanySiret": random.choices(sirets, k=n_rows),
+            "quantityReceived": [random.random() * 10 for _ in range(n_rows)],
+            "status": random.choices(["PROCESSED", "SENT", "DRAFT"], k=n_rows),
+            "isDeleted": False,
+        }
+    )
+    with data_extract.DB_ENGINE.begin() as connection:
+        df.to_sql(TABLE_NAME, connection, index=False, if_exists="replace")
+        for column in ("emitterCompanySiret", "recipientCompanySiret"):
+            connection.execute(
+                text(
+                    f'create index "{TABLE_NAME}_{column}" on {TABLE_NAME} ("{column}")'
+                )
+            )
+
+
+def drop_bench_table() -> None:
+    with data_extract.DB_ENGINE.begin() as connection:
+        connection.execute(text(f"drop table if exists {TABLE_NAME}"))
+
+
+def run_formatted(sirets: list) -> None:
+    for siret in sirets:
+        pd.read_sql_query(
+            QUERY_TEMPLATE.format(siret=f"'{siret}'"), con=data_extract.DB_ENGINE
+        )
+
+
+def run_bind_params(sirets: list) -> None:
+    for siret in sirets:
+        make_query("bench_bind_parameters", siret=siret)
+
+
+def run(n_sirets: int, n_rows: int) -> None:
+
+    sirets = [f"{random.randrange(10**13, 10**14)}" for _ in range(n_sirets)]
+    create_bench_table(sirets, n_rows)
+
+    modes = {
+        "formatted SQL": (run_formatted, False),
+        "bind params": (run_bind_params, False),
+    }
+    if data_extract.DB_ENGINE.dialect.name == "postgresql":
+        modes["bind params + prepared"] = (run_bind_params, True)
+
+    try:
+        print(f"{'mode':>24} {'total (s)':>10} {'per query (ms)':>15}")
+        for mode, (func, use_prepared_statements) in modes.items():
+            data_extract.USE_PREPARED_STATEMENTS = use_prepared_statements
+            start = time.perf_counter()
+            func(sirets)
+            duration = time.perf_counter() - start
+            print(f"{mode:>24} {duration:>10.3f} {1000 * duration / n_sirets:>15.3f}")
+    finally:
+        drop_bench_table()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sirets", type=int, default=2000, help="Number of SIRETs.")
+    parser.add_argument("--rows", type=int, default=200000, help="Rows in the table.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        (Path(tmp_dir) / "bench_bind_parameters.sql").write_text(
+            QUERY_TEMPLATE.format(siret=":siret")
+        )
+        data_extract.QUERY_REGISTRY.load(Path(tmp_dir))
+        run(args.sirets, args.rows)
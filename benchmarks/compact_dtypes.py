@@ -0,0 +1,102 @@
+"""
+Benchmark of the compact dtypes of the preprocessed 'bordereaux' data (BS_COMPACT_DTYPES, see `app.data.compact_dtypes`)
+on synthetic BSDD data of 10k, 100k and 1M rows (see `app.data.synthetic`).
+
+The raw query results are preprocessed with and without compact dtypes, then the benchmark compares
+the memory usage and pickled size (serverside store) of the preprocessed DataFrames,
+and the time of the operations the components repeat on them : SIRET comparisons, status filters,
+groupbys by waste code and concatenation of 'bordereau' types.
+
+Usage (from the repository root):
+
+    python -m benchmarks.compact_dtypes --rows 10000 100000 1000000
+"""
+import argparse
+import pickle
+import time
+from typing import Callable
+
+from app.data.compact_dtypes import concat_bs_data, siret_equals
+from app.data.synthetic import SyntheticDataset
+from app.data.utils import BSDataPreprocessor
+
+REPEAT = 5
+
+
+def best_time(function: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(rows_counts: list) -> None:
+
+    print(f"{'rows':>9} {'measure':<32} {'raw':>10} {'compact':>10} {'ratio':>7}")
+    for n_rows in rows_counts:
+        dataset = SyntheticDataset(
+            {"BSDD": n_rows, "BSDA": n_rows // 10},
+            company_types=["PRODUCER", "COLLECTOR"],
+            recipient_share=0.6,
+        )
+        siret = dataset.siret
+
+        measures = {}
+        for compact_dtypes in (False, True):
+            preprocessed = {}
+            start = time.perf_counter()
+            for bs_type in ["BSDD", "BSDA"]:
+                preprocessor = BSDataPreprocessor(
+                    bs_type, compact_dtypes=compact_dtypes
+                )
+                preprocessor.add_chunk(dataset.get_bs_data(bs_type))
+                preprocessed[bs_type] = preprocessor.get_results()[0]
+            preprocessing_time = time.perf_counter() - start
+
+            df = preprocessed["BSDD"]
+            measures[compact_dtypes] = {
+                "preprocessing (s)": preprocessing_time,
+                "memory (MB)": df.memory_usage(deep=True).sum() / 1e6,
+                "pickled size (MB)": len(pickle.dumps(df)) / 1e6,
+                "SIRET comparison (ms)": best_time(
+                    lambda: siret_equals(df["emitterCompanySiret"], siret)
+                )
+                * 1000,
+                "status filter (ms)": best_time(
+                    lambda: df[df["status"].isin(["PROCESSED", "REFUSED"])]
+                )
+                * 1000,
+                "groupby waste code (ms)": best_time(
+                    lambda: df.groupby("wasteCode", observed=True)[
+                        "quantityReceived"
+                    ].sum()
+                )
+                * 1000,
+                "concat of types (ms)": best_time(
+                    lambda: concat_bs_data(preprocessed.values())
+                )
+                * 1000,
+            }
+
+        for measure in measures[False]:
+            raw, compact = measures[False][measure], measures[True][measure]
+            print(
+                f"{n_rows:>9} {measure:<32} {raw:>10.2f} {compact:>10.2f}"
+                f" {raw / compact:>6.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000],
+        help="Numbers of BSDD rows.",
+    )
+    args = parser.parse_args()
+
+    run(args.rows)
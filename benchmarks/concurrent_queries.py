@@ -0,0 +1,89 @@
+"""
+Benchmark of the wall-clock time needed to run N queries with `make_queries`,
+sequentially (1 worker) and concurrently (bounded thread pool).
+
+Each query simulates a database round trip of a given latency with `pg_sleep`.
+Without DATABASE_URL, a local SQLite database (where `pg_sleep` is emulated) is used.
+
+Usage (from the repository root):
+
+    python -m benchmarks.concurrent_queries --latency 0.2 --max-workers 5
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{Path(tempfile.gettempdir()) / 'bench.sqlite'}"
+)
+os.environ.setdefault("DWH_URL", os.environ["DATABASE_URL"])
+
+from sqlalchemy import event  # noqa: E402
+
+from app.data import data_extract  # noqa: E402
+from app.data.data_extract import make_queries  # noqa: E402
+
+QUERY_COUNTS = [1, 2, 4, 8, 14]
+
+
+def setup_benchmark_queries(sql_dir: Path) -> None:
+    """Writes the round trip query in a temporary SQL directory and registers `pg_sleep` for SQLite."""
+    (sql_dir / "bench_round_trip.sql").write_text("select pg_sleep(:latency) as slept")
+    data_extract.QUERY_REGISTRY.load(sql_dir)
+
+    for engine in (data_extract.DB_ENGINE, data_extract.DWH_ENGINE):
+        if engine.dialect.name == "sqlite":
+            event.listen(
+                engine,
+                "connect",
+                lambda dbapi_con, _: dbapi_con.create_function(
+                    "pg_sleep", 1, time.sleep
+                ),
+            )
+
+
+def run(latency: float, max_workers: int) -> None:
+
+    print(
+        f"{'queries':>8} {'sequential (s)':>15} {'concurrent (s)':>15} {'speedup':>8}"
+    )
+    for count in QUERY_COUNTS:
+        # Half of the queries go to the DWH engine, like the ICPE query in production
+        queries = {
+            f"query_{i}": dict(
+                sql_query_name="bench_round_trip",
+                engine="dwh" if i % 2 else "db-prod",
+                latency=latency,
+            )
+            for i in range(count)
+        }
+
+        timings = []
+        for workers in (1, max_workers):
+            start = time.perf_counter()
+            results = make_queries(queries, max_workers=workers)
+            timings.append(time.perf_counter() - start)
+            errors = [r for r in results.values() if isinstance(r, Exception)]
+            if errors:
+                raise errors[0]
+
+        print(
+            f"{count:>8} {timings[0]:>15.3f} {timings[1]:>15.3f} {timings[0] / timings[1]:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--latency", type=float, default=0.2, help="Simulated round trip (seconds)."
+    )
+    parser.add_argument(
+        "--max-workers", type=int, default=data_extract.QUERIES_MAX_WORKERS
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        setup_benchmark_queries(Path(tmp_dir))
+        run(args.latency, args.max_workers)
@@ -0,0 +1,119 @@
+"""
+Benchmark of the date ingestion of the 'bordereaux' preprocessing (see `app.data.utils.get_outliers_datetimes_df`)
+on synthetic BSDD data of 10k, 100k and 1M rows (see `app.data.synthetic`), with 0.1% of date outliers.
+
+Three cases are compared :
+- "str round-trip" : the dates forced to `str` at query time, then parsed twice per column
+  (once to find outliers, once after replacing "None"/"NaT"), the former ingestion ;
+- "native" : the dates as returned by psycopg2 (`datetime` objects, parsed by pandas when all are in range),
+  parsed once ;
+- "text" : the dates in their text representation (SQLite stand-in), parsed once.
+All the cases are checked to flag the same outliers.
+
+Usage (from the repository root):
+
+    python -m benchmarks.datetime_parsing --rows 10000 100000 1000000
+"""
+import argparse
+import time
+from typing import Callable, Dict, List, Tuple
+
+import pandas as pd
+
+from app.data.synthetic import BS_DATE_COLUMNS, SyntheticDataset
+from app.data.utils import get_outliers_datetimes_df
+
+REPEAT = 3
+DATE_COLUMNS = ["sentAt", "receivedAt", "processedAt"]
+
+
+def get_outliers_datetimes_df_str_round_trip(
+    df: pd.DataFrame, date_columns: List[str]
+) -> Tuple[pd.DataFrame, Dict[str, pd.DataFrame]]:
+    """Former ingestion of the dates, forced to `str` at query time."""
+
+    df = df.copy()
+    outliers = {}
+    idx_with_outliers = set()
+
+    for colname in date_columns:
+        time_data = pd.to_datetime(df[colname], errors="coerce")
+        outliers_df = df[time_data.isna() & (~df[colname].isin(["None", "NaT"]))]
+        if len(outliers_df) > 0:
+            idx_with_outliers.update(outliers_df.index.tolist())
+            outliers[colname] = outliers_df
+
+    if len(idx_with_outliers) > 0:
+        df = df[~df.index.isin(idx_with_outliers)]
+
+    for colname in date_columns:
+        df[colname] = pd.to_datetime(
+            df[colname].replace(["None", "NaT"], pd.NaT), utc=True
+        )
+
+    df["createdAt"] = pd.to_datetime(
+        df["createdAt"].replace(["None", "NaT"], pd.NaT), utc=True
+    )
+    return df, outliers
+
+
+def best_time(function: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(rows_counts: list) -> None:
+
+    print(f"{'rows':>9} {'case':<16} {'time (ms)':>10} {'speedup':>8} {'outliers':>9}")
+    for n_rows in rows_counts:
+        dataset = SyntheticDataset({"BSDD": n_rows})
+        native_df = dataset.get_bs_data("BSDD")
+        text_df = dataset.get_bs_data("BSDD", dates_as_text=True)
+
+        cases = {
+            "str round-trip": (
+                get_outliers_datetimes_df_str_round_trip,
+                native_df.astype({column: str for column in BS_DATE_COLUMNS}),
+            ),
+            "native": (get_outliers_datetimes_df, native_df),
+            "text": (get_outliers_datetimes_df, text_df),
+        }
+
+        reference_time, reference_ids = None, None
+        for case, (function, df) in cases.items():
+            clean_df, outliers = function(df, DATE_COLUMNS)
+            outliers_ids = {
+                colname: sorted(outliers_df["id"])
+                for colname, outliers_df in outliers.items()
+            }
+            if reference_ids is None:
+                reference_ids = outliers_ids
+            elif outliers_ids != reference_ids:
+                raise AssertionError(f"{case} does not flag the same outliers")
+
+            timing = best_time(lambda: function(df, DATE_COLUMNS))
+            if reference_time is None:
+                reference_time = timing
+            print(
+                f"{n_rows:>9} {case:<16} {timing * 1000:>10.1f}"
+                f" {reference_time / timing:>7.1f}x"
+                f" {sum(len(e) for e in outliers.values()):>9}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000],
+        help="Numbers of BSDD rows.",
+    )
+    args = parser.parse_args()
+
+    run(args.rows)
@@ -0,0 +1,564 @@
+"""
+Benchmark of the generation of a fiche, end-to-end and stage by stage, on synthetic establishments
+of 1k, 10k, 100k and 1M 'bordereaux' (see `app.data.synthetic`).
+
+The synthetic data is loaded into the local stand-in databases (see `app.data.local_engine`),
+then for each dataset size the following stages are measured :
+- `get_data_for_siret`, the data extraction callback, on the stand-in ;
+- each populate callback of `layout_factory`, with the data stored by `get_data_for_siret` ;
+- each `create_*` function of `components_factory` ;
+- each component of `figure_component`, `stats_component` and `table_component` (construction and layout) ;
+- the whole fiche (`get_data_for_siret` followed by all the populate callbacks).
+
+For each stage, the benchmark reports the time (best and median of the runs), the peak memory allocated
+during a separate run (tracemalloc, which slows the run down) and the size of the output payload :
+the JSON sent to the browser for layouts, the pickled data for the serverside outputs of `get_data_for_siret`.
+Before each run, the inputs are copied through pickle, like the serverside store does between callbacks,
+so that a stage modifying its inputs does not change the next runs.
+The results are saved as JSON, with the versions of the main dependencies and the git commit,
+and can be compared to a previous run with `--compare`.
+
+Usage (from the repository root):
+
+    python -m benchmarks.fiche_generation --rows 1000 10000 100000 1000000 --output fiche.json
+    python -m benchmarks.fiche_generation --rows 1000 10000 --compare fiche.json
+"""
+import argparse
+import json
+import os
+import pickle
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+os.environ.setdefault(
+    "LOCAL_DATABASE_DIRECTORY", tempfile.mkdtemp(prefix="fiche_generation_")
+)
+# The ICPE items are read from the stand-in, the results of the queries are not cached
+os.environ.setdefault("ICPE_SNAPSHOT_PATH", "")
+os.environ.setdefault("QUERY_CACHE_BACKEND", "")
+os.environ.setdefault("BS_INCREMENTAL_BACKEND", "")
+
+from plotly.utils import PlotlyJSONEncoder  # noqa: E402
+
+from app.data import data_extract  # noqa: E402
+from app.data.synthetic import SyntheticDataset  # noqa: E402
+from app.layout import components_factory, layout_factory  # noqa: E402
+from app.layout.components.figure_component import (  # noqa: E402
+    BSCreatedAndRevisedComponent,
+    BSRefusalsComponent,
+    StockComponent,
+    WasteOriginsComponent,
+    WasteOriginsMapComponent,
+)
+from app.layout.components.stats_component import (  # noqa: E402
+    AdditionalInfoComponent,
+    BSStatsComponent,
+    ICPEInfoComponent,
+    ICPEItemsComponent,
+    StorageStatsComponent,
+    TraceabilityInterruptionsComponent,
+)
+from app.layout.components.table_component import (  # noqa: E402
+    InputOutputWasteTableComponent,
+)
+
+# Share of each 'bordereau' type in the datasets
+BS_TYPES_SHARES = {
+    "BSDD": 0.7,
+    "BSDA": 0.1,
+    "BSFF": 0.05,
+    "BSDASRI": 0.05,
+    "BSVHU": 0.1,
+}
+COMPANY_TYPES = ["PRODUCER", "COLLECTOR", "TRANSPORTER", "WASTE_VEHICLES"]
+ICPE_RUBRIQUES = ["2718-1", "2790", "2791", "2760-2", "2771", "2712-1"]
+
+# Serverside outputs of `get_data_for_siret`, in order
+STORE_IDS = [
+    "company_data",
+    "receipt_agrement_data",
+    "icpe_data",
+    "bsdd_data",
+    "bsda_data",
+    "bsff_data",
+    "bsdasri_data",
+    "bsvhu_data",
+    "additional_data",
+    "bs_analysis_data",
+]
+BS_STORE_IDS = ["bsdd_data", "bsda_data", "bsff_data", "bsdasri_data", "bsvhu_data"]
+BS_TITLES = {
+    "bsdd_data": "Déchets Dangereux",
+    "bsda_data": "Amiante",
+    "bsff_data": "Fluides Frigo",
+    "bsdasri_data": "DASRI",
+    "bsvhu_data": "VHU",
+}
+
+PACKAGES = ["pandas", "numpy", "dash", "dash-extensions", "plotly", "SQLAlchemy"]
+
+# A stage is a name, a group, the measured function and the names of its stored inputs
+Stage = Tuple[str, str, Callable, List[str]]
+
+
+def create_dataset(n_rows: int, seed: int) -> SyntheticDataset:
+    """Create the dataset of an establishment with `n_rows` 'bordereaux', of all types."""
+
+    sizes = {
+        bs_type: max(1, round(n_rows * share))
+        for bs_type, share in BS_TYPES_SHARES.items()
+    }
+    return SyntheticDataset(
+        sizes,
+        seed=seed,
+        company_types=COMPANY_TYPES,
+        recipient_share=0.6,
+        icpe_rubriques=ICPE_RUBRIQUES,
+    )
+
+
+def get_payload_size(output: Any) -> int:
+    """Returns the size in bytes of the JSON the layout (or callback output) is sent to the browser as."""
+
+    return len(json.dumps(output, cls=PlotlyJSONEncoder).encode())
+
+
+def get_stored_size(output: tuple) -> int:
+    """Returns the size in bytes of the outputs of `get_data_for_siret`,
+    pickled for the serverside outputs and as JSON for the others."""
+
+    stored, sent = output[: len(STORE_IDS)], output[len(STORE_IDS) :]
+    return len(pickle.dumps(stored)) + get_payload_size(list(sent))
+
+
+def measure(
+    function: Callable,
+    make_args: Callable[[], tuple],
+    repeat: int,
+    get_size: Callable[[Any], int] = get_payload_size,
+) -> Dict[str, float]:
+    """Measures the time, peak memory and output payload size of the function.
+
+    Parameters
+    ----------
+    function : callable
+        Function to measure.
+    make_args : callable
+        Returns new positional arguments for each call, not included in the measures.
+    repeat : int
+        Number of timed runs.
+    get_size : callable
+        Returns the payload size of the output of the function.
+
+    Returns
+    -------
+    dict
+        Best and median time (in seconds), peak memory and payload size (in bytes).
+    """
+
+    timings = []
+    for _ in range(repeat):
+        args = make_args()
+        start = time.perf_counter()
+        output = function(*args)
+        timings.append(time.perf_counter() - start)
+
+    args = make_args()
+    tracemalloc.start()
+    try:
+        function(*args)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "time_min_s": min(timings),
+        "time_median_s": statistics.median(timings),
+        "peak_memory_bytes": peak_memory,
+        "payload_bytes": get_size(output),
+    }
+
+
+def create_component_layout(component_class: type, siret: str, *args) -> list:
+    """Creates the component, like `components_factory` does, and returns its layout."""
+
+    component = component_class(component_class.__name__, siret, *args)
+    return component.create_layout()
+
+
+def get_bs_monthly_data_dfs(*bs_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Returns the monthly aggregates by type title, as given to the components by `components_factory`."""
+
+    return {
+        BS_TITLES[store_id]: data["bs_monthly_data"]
+        for store_id, data in zip(BS_STORE_IDS, bs_data)
+        if data is not None
+    }
+
+
+def get_components_stages(siret: str) -> List[Stage]:
+    """Returns the stages of the components, with the reference data used by `components_factory`."""
+
+    def bs_components(component_class, *static_args):
+        return lambda *bs_data: create_component_layout(
+            component_class, siret, get_bs_monthly_data_dfs(*bs_data), *static_args
+        )
+
+    def analysis_components(component_class, *static_args):
+        return lambda bs_analysis_data: create_component_layout(
+            component_class, siret, bs_analysis_data, *static_args
+        )
+
+    bsdd_stages = [
+        (
+            BSCreatedAndRevisedComponent,
+            lambda bsdd: create_component_layout(
+                BSCreatedAndRevisedComponent,
+                siret,
+                bsdd["bs_monthly_data"],
+                bsdd["bs_revised_data"],
+            ),
+        ),
+        (
+            StockComponent,
+            lambda bsdd: create_component_layout(
+                StockComponent, siret, bsdd["bs_monthly_data"]
+            ),
+        ),
+        (
+            BSStatsComponent,
+            lambda bsdd: create_component_layout(
+                BSStatsComponent, siret, bsdd["bs_stats"]
+            ),
+        ),
+        (
+            TraceabilityInterruptionsComponent,
+            lambda bsdd: create_component_layout(
+                TraceabilityInterruptionsComponent,
+                siret,
+                bsdd["bs_data"],
+                components_factory.WASTE_CODES_DATA,
+            ),
+        ),
+    ]
+    all_bs_stages = [
+        (BSRefusalsComponent, bs_components(BSRefusalsComponent)),
+    ]
+    analysis_stages = [
+        (
+            StorageStatsComponent,
+            analysis_components(
+                StorageStatsComponent, components_factory.WASTE_CODES_DATA
+            ),
+        ),
+        (
+            WasteOriginsComponent,
+            analysis_components(
+                WasteOriginsComponent, components_factory.DEPARTEMENTS_REGION_DATA
+            ),
+        ),
+        (
+            WasteOriginsMapComponent,
+            analysis_components(
+                WasteOriginsMapComponent,
+                components_factory.DEPARTEMENTS_REGION_DATA,
+                components_factory.REGIONS_GEODATA,
+            ),
+        ),
+        (
+            InputOutputWasteTableComponent,
+            analysis_components(
+                InputOutputWasteTableComponent, components_factory.WASTE_CODES_DATA
+            ),
+        ),
+    ]
+    icpe_stages = [
+        (
+            component_class,
+            lambda icpe_data, bs_analysis_data, component_class=component_class: (
+                create_component_layout(
+                    component_class,
+                    siret,
+                    icpe_data,
+                    bs_analysis_data,
+                    components_factory.PROCESSING_OPERATION_CODE_RUBRIQUE_MAPPING,
+                )
+            ),
+        )
+        for component_class in [ICPEItemsComponent, ICPEInfoComponent]
+    ]
+
+    return [
+        *[(c.__name__, "component", f, ["bsdd_data"]) for c, f in bsdd_stages],
+        *[(c.__name__, "component", f, BS_STORE_IDS) for c, f in all_bs_stages],
+        *[
+            (c.__name__, "component", f, ["bs_analysis_data"])
+            for c, f in analysis_stages
+        ],
+        *[
+            (c.__name__, "component", f, ["icpe_data", "bs_analysis_data"])
+            for c, f in icpe_stages
+        ],
+        (
+            AdditionalInfoComponent.__name__,
+            "component",
+            lambda additional_data: create_component_layout(
+                AdditionalInfoComponent, siret, additional_data
+            ),
+            ["additional_data"],
+        ),
+    ]
+
+
+def get_factory_stages() -> List[Stage]:
+    """Returns the stages of the `create_*` functions of `components_factory`."""
+
+    return [
+        (
+            "create_company_infos",
+            "factory",
+            components_factory.create_company_infos,
+            ["company_data", "receipt_agrement_data"],
+        ),
+        (
+            "create_bs_components_layouts",
+            "factory",
+            lambda company_data, bsdd_data: (
+                components_factory.create_bs_components_layouts(
+                    bsdd_data,
+                    company_data,
+                    ["BSDD émis", "Quantité de BSDD", "BSDD sur l'année"],
+                    ["bsdd-created-rectified", "bsdd-stock", "bsdd-stats"],
+                )
+            ),
+            ["company_data", "bsdd_data"],
+        ),
+        (
+            "create_complementary_figure_components",
+            "factory",
+            components_factory.create_complementary_figure_components,
+            ["company_data", *BS_STORE_IDS, "additional_data"],
+        ),
+        (
+            "create_onsite_waste_components",
+            "factory",
+            components_factory.create_onsite_waste_components,
+            ["company_data", "bs_analysis_data"],
+        ),
+        (
+            "create_waste_input_output_table_component",
+            "factory",
+            components_factory.create_waste_input_output_table_component,
+            ["company_data", "bs_analysis_data"],
+        ),
+        (
+            "create_icpe_components",
+            "factory",
+            components_factory.create_icpe_components,
+            ["company_data", "icpe_data", "bs_analysis_data", "bsdd_data"],
+        ),
+    ]
+
+
+# Populate callbacks of `layout_factory`, with their inputs
+POPULATE_CALLBACKS = [
+    (layout_factory.populate_company_header, ["company_data"]),
+    (
+        layout_factory.populate_company_details,
+        ["company_data", "receipt_agrement_data", "failed_data"],
+    ),
+    (
+        layout_factory.populate_bs_components,
+        ["company_data", *BS_STORE_IDS, "additional_data", "failed_data"],
+    ),
+    (
+        layout_factory.populate_onsite_waste_section,
+        ["company_data", "bs_analysis_data", "failed_data"],
+    ),
+    (
+        layout_factory.populate_waste_input_output_table,
+        ["company_data", "bs_analysis_data", "failed_data"],
+    ),
+    (
+        layout_factory.populate_icpe_section,
+        [
+            "company_data",
+            "icpe_data",
+            "bs_analysis_data",
+            "bsdd_data",
+            "failed_data",
+        ],
+    ),
+]
+
+
+def generate_fiche(siret: str) -> list:
+    """Runs the data extraction and all the populate callbacks, returns the outputs of the callbacks."""
+
+    output = layout_factory.get_data_for_siret(1, siret, uuid.uuid4().hex)
+    stored = dict(zip(STORE_IDS, output))
+    stored["failed_data"] = output[len(STORE_IDS)]
+    return [
+        output[len(STORE_IDS) :],
+        *[
+            function(*[stored[store_id] for store_id in inputs])
+            for function, inputs in POPULATE_CALLBACKS
+        ],
+    ]
+
+
+def get_git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_metadata() -> Dict[str, Any]:
+    """Returns the description of the run environment, saved with the results."""
+
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            versions[package] = None
+
+    return {
+        "date": datetime.now(timezone.utc).isoformat(),
+        "git_commit": get_git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "versions": versions,
+        "config": {
+            "BS_COMBINED_EXTRACTION": data_extract.BS_COMBINED_EXTRACTION,
+            "BS_STREAMING_CHUNKSIZE": data_extract.BS_STREAMING_CHUNKSIZE,
+            "QUERY_FETCH_BACKEND": data_extract.QUERY_FETCH_BACKEND,
+        },
+    }
+
+
+def run(rows_counts: List[int], repeat: int, seed: int) -> List[Dict[str, Any]]:
+    results = []
+
+    print(
+        f"{'rows':>9} {'stage':<42} {'best (ms)':>10} {'median (ms)':>12}"
+        f" {'peak (MB)':>10} {'payload (kB)':>13}"
+    )
+    for i, n_rows in enumerate(rows_counts):
+        # Each dataset gets its own seed, hence its own SIRET in the stand-in
+        dataset = create_dataset(n_rows, seed + i)
+        dataset.load(data_extract.DB_ENGINE)
+        siret = dataset.siret
+
+        def report(stage: str, group: str, measures: Dict[str, float]) -> None:
+            results.append({"rows": n_rows, "stage": stage, "group": group, **measures})
+            print(
+                f"{n_rows:>9} {stage:<42} {measures['time_min_s'] * 1000:>10.1f}"
+                f" {measures['time_median_s'] * 1000:>12.1f}"
+                f" {measures['peak_memory_bytes'] / 2**20:>10.1f}"
+                f" {measures['payload_bytes'] / 1000:>13.1f}"
+            )
+
+        measures = measure(
+            layout_factory.get_data_for_siret,
+            lambda: (1, siret, uuid.uuid4().hex),
+            repeat,
+            get_size=get_stored_size,
+        )
+        report("get_data_for_siret", "callback", measures)
+
+        output = layout_factory.get_data_for_siret(1, siret, uuid.uuid4().hex)
+        stored_pickles = {
+            store_id: pickle.dumps(data) for store_id, data in zip(STORE_IDS, output)
+        }
+        # The names of the data of failed queries, in the store following the serverside ones
+        stored_pickles["failed_data"] = pickle.dumps(output[len(STORE_IDS)])
+
+        stages = [
+            *[
+                (function.__name__, "callback", function, inputs)
+                for function, inputs in POPULATE_CALLBACKS
+            ],
+            *get_factory_stages(),
+            *get_components_stages(siret),
+        ]
+        for stage, group, function, inputs in stages:
+            measures = measure(
+                function,
+                lambda: tuple(
+                    pickle.loads(stored_pickles[store_id]) for store_id in inputs
+                ),
+                repeat,
+            )
+            report(stage, group, measures)
+
+        measures = measure(generate_fiche, lambda: (siret,), repeat)
+        report("fiche (end-to-end)", "end_to_end", measures)
+
+    return results
+
+
+def compare(results: List[Dict[str, Any]], previous_path: Path) -> None:
+    """Prints the ratio of the best times and peak memory to the ones of a previous run."""
+
+    previous = json.loads(previous_path.read_text())
+    previous_results = {(e["rows"], e["stage"]): e for e in previous["results"]}
+
+    print(f"\nCompared to {previous_path} ({previous['metadata']['git_commit']})")
+    print(f"{'rows':>9} {'stage':<42} {'time':>8} {'memory':>8}")
+    for e in results:
+        before = previous_results.get((e["rows"], e["stage"]))
+        if before is None:
+            continue
+        time_ratio = e["time_min_s"] / before["time_min_s"]
+        memory_ratio = e["peak_memory_bytes"] / max(before["peak_memory_bytes"], 1)
+        print(
+            f"{e['rows']:>9} {e['stage']:<42} {time_ratio:>7.2f}x"
+            f" {memory_ratio:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000, 1_000_000],
+        help="Numbers of 'bordereaux' of the synthetic establishments.",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Number of timed runs of each stage."
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="JSON file to save the results to.")
+    parser.add_argument(
+        "--compare", type=Path, help="JSON file of a previous run to compare to."
+    )
+    args = parser.parse_args()
+
+    # The synthetic data must never be written to the production databases
+    if not data_extract.LOCAL_DATABASE_DIRECTORY:
+        parser.error("the benchmark only runs on the local stand-in databases")
+
+    metadata = get_metadata()
+    results = run(args.rows, args.repeat, args.seed)
+
+    if args.output is not None:
+        args.output.write_text(
+            json.dumps({"metadata": metadata, "results": results}, indent=2)
+        )
+    if args.compare is not None:
+        compare(results, args.compare)
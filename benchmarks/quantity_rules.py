@@ -0,0 +1,120 @@
+"""
+Benchmark of the quantity outliers rules (see `app.data.quantity_rules`) on the combined synthetic data
+of all 'bordereau' types (see `app.data.synthetic`), from 10k to 1M rows.
+
+The former per-type `if/elif` chain, run on a copy of the data of each type, is compared to the evaluation
+of all the rules in a single pass over the combined data. Both are checked to flag the same lines.
+
+Usage (from the repository root):
+
+    python -m benchmarks.quantity_rules --rows 10000 100000 1000000
+"""
+import argparse
+import time
+from typing import Callable, Dict
+
+import pandas as pd
+
+from app.data.quantity_rules import evaluate_quantity_rules
+from app.data.synthetic import SyntheticDataset
+from app.data.utils import split_bs_data_by_type
+
+REPEAT = 5
+# Share of each 'bordereau' type in the combined data
+BS_TYPES_SHARES = {
+    "BSDD": 0.7,
+    "BSDA": 0.1,
+    "BSFF": 0.05,
+    "BSDASRI": 0.05,
+    "BSVHU": 0.1,
+}
+
+
+def get_quantity_outliers_if_chain(df: pd.DataFrame, bs_type: str) -> pd.DataFrame:
+    """Former quantity outliers rules, hard-coded for each 'bordereau' type."""
+
+    df = df.copy()
+    if bs_type in ["BSDD", "BSDA"]:
+        df_quantity_outliers = df[
+            (df["quantityReceived"] > 40) & (df["transporterTransportMode"] == "ROAD")
+        ]
+    elif bs_type == "BSDASRI":
+        df_quantity_outliers = df[
+            (df["quantityReceived"] > 20) & (df["transporterTransportMode"] == "ROAD")
+        ]
+    elif bs_type == "BSVHU":
+        df_quantity_outliers = df[(df["quantityReceived"] > 40)]
+    elif bs_type == "BSFF":
+        df_quantity_outliers = df[df["quantityReceived"] > 20]
+
+    return df_quantity_outliers
+
+
+def if_chain(dfs: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    return {
+        bs_type: get_quantity_outliers_if_chain(df, bs_type)
+        for bs_type, df in dfs.items()
+    }
+
+
+def single_pass(combined_df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    outliers = combined_df[evaluate_quantity_rules(combined_df).notna()]
+    return {
+        bs_type: df.drop(columns="bs_type")
+        for bs_type, df in outliers.groupby("bs_type", sort=False)
+    }
+
+
+def best_time(function: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(rows_counts: list) -> None:
+
+    print(f"{'rows':>9} {'if/elif (ms)':>13} {'rules (ms)':>11} {'speedup':>8}")
+    for n_rows in rows_counts:
+        dataset = SyntheticDataset(
+            {
+                bs_type: max(1, int(n_rows * share))
+                for bs_type, share in BS_TYPES_SHARES.items()
+            }
+        )
+        combined_df = pd.concat(
+            [
+                dataset.get_bs_data(bs_type).assign(bs_type=bs_type)
+                for bs_type in BS_TYPES_SHARES
+            ],
+            ignore_index=True,
+        )
+        dfs = split_bs_data_by_type(combined_df)
+
+        expected = {k: sorted(v["id"]) for k, v in if_chain(dfs).items() if len(v)}
+        result = {k: sorted(v["id"]) for k, v in single_pass(combined_df).items()}
+        if result != expected:
+            raise AssertionError("The rules do not flag the same lines")
+
+        if_chain_time = best_time(lambda: if_chain(dfs))
+        rules_time = best_time(lambda: single_pass(combined_df))
+        print(
+            f"{len(combined_df):>9} {if_chain_time * 1000:>13.1f}"
+            f" {rules_time * 1000:>11.1f} {if_chain_time / rules_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000],
+        help="Numbers of rows, all 'bordereau' types combined.",
+    )
+    args = parser.parse_args()
+
+    run(args.rows)
@@ -0,0 +1,22 @@
+"""
+Configuration read by gunicorn at startup (from the working directory), for the metrics of the workers
+(see `app.data.metrics`) : their directory is emptied when gunicorn starts, and the gauges of a worker
+are discarded when it exits.
+"""
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+
+def on_starting(server) -> None:
+    if PROMETHEUS_MULTIPROC_DIR:
+        shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+        os.makedirs(PROMETHEUS_MULTIPROC_DIR)
+
+
+def child_exit(server, worker) -> None:
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(worker.pid)
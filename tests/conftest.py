@@ -0,0 +1,44 @@
+"""
+The tests run on the local stand-in databases (see `app.data.local_engine`), filled with synthetic data
+(see `app.data.synthetic`), in a temporary directory.
+
+The data modules read their configuration at import, so it is set here, before the test modules import them.
+"""
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+TESTS_DIRECTORY = Path(tempfile.mkdtemp(prefix="fiche-inspection-tests-"))
+
+os.environ["LOCAL_DATABASE_DIRECTORY"] = str(TESTS_DIRECTORY / "local_db")
+os.environ["QUERY_CANCELLATION_DIRECTORY"] = str(TESTS_DIRECTORY / "cancellation")
+os.environ["ICPE_SNAPSHOT_PATH"] = ""
+os.environ["QUERY_CACHE_BACKEND"] = ""
+os.environ["BS_INCREMENTAL_BACKEND"] = ""
+
+# SQL and static files are read relatively to the repository root
+os.chdir(Path(__file__).parent.parent)
+
+# Number of 'bordereaux' of the synthetic establishment, by type
+SYNTHETIC_SIZES = {
+    "BSDD": 3000,
+    "BSDA": 500,
+    "BSFF": 300,
+    "BSDASRI": 500,
+    "BSVHU": 500,
+}
+
+
+@pytest.fixture(scope="session")
+def dataset():
+    """Synthetic establishment, with outliers and revision requests, loaded in the stand-in databases."""
+
+    from app.data.data_extract import DB_ENGINE
+    from app.data.synthetic import SyntheticDataset
+
+    dataset = SyntheticDataset(SYNTHETIC_SIZES, seed=1, recipient_share=0.6)
+    dataset.load(DB_ENGINE)
+
+    return dataset
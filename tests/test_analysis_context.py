@@ -0,0 +1,204 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.data.analysis_context import (
+    compute_bs_stats,
+    create_bs_analysis_data,
+    create_bs_monthly_data,
+)
+from app.data.compact_dtypes import siret_equals
+from app.data.utils import BSDataPreprocessor, split_by_bs_type
+from app.layout.components.utils import get_monthly_serie
+
+
+def get_one_year_ago() -> str:
+    return (
+        datetime.utcnow().replace(tzinfo=timezone.utc) - timedelta(days=365)
+    ).strftime("%Y-%m-01")
+
+
+def get_former_bs_stats(bs_data, bs_revised_data, siret):
+    """Statistics of a 'bordereau' type, as computed by BSStatsComponent on the data of its type."""
+
+    one_year_ago = get_one_year_ago()
+
+    emitted_mask = siret_equals(bs_data["emitterCompanySiret"], siret)
+    received_mask = siret_equals(bs_data["recipientCompanySiret"], siret)
+
+    total_incoming_weight = bs_data.loc[
+        received_mask & (bs_data["receivedAt"] >= one_year_ago), "quantityReceived"
+    ].sum()
+    total_outgoing_weight = bs_data.loc[
+        emitted_mask & (bs_data["sentAt"] >= one_year_ago), "quantityReceived"
+    ].sum()
+
+    return {
+        "emitted_bs_count": emitted_mask.sum(),
+        "archived_bs_count": len(
+            bs_data[
+                emitted_mask
+                & bs_data["status"].isin(["PROCESSED", "REFUSED", "NO_TRACEABILITY"])
+            ]
+        ),
+        "revised_bs_count": (
+            bs_revised_data["bsId"].nunique() if bs_revised_data is not None else 0
+        ),
+        "more_than_one_month_bs_count": len(
+            bs_data[
+                received_mask
+                & (
+                    (bs_data["processedAt"] - bs_data["receivedAt"])
+                    > np.timedelta64(1, "M")
+                )
+            ]
+        ),
+        "total_incoming_weight": total_incoming_weight,
+        "total_outgoing_weight": total_outgoing_weight,
+        "theorical_stock": (
+            total_incoming_weight - total_outgoing_weight
+            if total_outgoing_weight != 0
+            else 0
+        ),
+        "fraction_outgoing": (
+            int(round(total_outgoing_weight / total_incoming_weight, 2) * 100)
+            if total_incoming_weight != 0
+            else np.nan
+        ),
+    }
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["raw", "compact"])
+def bs_data_dfs(request, dataset):
+    """Data without date and quantity outliers of each 'bordereau' type, with raw or compact dtypes.
+    Some 'bordereaux' are received in the future (data entry errors)."""
+
+    future_date = pd.Timestamp.now(tz="UTC").floor("s") + pd.Timedelta(days=45)
+
+    bs_data_dfs = {}
+    for bs_type, df in dataset.get_bs_data_dfs().items():
+        preprocessor = BSDataPreprocessor(bs_type, compact_dtypes=request.param)
+        preprocessor.add_chunk(df)
+        df = preprocessor.get_results()[0]
+        df.loc[df.index[::50], "receivedAt"] = future_date
+        bs_data_dfs[bs_type] = df
+
+    return bs_data_dfs
+
+
+@pytest.fixture(scope="module")
+def bs_analysis_data(dataset, bs_data_dfs):
+    return create_bs_analysis_data(dataset.siret, bs_data_dfs)
+
+
+def test_compute_bs_stats_matches_former_per_type_stats(
+    dataset, bs_data_dfs, bs_analysis_data
+):
+
+    bs_revised_data = dataset.get_bs_revised_data()
+    bs_revised_data_dfs = split_by_bs_type(bs_revised_data, list(bs_data_dfs))
+
+    stats = compute_bs_stats(bs_analysis_data, bs_revised_data)
+
+    assert list(stats.index) == list(bs_data_dfs)
+    for bs_type, bs_data in bs_data_dfs.items():
+        expected = get_former_bs_stats(
+            bs_data, bs_revised_data_dfs.get(bs_type), dataset.siret
+        )
+        for name, value in expected.items():
+            assert stats.loc[bs_type, name] == pytest.approx(value, nan_ok=True), name
+    assert stats["revised_bs_count"].sum() > 0
+
+
+def test_compute_bs_stats_without_data():
+
+    assert len(compute_bs_stats(None)) == 0
+    assert create_bs_analysis_data("12345678900012", {"BSDD": None}) is None
+
+
+def assert_serie_equal(serie, expected):
+    pd.testing.assert_series_equal(
+        serie, expected, check_names=False, check_dtype=False, check_freq=False
+    )
+
+
+def test_monthly_series_match_former_groupbys(dataset, bs_data_dfs, bs_analysis_data):
+
+    siret = dataset.siret
+    one_year_ago = get_one_year_ago()
+    bs_monthly_data_dfs = split_by_bs_type(
+        create_bs_monthly_data(bs_analysis_data), list(bs_data_dfs)
+    )
+
+    for bs_type, bs_data in bs_data_dfs.items():
+        bs_monthly_data = bs_monthly_data_dfs[bs_type]
+        emitted = bs_data[siret_equals(bs_data["emitterCompanySiret"], siret)]
+        received = bs_data[siret_equals(bs_data["recipientCompanySiret"], siret)]
+
+        # BSCreatedAndRevisedComponent
+        assert_serie_equal(
+            get_monthly_serie(bs_monthly_data, "emitter", "createdAt"),
+            emitted.dropna(subset=["createdAt"])
+            .groupby(pd.Grouper(key="createdAt", freq="1M"))
+            .id.count(),
+        )
+        assert_serie_equal(
+            get_monthly_serie(bs_monthly_data, "recipient", "receivedAt"),
+            received.dropna(subset=["receivedAt"])
+            .groupby(pd.Grouper(key="receivedAt", freq="1M"))
+            .id.count(),
+        )
+
+        # BSRefusalsComponent
+        assert_serie_equal(
+            get_monthly_serie(
+                bs_monthly_data, "emitter", "createdAt", statuses=["REFUSED"]
+            ),
+            emitted[emitted["status"] == "REFUSED"]
+            .groupby(pd.Grouper(key="createdAt", freq="1M"))
+            .id.count(),
+        )
+
+        # StockComponent, incoming quantities received up to now
+        assert_serie_equal(
+            get_monthly_serie(
+                bs_monthly_data,
+                "recipient",
+                "receivedAt",
+                value_column="quantity",
+                min_month=pd.Timestamp(one_year_ago, tz="UTC"),
+                until_now=True,
+            ).replace(0, np.nan),
+            received[
+                (received["receivedAt"] >= one_year_ago)
+                & (received["receivedAt"] <= datetime.utcnow().isoformat(sep=" "))
+            ]
+            .groupby(pd.Grouper(key="receivedAt", freq="1M"))["quantityReceived"]
+            .sum()
+            .replace(0, np.nan),
+        )
+
+        # StockComponent, outgoing quantities
+        assert_serie_equal(
+            get_monthly_serie(
+                bs_monthly_data,
+                "emitter",
+                "sentAt",
+                value_column="quantity",
+                min_month=pd.Timestamp(one_year_ago, tz="UTC"),
+            ).replace(0, np.nan),
+            emitted[emitted["sentAt"] >= one_year_ago]
+            .groupby(pd.Grouper(key="sentAt", freq="1M"))["quantityReceived"]
+            .sum()
+            .replace(0, np.nan),
+        )
+
+
+def test_create_bs_monthly_data_without_data():
+
+    monthly_data = create_bs_monthly_data(None)
+
+    assert len(monthly_data) == 0
+    assert len(get_monthly_serie(monthly_data, "emitter", "createdAt")) == 0
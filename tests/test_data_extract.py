@@ -0,0 +1,123 @@
+import contextvars
+
+import pandas as pd
+import pytest
+
+from app.data.data_extract import get_preprocessed_bs_data, run_concurrently
+from app.data.query_registry import BS_DATA_SQL_FILES
+
+_caller_value = contextvars.ContextVar("caller_value", default=None)
+
+
+def _fail():
+    raise ValueError("failed task")
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_run_concurrently_isolates_failed_tasks(max_workers):
+
+    results = run_concurrently(
+        {"first": lambda: 1, "failed": _fail, "last": lambda: 3},
+        max_workers=max_workers,
+    )
+
+    assert list(results) == ["first", "failed", "last"]
+    assert results["first"] == 1
+    assert results["last"] == 3
+    assert isinstance(results["failed"], ValueError)
+
+
+def test_run_concurrently_runs_tasks_in_caller_context():
+
+    token = _caller_value.set("caller")
+    try:
+        results = run_concurrently(
+            {name: _caller_value.get for name in ["a", "b", "c"]}, max_workers=3
+        )
+    finally:
+        _caller_value.reset(token)
+
+    assert results == {"a": "caller", "b": "caller", "c": "caller"}
+
+
+def assert_preprocessed_bs_data_equal(result, expected, check_dtype=True):
+    """Compares two results of `get_preprocessed_bs_data` for a 'bordereau' type."""
+
+    df, date_outliers, quantity_outliers = result
+    expected_df, expected_date_outliers, expected_quantity_outliers = expected
+
+    pd.testing.assert_frame_equal(
+        df.reset_index(drop=True),
+        expected_df.reset_index(drop=True),
+        check_dtype=check_dtype,
+    )
+    assert list(date_outliers) == list(expected_date_outliers)
+    for column, outliers in date_outliers.items():
+        pd.testing.assert_frame_equal(
+            outliers.reset_index(drop=True),
+            expected_date_outliers[column].reset_index(drop=True),
+            check_dtype=check_dtype,
+        )
+    pd.testing.assert_frame_equal(
+        quantity_outliers.reset_index(drop=True),
+        expected_quantity_outliers.reset_index(drop=True),
+        check_dtype=check_dtype,
+    )
+
+
+@pytest.fixture(scope="module")
+def per_type_results(dataset):
+    return {
+        bs_type: get_preprocessed_bs_data(
+            sql_query_name, bs_type=bs_type, siret=dataset.siret
+        )[bs_type]
+        for bs_type, sql_query_name in BS_DATA_SQL_FILES.items()
+    }
+
+
+def test_preprocessed_bs_data_separates_outliers(per_type_results):
+
+    for bs_type, (df, date_outliers, quantity_outliers) in per_type_results.items():
+        assert len(df) > 0
+        assert "quantityOutlierReason" not in df.columns
+        assert quantity_outliers["quantityOutlierReason"].notna().all()
+        for outliers in date_outliers.values():
+            assert not outliers["id"].isin(df["id"]).any()
+
+    assert len(per_type_results["BSDD"][2]) > 0
+    assert len(per_type_results["BSDD"][1]) > 0
+
+
+def test_combined_extraction_matches_per_type_extraction(dataset, per_type_results):
+
+    results = get_preprocessed_bs_data("get_bs_data", siret=dataset.siret)
+
+    assert set(results) == set(per_type_results)
+    for bs_type, result in results.items():
+        # The local stand-in types the columns of the union query from their first non null value :
+        # integer flags missing from some 'bordereau' types come back as floats
+        assert_preprocessed_bs_data_equal(
+            result, per_type_results[bs_type], check_dtype=False
+        )
+
+
+@pytest.mark.parametrize(
+    "sql_query_name, bs_type",
+    [("get_bsdd_data", "BSDD"), ("get_bsvhu_data", "BSVHU"), ("get_bs_data", None)],
+)
+def test_chunked_extraction_matches_whole_extraction(dataset, sql_query_name, bs_type):
+
+    expected = get_preprocessed_bs_data(
+        sql_query_name, bs_type=bs_type, siret=dataset.siret
+    )
+    results = get_preprocessed_bs_data(
+        sql_query_name, bs_type=bs_type, chunksize=97, siret=dataset.siret
+    )
+
+    assert set(results) == set(expected)
+    for result_bs_type, result in results.items():
+        # In the combined data, integer flags missing from some 'bordereau' types are read as floats
+        # only in the chunks where they are null
+        assert_preprocessed_bs_data_equal(
+            result, expected[result_bs_type], check_dtype=bs_type is not None
+        )
@@ -0,0 +1,73 @@
+import pandas as pd
+import pytest
+
+from app.data.quantity_rules import (
+    QUANTITY_OUTLIERS_RULES,
+    evaluate_quantity_rules,
+    get_rules_columns,
+)
+from benchmarks.quantity_rules import get_quantity_outliers_if_chain
+
+
+@pytest.fixture(scope="module")
+def combined_df(dataset):
+    return pd.concat(
+        [
+            df.assign(bs_type=bs_type)
+            for bs_type, df in dataset.get_bs_data_dfs().items()
+        ],
+        ignore_index=True,
+    )
+
+
+def test_rules_flag_the_lines_of_the_former_rules(combined_df):
+
+    reasons = evaluate_quantity_rules(combined_df)
+
+    for bs_type, df in combined_df.groupby("bs_type"):
+        expected = get_quantity_outliers_if_chain(df, bs_type)
+        assert sorted(df.loc[reasons[df.index].notna(), "id"]) == sorted(expected["id"])
+    assert reasons.notna().sum() > 0
+
+
+def test_rules_give_the_same_reasons_by_type_and_combined(combined_df):
+
+    reasons = evaluate_quantity_rules(combined_df)
+
+    for bs_type, df in combined_df.groupby("bs_type"):
+        pd.testing.assert_series_equal(
+            evaluate_quantity_rules(df.drop(columns="bs_type"), bs_type),
+            reasons[df.index],
+        )
+
+
+def test_first_matching_rule_gives_the_reason():
+
+    df = pd.DataFrame(
+        {
+            "bs_type": ["BSDD", "BSDD", "BSDD", "BSFF", "BSDASRI"],
+            "quantityReceived": [50, 50, None, 25, 25],
+            "transporterTransportMode": ["ROAD", "RAIL", "ROAD", "ROAD", "ROAD"],
+        }
+    )
+    rules = [
+        *QUANTITY_OUTLIERS_RULES,
+        {
+            "reason": "ANY_QUANTITY_ABOVE_10T",
+            "label": "quantité reçue supérieure à 10 tonnes",
+            "bs_types": ["BSDD", "BSFF"],
+            "column": "quantityReceived",
+            "threshold": 10,
+        },
+    ]
+
+    reasons = evaluate_quantity_rules(df, rules=rules)
+
+    assert reasons.tolist() == [
+        "ROAD_QUANTITY_ABOVE_40T",
+        "ANY_QUANTITY_ABOVE_10T",
+        None,
+        "QUANTITY_ABOVE_20T",
+        "ROAD_QUANTITY_ABOVE_20T",
+    ]
+    assert get_rules_columns(rules) == ["quantityReceived", "transporterTransportMode"]